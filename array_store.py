@@ -0,0 +1,76 @@
+# coding=utf-8
+# Copyright 2018 The Google AI Language Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Helpers for storing named NumPy arrays as a directory of `.npy` files.
+
+Each array is written to `<directory>/<name>.npy`, so that it can be opened
+with `np.load(mmap_mode='r')`. Memory mapped arrays are backed by the page
+cache, which means that several processes reading the same directory share a
+single copy of the data.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+
+def array_path(directory, name):
+  return os.path.join(directory, name + '.npy')
+
+
+def has_arrays(directory, names):
+  """Returns true iff `directory` contains an `.npy` file for every name."""
+  return all([os.path.exists(array_path(directory, name)) for name in names])
+
+
+def save_arrays(directory, arrays):
+  """Writes a dictionary of arrays to `directory`.
+
+  The arrays are first written to a temporary sibling directory which is then
+  renamed, so that readers never observe a partially written directory.
+
+  Args:
+    directory: Output directory. Must not exist yet.
+    arrays: Dictionary mapping array names to array-like values.
+  """
+  parent = os.path.dirname(os.path.abspath(directory))
+  tmp_dir = tempfile.mkdtemp(dir=parent, prefix='.tmp-')
+  try:
+    for name, value in arrays.items():
+      np.save(array_path(tmp_dir, name), np.asarray(value))
+    os.rename(tmp_dir, directory)
+  except Exception:
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    raise
+
+
+def load_arrays(directory, names, mmap_mode='r'):
+  """Loads the arrays `names` from `directory`.
+
+  Args:
+    directory: Directory written by `save_arrays`.
+    names: Names of the arrays to load.
+    mmap_mode ('r'): Passed to `np.load`. Use None to read into memory.
+
+  Returns:
+    Dictionary mapping array names to arrays.
+  """
+  return dict([(name, np.load(array_path(directory, name), mmap_mode=mmap_mode))
+               for name in names])
@@ -0,0 +1,404 @@
+# coding=utf-8
+# Copyright 2018 The Google AI Language Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Vectorized versions of the per-example scoring functions in nq_eval.
+
+Gold and predictions are represented as aligned NumPy arrays, in which each
+span is a [start_byte, end_byte, start_token, end_token] row:
+
+  GoldArrays.long_span:   (N, A, 4)     A = max number of annotators.
+  GoldArrays.short_span:  (N, A, S, 4)  S = max number of short answers.
+  GoldArrays.yes_no:      (N, A)        `eval_utils.YES_NO_CODES`.
+
+  PredArrays.long_span:   (N, 4)
+  PredArrays.short_span:  (N, T, 4)     T = max number of short answers.
+  PredArrays.yes_no:      (N,)
+
+Missing annotators and short answers are padded with null spans, which never
+contribute to a vote or to a match. The results are identical to those of
+`nq_eval.score_long_answer` and `nq_eval.score_short_answer`.
+
+`compute_weighted_pr_curves` computes the best F1 and R@P points of many
+weightings of the same examples in one pass, for bootstrap replicates or
+slices of the data.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+
+import eval_utils as util
+import numpy as np
+
+FLAGS = util.FLAGS
+
+GoldArrays = collections.namedtuple(
+    'GoldArrays', ['example_id', 'long_span', 'short_span', 'yes_no'])
+
+PredArrays = collections.namedtuple('PredArrays', [
+    'example_id', 'long_span', 'short_span', 'yes_no', 'long_score',
+    'short_score'
+])
+
+# Per-example (has_gold, has_pred, is_correct, score) columns.
+AnswerStatArrays = collections.namedtuple(
+    'AnswerStatArrays', ['has_gold', 'has_pred', 'is_correct', 'score'])
+
+# Number of examples scored at once, to bound the size of the intermediate
+# (examples x annotators x gold short answers x predicted short answers) arrays.
+_CHUNK_SIZE = 4096
+
+
+def _span_row(span):
+  return (span.start_byte, span.end_byte, span.start_token_idx,
+          span.end_token_idx)
+
+
+def gold_arrays_from_dict(gold_annotation_dict, example_ids):
+  """Builds padded `GoldArrays` for `example_ids` from a dict of NQLabels."""
+  label_lists = [gold_annotation_dict[example_id] for example_id in example_ids]
+  num_annotators = max([len(labels) for labels in label_lists] + [0])
+  num_short = max([
+      len(label.short_answer_span_list)
+      for labels in label_lists
+      for label in labels
+  ] + [0])
+
+  n = len(label_lists)
+  long_span = np.full((n, num_annotators, 4), -1, dtype=np.int64)
+  short_span = np.full((n, num_annotators, num_short, 4), -1, dtype=np.int64)
+  yes_no = np.zeros((n, num_annotators), dtype=np.int8)
+  for i, labels in enumerate(label_lists):
+    for j, label in enumerate(labels):
+      long_span[i, j] = _span_row(label.long_answer_span)
+      yes_no[i, j] = util.YES_NO_CODES[label.yes_no_answer]
+      for k, span in enumerate(label.short_answer_span_list):
+        short_span[i, j, k] = _span_row(span)
+
+  return GoldArrays(
+      example_id=np.asarray(example_ids, dtype=np.int64),
+      long_span=long_span,
+      short_span=short_span,
+      yes_no=yes_no)
+
+
+def _gather_padded(values, starts, counts, width, fill):
+  """Returns values[starts[i] + j] for j < counts[i], padded to `width`."""
+  offsets = np.arange(width)
+  valid = offsets < counts[..., None]
+  index = np.where(valid, starts[..., None] + offsets, 0)
+  if not len(values):
+    shape = valid.shape + values.shape[1:]
+    return np.full(shape, fill, dtype=values.dtype)
+  gathered = np.asarray(values)[index]
+  if gathered.ndim > valid.ndim:
+    valid = valid.reshape(valid.shape + (1,) * (gathered.ndim - valid.ndim))
+  return np.where(valid, gathered, fill)
+
+
+def gold_arrays_from_store(store, example_ids=None):
+  """Builds padded `GoldArrays` from an `eval_utils.GoldStore`.
+
+  Args:
+    store: A `GoldStore`.
+    example_ids (None): Example ids to select, defaults to all ids in the store.
+
+  Returns:
+    `GoldArrays` aligned with `example_ids`.
+  """
+  if example_ids is None:
+    rows = np.arange(len(store))
+  else:
+    example_ids = np.asarray(example_ids, dtype=np.int64)
+    store_ids = np.asarray(store.example_id)
+    rows = np.searchsorted(store_ids, example_ids)
+    found = rows < len(store_ids)
+    found[found] = store_ids[rows[found]] == example_ids[found]
+    if not found.all():
+      raise KeyError('Example ids missing from the gold store.')
+
+  annotation_splits = np.asarray(store.annotation_splits)
+  annotation_start = annotation_splits[rows]
+  annotation_count = annotation_splits[rows + 1] - annotation_start
+  num_annotators = int(annotation_count.max()) if len(rows) else 0
+  annotation_index = _gather_padded(
+      np.arange(len(store.yes_no)), annotation_start, annotation_count,
+      num_annotators, -1)
+  annotation_valid = annotation_index >= 0
+  annotation_index = np.maximum(annotation_index, 0)
+
+  short_span_splits = np.asarray(store.short_span_splits)
+  short_start = short_span_splits[annotation_index]
+  short_count = np.where(annotation_valid,
+                         short_span_splits[annotation_index + 1] - short_start,
+                         0)
+  num_short = int(short_count.max()) if short_count.size else 0
+
+  return GoldArrays(
+      example_id=np.asarray(store.example_id)[rows],
+      long_span=_gather_padded(store.long_span, annotation_start,
+                               annotation_count, num_annotators, -1),
+      short_span=_gather_padded(store.short_span, short_start, short_count,
+                                num_short, -1),
+      yes_no=_gather_padded(store.yes_no, annotation_start, annotation_count,
+                            num_annotators, 0))
+
+
+def pred_arrays_from_dict(pred_dict, example_ids):
+  """Builds padded `PredArrays` for `example_ids` from a dict of NQLabels."""
+  preds = [pred_dict[example_id] for example_id in example_ids]
+  num_short = max([len(pred.short_answer_span_list) for pred in preds] + [0])
+
+  n = len(preds)
+  short_span = np.full((n, num_short, 4), -1, dtype=np.int64)
+  for i, pred in enumerate(preds):
+    for k, span in enumerate(pred.short_answer_span_list):
+      short_span[i, k] = _span_row(span)
+
+  return PredArrays(
+      example_id=np.asarray(example_ids, dtype=np.int64),
+      long_span=np.array([_span_row(pred.long_answer_span) for pred in preds],
+                         dtype=np.int64).reshape(-1, 4),
+      short_span=short_span,
+      yes_no=np.array(
+          [util.YES_NO_CODES[pred.yes_no_answer] for pred in preds],
+          dtype=np.int8),
+      long_score=np.asarray([pred.long_score for pred in preds]),
+      short_score=np.asarray([pred.short_score for pred in preds]))
+
+
+def is_null_span(spans):
+  """Vectorized `Span.is_null_span` over the last axis of `spans`."""
+  return np.all(spans < 0, axis=-1)
+
+
+def nonnull_span_equal(span_a, span_b):
+  """Vectorized `eval_utils.nonnull_span_equal` with broadcasting."""
+  byte_equal = ((span_a[..., 0] >= 0) & (span_a[..., 1] >= 0) &
+                (span_b[..., 0] >= 0) & (span_b[..., 1] >= 0) &
+                (span_a[..., 0] == span_b[..., 0]) &
+                (span_a[..., 1] == span_b[..., 1]))
+  token_equal = ((span_a[..., 2] >= 0) & (span_a[..., 3] >= 0) &
+                 (span_b[..., 2] >= 0) & (span_b[..., 3] >= 0) &
+                 (span_a[..., 2] == span_b[..., 2]) &
+                 (span_a[..., 3] == span_b[..., 3]))
+  return byte_equal | token_equal
+
+
+def score_long_answers(gold, pred):
+  """Vectorized `nq_eval.score_long_answer`.
+
+  Args:
+    gold: `GoldArrays`.
+    pred: `PredArrays` aligned with `gold`.
+
+  Returns:
+    `AnswerStatArrays`.
+  """
+  gold_nonnull = ~is_null_span(gold.long_span)
+  has_gold = gold_nonnull.sum(axis=1) >= FLAGS.long_non_null_threshold
+  has_pred = ~is_null_span(pred.long_span)
+  match = gold_nonnull & nonnull_span_equal(gold.long_span,
+                                            pred.long_span[:, None, :])
+  is_correct = has_gold & has_pred & match.any(axis=1)
+  return AnswerStatArrays(has_gold, has_pred, is_correct, pred.long_score)
+
+
+def _short_answer_correct(gold_short_span, pred_short_span):
+  """Returns (N, A) matrix of `span_set_equal(gold[n, a], pred[n])`."""
+  gold_nonnull = ~is_null_span(gold_short_span)  # (N, A, S)
+  pred_nonnull = ~is_null_span(pred_short_span)  # (N, T)
+  match = (
+      gold_nonnull[:, :, :, None] & pred_nonnull[:, None, None, :] &
+      nonnull_span_equal(gold_short_span[:, :, :, None, :],
+                         pred_short_span[:, None, None, :, :]))  # (N,A,S,T)
+  pred_covered = (match.any(axis=2) | ~pred_nonnull[:, None, :]).all(axis=2)
+  gold_covered = (match.any(axis=3) | ~gold_nonnull).all(axis=2)
+  return pred_covered & gold_covered
+
+
+def score_short_answers(gold, pred):
+  """Vectorized `nq_eval.score_short_answer`.
+
+  Args:
+    gold: `GoldArrays`.
+    pred: `PredArrays` aligned with `gold`.
+
+  Returns:
+    `AnswerStatArrays`.
+  """
+  gold_short_nonnull = ~is_null_span(gold.short_span)
+  gold_nonnull = gold_short_nonnull.any(axis=2) | (gold.yes_no != 0)
+  has_gold = gold_nonnull.sum(axis=1) >= FLAGS.short_non_null_threshold
+
+  pred_is_yes_no = pred.yes_no != 0
+  has_pred = (~is_null_span(pred.short_span)).any(axis=1) | pred_is_yes_no
+
+  yes_no_correct = (gold.yes_no == pred.yes_no[:, None]).any(axis=1)
+  span_correct = np.zeros(len(has_gold), dtype=bool)
+  for start in range(0, len(has_gold), _CHUNK_SIZE):
+    end = start + _CHUNK_SIZE
+    span_correct[start:end] = _short_answer_correct(
+        gold.short_span[start:end], pred.short_span[start:end]).any(axis=1)
+
+  is_correct = has_gold & has_pred & np.where(pred_is_yes_no, yes_no_correct,
+                                              span_correct)
+  return AnswerStatArrays(has_gold, has_pred, is_correct, pred.short_score)
+
+
+def to_stat_arrays(answer_stats):
+  """Converts a list of (has_gold, has_pred, is_correct, score) tuples."""
+  if isinstance(answer_stats, AnswerStatArrays):
+    columns = answer_stats
+  elif answer_stats:
+    columns = list(zip(*answer_stats))
+  else:
+    columns = [[], [], [], []]
+  has_gold, has_pred, is_correct, score = [np.asarray(c) for c in columns]
+  return AnswerStatArrays(
+      has_gold.astype(bool), has_pred.astype(bool), is_correct.astype(bool),
+      score)
+
+
+def to_answer_stats(stat_arrays):
+  """Converts `AnswerStatArrays` to the sorted tuples used by nq_eval."""
+  answer_stats = list(
+      zip(stat_arrays.has_gold.tolist(), stat_arrays.has_pred.tolist(),
+          stat_arrays.is_correct.tolist(), stat_arrays.score.tolist()))
+  answer_stats.sort(key=lambda x: x[-1], reverse=True)
+  return answer_stats
+
+
+def score_answer_arrays(gold_annotation, pred_dict):
+  """Scores all answers and returns per-example `AnswerStatArrays`.
+
+  Args:
+    gold_annotation: a dict from example id to list of NQLabels, or a
+      `GoldStore`.
+    pred_dict: a dict from example id to list of NQLabels.
+
+  Returns:
+    long_answer_stats: `AnswerStatArrays` for long answers.
+    short_answer_stats: `AnswerStatArrays` for short answers.
+    Both are aligned with the sorted example ids.
+  """
+  gold_id_set = set(gold_annotation.keys())
+  pred_id_set = set(pred_dict.keys())
+
+  if gold_id_set.symmetric_difference(pred_id_set):
+    raise ValueError('ERROR: the example ids in gold annotations and example '
+                     'ids in the prediction are not equal.')
+
+  if isinstance(gold_annotation, util.GoldStore):
+    gold = gold_arrays_from_store(gold_annotation)
+    example_ids = gold.example_id.tolist()
+  else:
+    example_ids = sorted(gold_id_set)
+    gold = gold_arrays_from_dict(gold_annotation, example_ids)
+  pred = pred_arrays_from_dict(pred_dict, example_ids)
+
+  return score_long_answers(gold, pred), score_short_answers(gold, pred)
+
+
+def score_answers(gold_annotation, pred_dict):
+  """Drop in replacement for `nq_eval.score_answers`.
+
+  Args:
+    gold_annotation: a dict from example id to list of NQLabels, or a
+      `GoldStore`.
+    pred_dict: a dict from example id to list of NQLabels.
+
+  Returns:
+    long_answer_stats: List of scores for long answers.
+    short_answer_stats: List of scores for short answers.
+  """
+  long_answer_stats, short_answer_stats = score_answer_arrays(
+      gold_annotation, pred_dict)
+  return to_answer_stats(long_answer_stats), to_answer_stats(short_answer_stats)
+
+
+def compute_weighted_pr_curves(answer_stats, weights, targets):
+  """Computes best F1 and R@P for many weightings of the examples at once.
+
+  Each row of `weights` defines a weighted dataset, in which example `i` is
+  counted `weights[b, i]` times. For 0/1 weights, the results are identical to
+  `nq_eval.compute_pr_curves` on the selected examples. The examples are
+  sorted once, and the curves of all rows are computed with cumulative sums
+  along the second axis.
+
+  Args:
+    answer_stats: List of statistic tuples, or `AnswerStatArrays`, of N
+      examples.
+    weights: (B, N) array of non-negative example weights, aligned with
+      `answer_stats`.
+    targets: List of T precision targets.
+
+  Returns:
+    best: (B, 4) array of [f1, precision, recall, threshold] at the best
+      threshold. All zeros for rows without any correct prediction.
+    r_at_p: (B, T, 3) array of [recall, precision, threshold] at each target.
+      Rows where no threshold reaches a target have zero recall and precision
+      and a NaN threshold.
+  """
+  stats = to_stat_arrays(answer_stats)
+  weights = np.asarray(weights)
+  if not np.issubdtype(weights.dtype, np.floating):
+    weights = weights.astype(np.int64)
+  num_rows = weights.shape[0]
+
+  order = np.argsort(-stats.score, kind='stable')
+  score = stats.score[order].astype(np.float64)
+  weights = weights[:, order]
+
+  # Keep the last column of each group of tied scores.
+  last = np.flatnonzero(np.append(score[1:] != score[:-1], True))[:len(score)]
+  num_correct = np.cumsum(
+      weights * stats.is_correct[order], axis=1)[:, last]
+  num_predicted = np.cumsum(weights * stats.has_pred[order], axis=1)[:, last]
+  num_gold = (weights * stats.has_gold[order]).sum(axis=1)
+  threshold = score[last]
+
+  precision = np.zeros(num_correct.shape)
+  np.divide(num_correct, num_predicted, out=precision, where=num_predicted > 0)
+  recall = np.zeros(num_correct.shape)
+  np.divide(num_correct, num_gold[:, None], out=recall,
+            where=num_gold[:, None] > 0)
+  f1 = np.zeros(num_correct.shape)
+  np.divide(2 * precision * recall, precision + recall, out=f1,
+            where=(precision + recall) > 0)
+
+  rows = np.arange(num_rows)
+  best = np.zeros((num_rows, 4))
+  r_at_p = np.zeros((num_rows, len(targets), 3))
+  r_at_p[:, :, 2] = np.nan
+  if not len(last):
+    return best, r_at_p
+
+  i = np.argmax(f1, axis=1)
+  found = f1[rows, i] > 0
+  best[found] = np.stack([f1[rows, i], precision[rows, i], recall[rows, i],
+                          threshold[i]], axis=1)[found]
+
+  for t, target in enumerate(targets):
+    # The first threshold with the maximum recall among those that reach the
+    # target precision.
+    masked_recall = np.where(precision >= target, recall, 0)
+    i = np.argmax(masked_recall, axis=1)
+    found = masked_recall[rows, i] > 0
+    r_at_p[found, t] = np.stack(
+        [recall[rows, i], precision[rows, i], threshold[i]], axis=1)[found]
+
+  return best, r_at_p
@@ -0,0 +1,115 @@
+# coding=utf-8
+# Copyright 2018 The Google AI Language Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Testing code for batch_eval."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import random
+
+import batch_eval
+import eval_utils as util
+import nq_eval as ev
+import numpy as np
+import tensorflow.compat.v1 as tf
+import test_utils
+
+
+def random_data(seed, num_examples=300):
+  """Returns random (gold_dict, pred_dict)."""
+  rng = random.Random(seed)
+  gold_dict = {}
+  pred_dict = {}
+  for example_id in range(num_examples):
+    gold_dict[example_id] = [
+        test_utils.random_label(rng, example_id)
+        for _ in range(rng.randint(1, 5))
+    ]
+    pred_dict[example_id] = test_utils.random_label(rng, example_id,
+                                                    rng.randint(0, 20))
+  return gold_dict, pred_dict
+
+
+class BatchEvalTest(tf.test.TestCase):
+  """Testing codes for batch_eval"""
+
+  def testMatchesPerExampleScoring(self):
+    """Vectorized stats equal the per-example stats."""
+    for seed in range(5):
+      gold_dict, pred_dict = random_data(seed)
+      example_ids = sorted(gold_dict.keys())
+      long_stats, short_stats = batch_eval.score_answer_arrays(
+          gold_dict, pred_dict)
+      long_stats = list(zip(*[x.tolist() for x in long_stats]))
+      short_stats = list(zip(*[x.tolist() for x in short_stats]))
+      long_stats_by_id = dict(zip(sorted(pred_dict.keys()), long_stats))
+      short_stats_by_id = dict(zip(sorted(pred_dict.keys()), short_stats))
+
+      for example_id in example_ids:
+        gold, pred = gold_dict[example_id], pred_dict[example_id]
+        self.assertEqual(
+            tuple(bool(x) for x in ev.score_long_answer(gold, pred)[:3]),
+            long_stats_by_id[example_id][:3])
+        self.assertEqual(
+            tuple(bool(x) for x in ev.score_short_answer(gold, pred)[:3]),
+            short_stats_by_id[example_id][:3])
+
+  def testScoreAnswers(self):
+    """Drop in replacement gives the same metrics, also from a GoldStore."""
+    gold_dict, pred_dict = random_data(7)
+    expected = ev.get_metrics_with_answer_stats(
+        *ev.score_answers(gold_dict, pred_dict))
+    self.assertEqual(
+        ev.get_metrics_with_answer_stats(
+            *batch_eval.score_answers(gold_dict, pred_dict)), expected)
+
+    store = util.GoldStore.from_annotation_dict(gold_dict)
+    self.assertEqual(
+        ev.get_metrics_with_answer_stats(
+            *batch_eval.score_answers(store, pred_dict)), expected)
+
+  def testWeightedPrCurves(self):
+    """0/1 weights give the same results as compute_pr_curves on subsets."""
+    rng = random.Random(3)
+    answer_stats = []
+    for _ in range(500):
+      has_gold = rng.random() < 0.6
+      has_pred = rng.random() < 0.8
+      answer_stats.append((has_gold, has_pred,
+                           has_gold and has_pred and rng.random() < 0.5,
+                           rng.randint(0, 50)))
+    targets = [0.25, 0.5, 0.75, 0.9]
+    masks = np.array([[rng.random() < p for _ in answer_stats]
+                      for p in [0.0, 0.1, 0.5, 1.0]])
+    best, r_at_p = batch_eval.compute_weighted_pr_curves(
+        answer_stats, masks, targets)
+
+    for b, mask in enumerate(masks):
+      subset = [stats for stats, m in zip(answer_stats, mask) if m]
+      subset.sort(key=lambda x: x[-1], reverse=True)
+      expected_best, expected_table = ev.compute_pr_curves(subset, targets)
+      self.assertEqual(tuple(best[b].tolist()), expected_best)
+      for t, (_, recall, precision, threshold) in enumerate(expected_table):
+        self.assertEqual(r_at_p[b, t, 0], recall)
+        self.assertEqual(r_at_p[b, t, 1], precision)
+        if threshold is None:
+          self.assertTrue(np.isnan(r_at_p[b, t, 2]))
+        else:
+          self.assertEqual(r_at_p[b, t, 2], threshold)
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -0,0 +1,188 @@
+# coding=utf-8
+# Copyright 2018 The Google AI Language Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Bootstrap confidence intervals and paired significance tests.
+
+A bootstrap replicate resamples the N evaluation examples with replacement,
+which is the same as counting example `i` `w[i]` times, where `w` is drawn
+from a multinomial distribution. Replicates are computed in batches: the
+(batch, N) count matrix is passed to `batch_eval.compute_weighted_pr_curves`,
+which computes the best threshold F1 and R@P of every replicate at once.
+
+Batches are seeded from `np.random.SeedSequence(seed)`, so the results only
+depend on the seed, and not on the batch size or the number of workers.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from collections import OrderedDict
+import multiprocessing
+
+import batch_eval
+import numpy as np
+
+# Precision targets for the R@P metrics, as reported by nq_eval.
+DEFAULT_TARGETS = (0.5, 0.75, 0.9)
+
+
+def metric_names(targets=DEFAULT_TARGETS):
+  """Returns the names of the bootstrapped metrics, as used by nq_eval."""
+  names = [
+      'best-threshold-f1', 'best-threshold-precision', 'best-threshold-recall'
+  ]
+  for target in targets:
+    names.append('recall-at-precision>={:.2}'.format(target))
+  return names
+
+
+def _metric_matrix(answer_stats, weights, targets):
+  """Returns a (B, num_metrics) matrix of the metrics of each weighting."""
+  best, r_at_p = batch_eval.compute_weighted_pr_curves(
+      answer_stats, weights, targets)
+  return np.concatenate([best[:, :3], r_at_p[:, :, 0]], axis=1)
+
+
+def bootstrap_weights(rng, num_examples, num_samples):
+  """Returns a (num_samples, num_examples) matrix of resampling counts."""
+  index = rng.integers(0, num_examples, size=(num_samples, num_examples))
+  index += np.arange(num_samples)[:, None] * num_examples
+  return np.bincount(
+      index.ravel(), minlength=num_samples * num_examples).reshape(
+          num_samples, num_examples)
+
+
+def _bootstrap_batch(args):
+  """Returns the metric matrices of one batch of replicates for each system."""
+  seed_sequence, batch_size, systems, targets = args
+  num_examples = len(systems[0].has_gold)
+  weights = bootstrap_weights(
+      np.random.default_rng(seed_sequence), num_examples, batch_size)
+  return [_metric_matrix(stats, weights, targets) for stats in systems]
+
+
+def bootstrap_replicates(systems,
+                         num_samples=1000,
+                         seed=0,
+                         targets=DEFAULT_TARGETS,
+                         batch_size=100,
+                         num_workers=1):
+  """Computes the metrics of bootstrap replicates of one or more systems.
+
+  Args:
+    systems: List of answer stats, as lists of tuples or
+      `batch_eval.AnswerStatArrays`. All systems are resampled with the same
+      replicates, so they must be aligned by example.
+    num_samples (1000): Number of bootstrap replicates.
+    seed (0): Random seed.
+    targets: Precision targets for the R@P metrics.
+    batch_size (100): Number of replicates computed at once. Memory use is
+      proportional to batch_size times the number of examples.
+    num_workers (1): Number of processes computing batches.
+
+  Returns:
+    List with a (num_samples, num_metrics) array for each system. The columns
+    are named by `metric_names(targets)`.
+  """
+  systems = [batch_eval.to_stat_arrays(stats) for stats in systems]
+  if len(set([len(stats.has_gold) for stats in systems])) != 1:
+    raise ValueError('All systems must be scored on the same examples.')
+
+  batch_sizes = [batch_size] * (num_samples // batch_size)
+  if num_samples % batch_size:
+    batch_sizes.append(num_samples % batch_size)
+  seed_sequences = np.random.SeedSequence(seed).spawn(len(batch_sizes))
+  tasks = [(seed_sequence, size, systems, list(targets))
+           for seed_sequence, size in zip(seed_sequences, batch_sizes)]
+
+  if num_workers > 1:
+    pool = multiprocessing.Pool(num_workers)
+    try:
+      batches = pool.map(_bootstrap_batch, tasks)
+    finally:
+      pool.close()
+      pool.join()
+  else:
+    batches = [_bootstrap_batch(task) for task in tasks]
+
+  return [
+      np.concatenate([batch[i] for batch in batches], axis=0)
+      for i in range(len(systems))
+  ]
+
+
+def confidence_intervals(answer_stats, confidence=0.95, **kwargs):
+  """Computes percentile bootstrap confidence intervals.
+
+  Args:
+    answer_stats: Answer stats of one system.
+    confidence (0.95): Coverage of the intervals.
+    **kwargs: Passed to `bootstrap_replicates`.
+
+  Returns:
+    OrderedDict mapping metric name to (low, high).
+  """
+  targets = kwargs.get('targets', DEFAULT_TARGETS)
+  replicates = bootstrap_replicates([answer_stats], **kwargs)[0]
+  alpha = (1 - confidence) / 2
+  low, high = np.quantile(replicates, [alpha, 1 - alpha], axis=0)
+  return OrderedDict([
+      (name, (low[i].item(), high[i].item()))
+      for i, name in enumerate(metric_names(targets))
+  ])
+
+
+def paired_bootstrap_test(answer_stats, baseline_answer_stats,
+                          confidence=0.95, **kwargs):
+  """Tests whether a system improves on a baseline on the same examples.
+
+  Both systems are resampled with the same replicates. The p-value is the
+  fraction of replicates in which the system does not beat the baseline.
+
+  Args:
+    answer_stats: Answer stats of the system, aligned by example with
+      `baseline_answer_stats`, e.g. from `batch_eval.score_answer_arrays`.
+    baseline_answer_stats: Answer stats of the baseline.
+    confidence (0.95): Coverage of the confidence interval of the difference.
+    **kwargs: Passed to `bootstrap_replicates`.
+
+  Returns:
+    OrderedDict mapping metric name to an OrderedDict with the observed
+    difference `delta`, its confidence interval `delta-ci-low` and
+    `delta-ci-high`, and the one-sided `p-value`.
+  """
+  targets = kwargs.get('targets', DEFAULT_TARGETS)
+  system, baseline = bootstrap_replicates(
+      [answer_stats, baseline_answer_stats], **kwargs)
+  observed = [
+      _metric_matrix(stats, np.ones((1, len(stats.has_gold)), np.int64),
+                     list(targets))[0]
+      for stats in [batch_eval.to_stat_arrays(answer_stats),
+                    batch_eval.to_stat_arrays(baseline_answer_stats)]
+  ]
+  deltas = system - baseline
+  alpha = (1 - confidence) / 2
+  low, high = np.quantile(deltas, [alpha, 1 - alpha], axis=0)
+  p_values = (deltas <= 0).mean(axis=0)
+
+  results = OrderedDict()
+  for i, name in enumerate(metric_names(targets)):
+    results[name] = OrderedDict([
+        ('delta', (observed[0][i] - observed[1][i]).item()),
+        ('delta-ci-low', low[i].item()),
+        ('delta-ci-high', high[i].item()),
+        ('p-value', p_values[i].item()),
+    ])
+  return results
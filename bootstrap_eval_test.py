@@ -0,0 +1,77 @@
+# coding=utf-8
+# Copyright 2018 The Google AI Language Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Testing code for bootstrap_eval."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import random
+
+import bootstrap_eval
+import numpy as np
+import tensorflow.compat.v1 as tf
+
+
+def random_answer_stats(seed, num_examples=200):
+  rng = random.Random(seed)
+  answer_stats = []
+  for _ in range(num_examples):
+    has_gold = rng.random() < 0.6
+    has_pred = rng.random() < 0.8
+    answer_stats.append((has_gold, has_pred,
+                         has_gold and has_pred and rng.random() < 0.5,
+                         rng.random()))
+  return answer_stats
+
+
+class BootstrapEvalTest(tf.test.TestCase):
+  """Testing codes for bootstrap_eval"""
+
+  def testWeights(self):
+    """Each replicate resamples every example."""
+    weights = bootstrap_eval.bootstrap_weights(
+        np.random.default_rng(0), 50, 7)
+    self.assertEqual(weights.shape, (7, 50))
+    self.assertTrue((weights.sum(axis=1) == 50).all())
+
+  def testReproducible(self):
+    """Replicates only depend on the seed, not on the batch size."""
+    answer_stats = random_answer_stats(0)
+    a = bootstrap_eval.bootstrap_replicates(
+        [answer_stats], num_samples=60, seed=3, batch_size=20)[0]
+    b = bootstrap_eval.bootstrap_replicates(
+        [answer_stats], num_samples=60, seed=3, batch_size=20,
+        num_workers=2)[0]
+    self.assertAllEqual(a, b)
+
+    intervals = bootstrap_eval.confidence_intervals(
+        answer_stats, num_samples=200, seed=1)
+    self.assertEqual(list(intervals.keys()), bootstrap_eval.metric_names())
+    for low, high in intervals.values():
+      self.assertLessEqual(low, high)
+
+  def testPairedTest(self):
+    """A system never beats itself."""
+    answer_stats = random_answer_stats(1)
+    results = bootstrap_eval.paired_bootstrap_test(
+        answer_stats, answer_stats, num_samples=100)
+    for result in results.values():
+      self.assertEqual(result['delta'], 0.0)
+      self.assertEqual(result['p-value'], 1.0)
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -0,0 +1,31 @@
+# coding=utf-8
+# Copyright 2018 The Google AI Language Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Runs the tests under pytest with the default flag values.
+
+`tf.test.main` parses the flags when a test file is run directly, pytest does
+not, so the flags that the tested functions read would raise
+`UnparsedFlagAccessError`.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from absl import flags
+
+
+def pytest_configure(config):
+  del config  # Unused.
+  flags.FLAGS.mark_as_parsed()
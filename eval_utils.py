@@ -19,12 +19,23 @@ from __future__ import division
 from __future__ import print_function
 
 import collections
+from concurrent import futures
+import functools
 import glob
+import gzip
 from gzip import GzipFile
 import json
 import multiprocessing
+import os
+import re
+import threading
+import time
 from absl import flags
 from absl import logging
+import array_store
+import json_utils
+import numpy as np
+import profiling
 
 flags.DEFINE_integer(
     'long_non_null_threshold', 2,
@@ -56,6 +67,10 @@ NQLabel = collections.namedtuple(
         'short_score'  # The prediction score for the short answer prediction.
     ])
 
+# Integer codes used for `yes_no_answer` in array representations.
+YES_NO_ANSWERS = ('none', 'yes', 'no')
+YES_NO_CODES = dict([(a, i) for i, a in enumerate(YES_NO_ANSWERS)])
+
 
 class Span(object):
   """A class for handling token and byte spans.
@@ -72,8 +87,13 @@ class Span(object):
     If your systems only care about token spans rather than byte spans, set all
     byte spans to -1.
 
+    Spans are created for every annotation of every gold example, so they have
+    no per-instance `__dict__`.
+
   """
 
+  __slots__ = ('start_byte', 'end_byte', 'start_token_idx', 'end_token_idx')
+
   def __init__(self, start_byte, end_byte, start_token_idx, end_token_idx):
 
     if ((start_byte < 0 and end_byte >= 0) or
@@ -96,13 +116,21 @@ class Span(object):
     self.start_token_idx = start_token_idx
     self.end_token_idx = end_token_idx
 
+  @classmethod
+  def from_trusted_offsets(cls, start_byte, end_byte, start_token_idx,
+                           end_token_idx):
+    """Creates a span without validating it, e.g. from a `GoldStore`."""
+    span = object.__new__(cls)
+    span.start_byte = start_byte
+    span.end_byte = end_byte
+    span.start_token_idx = start_token_idx
+    span.end_token_idx = end_token_idx
+    return span
+
   def is_null_span(self):
     """A span is a null span if the start and end are both -1."""
-
-    if (self.start_byte < 0 and self.end_byte < 0 and
-        self.start_token_idx < 0 and self.end_token_idx < 0):
-      return True
-    return False
+    return (self.start_byte < 0 and self.end_byte < 0 and
+            self.start_token_idx < 0 and self.end_token_idx < 0)
 
   def __str__(self):
     byte_str = 'byte: [' + str(self.start_byte) + ',' + str(self.end_byte) + ')'
@@ -115,6 +143,54 @@ class Span(object):
     return self.__str__()
 
 
+class _ImmutableSpan(Span):
+  """A `Span` whose offsets cannot be modified, see `NULL_SPAN`."""
+
+  __slots__ = ()
+
+  def __setattr__(self, name, value):
+    # Offsets can only be set once, by `Span.__init__`.
+    if hasattr(self, name):
+      raise AttributeError('Shared span %s cannot be modified.' % self)
+    object.__setattr__(self, name, value)
+
+  def __delattr__(self, name):
+    raise AttributeError('Shared span %s cannot be modified.' % self)
+
+  def __reduce__(self):
+    # Unpickles to the shared instance.
+    return 'NULL_SPAN'
+
+
+# Shared by all null spans created by this module, so it is immutable.
+NULL_SPAN = _ImmutableSpan(-1, -1, -1, -1)
+
+
+def span_from_record(record):
+  """Returns the Span of a json record, or NULL_SPAN if it is null.
+
+  Args:
+    record: Dictionary with `start_byte`, `end_byte`, `start_token` and
+      `end_token` keys, as in the NQ data and predictions.
+
+  Returns:
+    A validated Span.
+  """
+  span = Span(record['start_byte'], record['end_byte'], record['start_token'],
+              record['end_token'])
+  if span.is_null_span():
+    return NULL_SPAN
+  return span
+
+
+def _trusted_span(offsets):
+  """Returns the Span of validated [start_byte, ..., end_token_idx] offsets."""
+  # Valid spans have both or neither of their byte (token) offsets set.
+  if offsets[0] < 0 and offsets[2] < 0:
+    return NULL_SPAN
+  return Span.from_trusted_offsets(*offsets)
+
+
 def is_null_span_list(span_list):
   """Returns true iff all spans in span_list are null or span_list is empty."""
   if not span_list or all([span.is_null_span() for span in span_list]):
@@ -200,87 +276,333 @@ def gold_has_long_answer(gold_label_list):
   return gold_has_answer
 
 
+def _prediction_to_label(single_prediction):
+  """Converts one prediction record into a validated NQLabel."""
+  if 'long_answer' in single_prediction:
+    long_span = span_from_record(single_prediction['long_answer'])
+  else:
+    long_span = NULL_SPAN  # Span is null if not presented.
+
+  short_span_list = []
+  if 'short_answers' in single_prediction:
+    for short_item in single_prediction['short_answers']:
+      short_span_list.append(span_from_record(short_item))
+
+  yes_no_answer = 'none'
+  if 'yes_no_answer' in single_prediction:
+    yes_no_answer = single_prediction['yes_no_answer'].lower()
+    if yes_no_answer not in ['yes', 'no', 'none']:
+      raise ValueError('Invalid yes_no_answer value in prediction')
+
+    if yes_no_answer != 'none' and not is_null_span_list(short_span_list):
+      raise ValueError('yes/no prediction and short answers cannot coexist.')
+
+  return NQLabel(
+      example_id=single_prediction['example_id'],
+      long_answer_span=long_span,
+      short_answer_span_list=short_span_list,
+      yes_no_answer=yes_no_answer,
+      long_score=single_prediction['long_answer_score'],
+      short_score=single_prediction['short_answers_score'])
+
+
+class _JsonStream(object):
+  """Decodes a JSON document incrementally from a text file object.
+
+    Only a window of the file is kept in memory. Values are decoded with
+    `json.JSONDecoder.raw_decode`; when a value runs past the end of the
+    window, more of the file is read and the value is decoded again.
+
+  """
+
+  _WHITESPACE = re.compile(r'[ \t\n\r]*')
+  # Characters that may continue a number, e.g. `12.` or `1e` cut off by the
+  # end of the window.
+  _NUMBER_TAIL = re.compile(r'[0-9.eE+-]*')
+
+  def __init__(self, fileobj, read_size=1 << 16):
+    self._fileobj = fileobj
+    self._read_size = read_size
+    self._decoder = json.JSONDecoder()
+    self._buffer = ''
+    self._pos = 0
+    self._eof = False
+
+  def _fill(self):
+    """Reads more data, at least doubling the unconsumed part of the window."""
+    chunk = self._fileobj.read(
+        max(self._read_size, len(self._buffer) - self._pos))
+    self._buffer = self._buffer[self._pos:] + chunk
+    self._pos = 0
+    self._eof = not chunk
+
+  def _skip_whitespace(self):
+    while True:
+      self._pos = self._WHITESPACE.match(self._buffer, self._pos).end()
+      if self._pos < len(self._buffer) or self._eof:
+        return
+      self._fill()
+
+  def next_char(self):
+    """Consumes and returns the next non-whitespace character, or ''."""
+    self._skip_whitespace()
+    if self._pos >= len(self._buffer):
+      return ''
+    self._pos += 1
+    return self._buffer[self._pos - 1]
+
+  def peek_char(self):
+    """Returns the next non-whitespace character without consuming it."""
+    self._skip_whitespace()
+    return self._buffer[self._pos:self._pos + 1]
+
+  def expect(self, char):
+    found = self.next_char()
+    if found != char:
+      raise ValueError('Invalid prediction JSON: expected %r, found %r.' %
+                       (char, found))
+
+  def decode(self):
+    """Consumes and returns the next JSON value."""
+    self._skip_whitespace()
+    while True:
+      try:
+        value, end = self._decoder.raw_decode(self._buffer, self._pos)
+        # A number at the end of the window might continue in the next read,
+        # and `raw_decode` stops at the first character it cannot take, e.g.
+        # the `.` of `12.`. The value is complete once a character that
+        # cannot continue a number follows it in the window.
+        tail_end = self._NUMBER_TAIL.match(self._buffer, end).end()
+        if tail_end < len(self._buffer) or self._eof:
+          self._pos = end
+          return value
+      except ValueError:
+        if self._eof:
+          raise
+      self._fill()
+
+
+def iter_prediction_json(fileobj, read_size=1 << 16):
+  """Yields NQLabels from a prediction JSON file one prediction at a time.
+
+  Elements of the `predictions` array are decoded and validated one by one, so
+  memory use does not depend on the size of the file.
+
+  Args:
+    fileobj: Text file object containing the prediction JSON.
+    read_size: Number of characters to read at a time.
+
+  Yields:
+    NQLabels.
+  """
+  stream = _JsonStream(fileobj, read_size=read_size)
+  stream.expect('{')
+  has_predictions = False
+  if stream.peek_char() != '}':
+    while True:
+      key = stream.decode()
+      stream.expect(':')
+      if key == 'predictions':
+        has_predictions = True
+        stream.expect('[')
+        if stream.peek_char() == ']':
+          stream.next_char()
+        else:
+          while True:
+            yield _prediction_to_label(stream.decode())
+            separator = stream.next_char()
+            if separator == ']':
+              break
+            if separator != ',':
+              raise ValueError('Invalid prediction JSON: expected "," or "]".')
+      else:
+        stream.decode()
+
+      separator = stream.next_char()
+      if separator == '}':
+        break
+      if separator != ',':
+        raise ValueError('Invalid prediction JSON: expected "," or "}".')
+  else:
+    stream.next_char()
+
+  if not has_predictions:
+    raise KeyError('predictions')
+
+
+def iter_prediction_jsonl(fileobj):
+  """Yields NQLabels from a file with one prediction JSON object per line."""
+  for line in fileobj:
+    if line.strip():
+      yield _prediction_to_label(json_utils.loads(line))
+
+
+def _is_jsonl(path):
+  return path.endswith('.jsonl') or path.endswith('.jsonl.gz')
+
+
+def iter_predictions(predictions_path):
+  """Yields NQLabels from prediction files.
+
+  Args:
+    predictions_path: Path to a prediction JSON file, or to a JSON-lines file
+      with one prediction per line (ending in `.jsonl` or `.jsonl.gz`). May be
+      a glob pattern matching several shards, e.g. "/path/to/preds-*.jsonl".
+
+  Yields:
+    NQLabels.
+  """
+  if os.path.exists(predictions_path):
+    paths = [predictions_path]
+  else:
+    paths = sorted(glob.glob(predictions_path))
+    if not paths:
+      raise IOError('No prediction files match: %s' % predictions_path)
+
+  for path in paths:
+    logging.info('Reading predictions from file: %s', format(path))
+    if path.endswith('.gz'):
+      f = gzip.open(path, 'rt', encoding='utf-8')
+    else:
+      f = open(path, 'r')
+    with f:
+      if _is_jsonl(path):
+        for label in iter_prediction_jsonl(f):
+          yield label
+      else:
+        for label in iter_prediction_json(f):
+          yield label
+
+
 def read_prediction_json(predictions_path):
   """Read the prediction json with scores.
 
   Args:
-    predictions_path: the path for the prediction json.
+    predictions_path: the path for the prediction json, see `iter_predictions`.
 
   Returns:
     A dictionary with key = example_id, value = NQInstancePrediction.
 
   """
-  logging.info('Reading predictions from file: %s', format(predictions_path))
-  with open(predictions_path, 'r') as f:
-    predictions = json.loads(f.read())
-
   nq_pred_dict = {}
-  for single_prediction in predictions['predictions']:
+  for pred_item in iter_predictions(predictions_path):
+    nq_pred_dict[pred_item.example_id] = pred_item
+
+  return nq_pred_dict
+
 
-    if 'long_answer' in single_prediction:
-      long_span = Span(single_prediction['long_answer']['start_byte'],
-                       single_prediction['long_answer']['end_byte'],
-                       single_prediction['long_answer']['start_token'],
-                       single_prediction['long_answer']['end_token'])
+# Fields of the NQ examples needed for evaluation.
+_GOLD_FIELDS = ('example_id', 'annotations')
+
+# Quotes inside JSON strings are escaped, so these patterns can only match
+# object keys, never the contents of `document_html` or of a token.
+_ANNOTATIONS_KEY = b'"annotations":'
+_EXAMPLE_ID_KEY = b'"example_id":'
+_ANNOTATIONS_RE = re.compile(br'"annotations":\s*\[')
+_EXAMPLE_ID_RE = re.compile(br'"example_id":\s*(-?\d+)\s*[,}]')
+_ARRAY_TOKEN_RE = re.compile(br'[\[\]"]')
+
+
+def _find_array_end(line, start):
+  """Returns the end of the JSON array starting at `line[start]`, or -1."""
+  depth = 0
+  pos = start
+  while True:
+    match = _ARRAY_TOKEN_RE.search(line, pos)
+    if match is None:
+      return -1
+    token = match.group()
+    pos = match.end()
+    if token == b'"':
+      # Skip to the closing quote, which is not preceded by an odd number of
+      # backslashes.
+      while True:
+        pos = line.find(b'"', pos)
+        if pos < 0:
+          return -1
+        escapes = 0
+        while line[pos - escapes - 1:pos - escapes] == b'\\':
+          escapes += 1
+        pos += 1
+        if escapes % 2 == 0:
+          break
+    elif token == b'[':
+      depth += 1
     else:
-      long_span = Span(-1, -1, -1, -1)  # Span is null if not presented.
-
-    short_span_list = []
-    if 'short_answers' in single_prediction:
-      for short_item in single_prediction['short_answers']:
-        short_span_list.append(
-            Span(short_item['start_byte'], short_item['end_byte'],
-                 short_item['start_token'], short_item['end_token']))
-
-    yes_no_answer = 'none'
-    if 'yes_no_answer' in single_prediction:
-      yes_no_answer = single_prediction['yes_no_answer'].lower()
-      if yes_no_answer not in ['yes', 'no', 'none']:
-        raise ValueError('Invalid yes_no_answer value in prediction')
-
-      if yes_no_answer != 'none' and not is_null_span_list(short_span_list):
-        raise ValueError('yes/no prediction and short answers cannot coexist.')
-
-    pred_item = NQLabel(
-        example_id=single_prediction['example_id'],
-        long_answer_span=long_span,
-        short_answer_span_list=short_span_list,
-        yes_no_answer=yes_no_answer,
-        long_score=single_prediction['long_answer_score'],
-        short_score=single_prediction['short_answers_score'])
-
-    nq_pred_dict[single_prediction['example_id']] = pred_item
+      depth -= 1
+      if depth == 0:
+        return pos
 
-  return nq_pred_dict
 
+def scan_gold_fields(line):
+  """Decodes only the `example_id` and `annotations` of a serialized example.
+
+  The keys are located in the raw bytes, and only the annotations array is
+  decoded, so that `document_html` and `document_tokens`, which make up
+  most of every line, are never parsed.
+
+  Args:
+    line: A serialized NQ example, as bytes.
+
+  Returns:
+    Dictionary with the `example_id` and `annotations` of the example, or None
+    if the line does not have the expected layout, e.g. if a key occurs more
+    than once. Such lines must be fully decoded instead.
+  """
+  if (line.count(_ANNOTATIONS_KEY) != 1 or
+      line.count(_EXAMPLE_ID_KEY) != 1):
+    return None
+  example_id_match = _EXAMPLE_ID_RE.match(line, line.find(_EXAMPLE_ID_KEY))
+  annotations_match = _ANNOTATIONS_RE.match(line,
+                                            line.find(_ANNOTATIONS_KEY))
+  if example_id_match is None or annotations_match is None:
+    return None
+  start = annotations_match.end() - 1
+  end = _find_array_end(line, start)
+  if end < 0:
+    return None
+  try:
+    annotations = json_utils.loads(line[start:end])
+  except ValueError:
+    return None
+  return {
+      'example_id': int(example_id_match.group(1)),
+      'annotations': annotations
+  }
 
-def read_annotation_from_one_split(gzipped_input_file):
-  """Read annotation from one split of file."""
+
+def read_annotation_from_one_split(gzipped_input_file, scan=True):
+  """Read annotation from one split of file.
+
+  Args:
+    gzipped_input_file: Path or binary file object of a gzipped jsonl file.
+    scan (True): Whether to decode the annotations with `scan_gold_fields`,
+      falling back to decoding the whole example when it does not apply.
+
+  Returns:
+    Dictionary mapping example id to a list of gold NQLabels.
+  """
   if isinstance(gzipped_input_file, str):
-    gzipped_input_file = open(gzipped_input_file, 'rb')
+    with open(gzipped_input_file, 'rb') as f:
+      return read_annotation_from_one_split(f, scan)
   logging.info('parsing %s ..... ', gzipped_input_file.name)
   annotation_dict = {}
   with GzipFile(fileobj=gzipped_input_file) as input_file:
     for line in input_file:
-      json_example = json.loads(line)
+      json_example = scan_gold_fields(line) if scan else None
+      if json_example is None:
+        json_example = json_utils.loads_fields(line, _GOLD_FIELDS)
       example_id = json_example['example_id']
 
       # There are multiple annotations for one nq example.
       annotation_list = []
 
       for annotation in json_example['annotations']:
-        long_span_rec = annotation['long_answer']
-        long_span = Span(long_span_rec['start_byte'], long_span_rec['end_byte'],
-                         long_span_rec['start_token'],
-                         long_span_rec['end_token'])
+        long_span = span_from_record(annotation['long_answer'])
 
         short_span_list = []
         for short_span_rec in annotation['short_answers']:
-          short_span = Span(short_span_rec['start_byte'],
-                            short_span_rec['end_byte'],
-                            short_span_rec['start_token'],
-                            short_span_rec['end_token'])
-          short_span_list.append(short_span)
+          short_span_list.append(span_from_record(short_span_rec))
 
         gold_label = NQLabel(
             example_id=example_id,
@@ -296,18 +618,440 @@ def read_annotation_from_one_split(gzipped_input_file):
   return annotation_dict
 
 
-def read_annotation(path_name, n_threads=10):
-  """Read annotations with real multiple processes."""
-  input_paths = glob.glob(path_name)
-  pool = multiprocessing.Pool(n_threads)
-  try:
-    dict_list = pool.map(read_annotation_from_one_split, input_paths)
-  finally:
-    pool.close()
-    pool.join()
+def read_annotation(path_name, n_threads=10, profiler=None):
+  """Read annotations with real multiple processes, see `read_gold_store`."""
+  profiler = profiling.ensure(profiler)
+  gold_store = read_gold_store(path_name, n_threads=n_threads,
+                               profiler=profiler)
+  with profiler.stage('to_annotation_dict', examples=len(gold_store)):
+    return gold_store.to_annotation_dict()
+
+
+# Names of the arrays that make up a `GoldStore`.
+GOLD_STORE_ARRAYS = ('example_id', 'annotation_splits', 'long_span', 'yes_no',
+                     'short_span_splits', 'short_span')
+
+
+class GoldStore(object):
+  """Columnar representation of the gold annotations.
+
+    The annotations for example `example_id[i]` are the rows
+    `annotation_splits[i]:annotation_splits[i + 1]` of the per-annotation
+    arrays `long_span` and `yes_no`. The short answers of annotation `j` are
+    the rows `short_span_splits[j]:short_span_splits[j + 1]` of `short_span`.
+    Spans are stored as [start_byte, end_byte, start_token, end_token] rows and
+    `yes_no` holds the `YES_NO_CODES` of the annotations. Example ids are
+    sorted, so that they can be looked up with a binary search.
+
+    A `GoldStore` can be used in place of the dictionary returned by
+    `read_annotation`: NQLabels are constructed when an example is accessed.
+
+  """
 
-  final_dict = {}
-  for single_dict in dict_list:
-    final_dict.update(single_dict)
+  def __init__(self, example_id, annotation_splits, long_span, yes_no,
+               short_span_splits, short_span):
+    self.example_id = example_id
+    self.annotation_splits = annotation_splits
+    self.long_span = long_span
+    self.yes_no = yes_no
+    self.short_span_splits = short_span_splits
+    self.short_span = short_span
+
+  @classmethod
+  def from_annotation_dict(cls, annotation_dict):
+    """Builds a `GoldStore` from a dictionary returned by `read_annotation`."""
+    example_ids = sorted(annotation_dict.keys())
+    annotation_splits = [0]
+    long_spans = []
+    yes_no = []
+    short_span_splits = [0]
+    short_spans = []
+    for example_id in example_ids:
+      for label in annotation_dict[example_id]:
+        span = label.long_answer_span
+        long_spans.append((span.start_byte, span.end_byte,
+                           span.start_token_idx, span.end_token_idx))
+        yes_no.append(YES_NO_CODES[label.yes_no_answer])
+        for span in label.short_answer_span_list:
+          short_spans.append((span.start_byte, span.end_byte,
+                              span.start_token_idx, span.end_token_idx))
+        short_span_splits.append(len(short_spans))
+      annotation_splits.append(len(long_spans))
+
+    return cls(
+        example_id=np.array(example_ids, dtype=np.int64),
+        annotation_splits=np.array(annotation_splits, dtype=np.int64),
+        long_span=np.array(long_spans, dtype=np.int32).reshape(-1, 4),
+        yes_no=np.array(yes_no, dtype=np.int8),
+        short_span_splits=np.array(short_span_splits, dtype=np.int64),
+        short_span=np.array(short_spans, dtype=np.int32).reshape(-1, 4))
+
+  def save(self, directory):
+    """Writes the store to `directory`, see `load_gold_store`."""
+    array_store.save_arrays(
+        directory, dict([(name, getattr(self, name))
+                         for name in GOLD_STORE_ARRAYS]))
+
+  def __len__(self):
+    return len(self.example_id)
+
+  def index(self, example_id):
+    """Returns the row of `example_id`, or -1 if it is not in the store."""
+    i = int(np.searchsorted(self.example_id, example_id))
+    if i < len(self.example_id) and self.example_id[i] == example_id:
+      return i
+    return -1
+
+  def __contains__(self, example_id):
+    return self.index(example_id) >= 0
+
+  def keys(self):
+    return self.example_id.tolist()
+
+  def __iter__(self):
+    return iter(self.keys())
+
+  def get_labels(self, i):
+    """Returns the list of NQLabels for the example in row `i`."""
+    example_id = int(self.example_id[i])
+    start, end = self.annotation_splits[i], self.annotation_splits[i + 1]
+    long_spans = self.long_span[start:end].tolist()
+    yes_no = self.yes_no[start:end].tolist()
+    short_span_splits = self.short_span_splits[start:end + 1].tolist()
+    short_spans = self.short_span[
+        short_span_splits[0]:short_span_splits[-1]].tolist()
+    offset = short_span_splits[0]
+
+    labels = []
+    for j, long_span in enumerate(long_spans):
+      short_span_list = [
+          _trusted_span(short_span)
+          for short_span in short_spans[short_span_splits[j] -
+                                        offset:short_span_splits[j + 1] -
+                                        offset]
+      ]
+      labels.append(
+          NQLabel(
+              example_id=example_id,
+              long_answer_span=_trusted_span(long_span),
+              short_answer_span_list=short_span_list,
+              long_score=0,
+              short_score=0,
+              yes_no_answer=YES_NO_ANSWERS[yes_no[j]]))
+    return labels
+
+  def __getitem__(self, example_id):
+    i = self.index(example_id)
+    if i < 0:
+      raise KeyError(example_id)
+    return self.get_labels(i)
+
+  def to_annotation_dict(self):
+    """Returns the dictionary that `read_annotation` would have returned."""
+    # Converting whole arrays at once is much faster than `get_labels`.
+    long_spans = [_trusted_span(span) for span in self.long_span.tolist()]
+    short_spans = [_trusted_span(span) for span in self.short_span.tolist()]
+    yes_no = [YES_NO_ANSWERS[code] for code in self.yes_no.tolist()]
+    annotation_splits = self.annotation_splits.tolist()
+    short_span_splits = self.short_span_splits.tolist()
+
+    annotation_dict = {}
+    for i, example_id in enumerate(self.example_id.tolist()):
+      annotation_dict[example_id] = [
+          NQLabel(
+              example_id=example_id,
+              long_answer_span=long_spans[j],
+              short_answer_span_list=short_spans[
+                  short_span_splits[j]:short_span_splits[j + 1]],
+              long_score=0,
+              short_score=0,
+              yes_no_answer=yes_no[j])
+          for j in range(annotation_splits[i], annotation_splits[i + 1])
+      ]
+    return annotation_dict
+
+
+def is_gold_store(path):
+  """Returns true iff `path` is a directory written by `GoldStore.save`."""
+  return os.path.isdir(path) and array_store.has_arrays(path,
+                                                        GOLD_STORE_ARRAYS)
+
+
+def load_gold_store(directory, mmap_mode='r'):
+  """Opens a `GoldStore` written by `GoldStore.save`.
 
-  return final_dict
+  Args:
+    directory: Directory containing the `.npy` files of the store.
+    mmap_mode ('r'): Passed to `np.load`. With the default, the arrays are
+      memory mapped, so opening the store is nearly free and processes that
+      read the same store share the page cache.
+
+  Returns:
+    A `GoldStore`.
+  """
+  logging.info('Reading gold store from: %s', directory)
+  return GoldStore(**array_store.load_arrays(
+      directory, GOLD_STORE_ARRAYS, mmap_mode=mmap_mode))
+
+
+# Uncompressed bytes of jsonl parsed by a worker at a time in `read_gold_store`.
+_CHUNK_BYTES = 1 << 22
+
+
+def _iter_line_chunks(path, chunk_bytes):
+  """Yields blocks of whole lines of about `chunk_bytes` of a gzipped file."""
+  with GzipFile(path, 'rb') as input_file:
+    pieces = []
+    while True:
+      block = input_file.read(chunk_bytes)
+      if not block:
+        break
+      end = block.rfind(b'\n') + 1
+      if not end:
+        pieces.append(block)
+        continue
+      pieces.append(block[:end])
+      yield b''.join(pieces)
+      pieces = [block[end:]]
+    remainder = b''.join(pieces)
+    if remainder:
+      yield remainder
+
+
+def _profile_line_chunks(path, chunk_bytes, profiler):
+  """`_iter_line_chunks`, with a `decompress` event for every block."""
+  chunks = _iter_line_chunks(path, chunk_bytes)
+  while True:
+    timer = profiling.Timer(thread_cpu=True)
+    chunk = next(chunks, None)
+    if chunk is None:
+      return
+    profiler.add_event(timer.event('decompress', bytes=len(chunk)))
+    yield chunk
+
+
+def _check_spans(spans):
+  """Raises the ValueError that `Span` raises for an invalid row of `spans`."""
+  start_byte, end_byte, start_token, end_token = spans.T
+  if np.any((start_byte < 0) != (end_byte < 0)):
+    raise ValueError('Inconsistent Null Spans (Byte).')
+  if np.any((start_token < 0) != (end_token < 0)):
+    raise ValueError('Inconsistent Null Spans (Token).')
+  if np.any((start_byte >= 0) & (start_byte >= end_byte)):
+    raise ValueError('Invalid byte spans (start_byte >= end_byte).')
+  if np.any((start_token >= 0) & (start_token >= end_token)):
+    raise ValueError('Invalid token spans (start_token_idx >= end_token_idx)')
+
+
+def _read_annotation_chunk(chunk):
+  """Returns the gold arrays of a block of jsonl lines, in file order."""
+  example_ids = []
+  num_annotations = []
+  long_spans = []
+  yes_no = []
+  num_short_answers = []
+  short_spans = []
+  for line in chunk.splitlines():
+    if not line.strip():
+      continue
+    json_example = scan_gold_fields(line)
+    if json_example is None:
+      json_example = json_utils.loads_fields(line, _GOLD_FIELDS)
+    example_ids.append(json_example['example_id'])
+    num_annotations.append(len(json_example['annotations']))
+    for annotation in json_example['annotations']:
+      span = annotation['long_answer']
+      long_spans.append((span['start_byte'], span['end_byte'],
+                         span['start_token'], span['end_token']))
+      yes_no.append(YES_NO_CODES[annotation['yes_no_answer'].lower()])
+      num_short_answers.append(len(annotation['short_answers']))
+      for span in annotation['short_answers']:
+        short_spans.append((span['start_byte'], span['end_byte'],
+                            span['start_token'], span['end_token']))
+
+  arrays = {
+      'example_id': np.array(example_ids, dtype=np.int64),
+      'num_annotations': np.array(num_annotations, dtype=np.int64),
+      'long_span': np.array(long_spans, dtype=np.int32).reshape(-1, 4),
+      'yes_no': np.array(yes_no, dtype=np.int8),
+      'num_short_answers': np.array(num_short_answers, dtype=np.int64),
+      'short_span': np.array(short_spans, dtype=np.int32).reshape(-1, 4),
+  }
+  _check_spans(arrays['long_span'])
+  _check_spans(arrays['short_span'])
+  return arrays
+
+
+def _profile_annotation_chunk(chunk):
+  """`_read_annotation_chunk`, also returning the `parse` event of the block."""
+  timer = profiling.Timer()
+  arrays = _read_annotation_chunk(chunk)
+  return arrays, timer.event(
+      'parse',
+      bytes=len(chunk),
+      examples=len(arrays['example_id']),
+      annotations=len(arrays['yes_no']))
+
+
+def _ragged_take(splits, rows):
+  """Returns (splits, index) of the rows `rows` of a ragged array."""
+  starts = splits[rows]
+  lengths = splits[rows + 1] - starts
+  new_splits = np.zeros(len(rows) + 1, dtype=np.int64)
+  np.cumsum(lengths, out=new_splits[1:])
+  index = np.arange(new_splits[-1]) + np.repeat(starts - new_splits[:-1],
+                                                lengths)
+  return new_splits, index
+
+
+def _merge_chunks(chunks):
+  """Builds a `GoldStore` from the arrays of `_read_annotation_chunk`."""
+  chunks = chunks or [_read_annotation_chunk(b'')]
+  arrays = dict([(name, np.concatenate([chunk[name] for chunk in chunks]))
+                 for name in chunks[0]])
+  annotation_splits = np.concatenate(
+      [[0], np.cumsum(arrays['num_annotations'])]).astype(np.int64)
+  short_span_splits = np.concatenate(
+      [[0], np.cumsum(arrays['num_short_answers'])]).astype(np.int64)
+
+  # As in a dictionary, the last occurrence of a repeated example id is kept.
+  example_id = arrays['example_id']
+  order = np.argsort(example_id, kind='stable')
+  sorted_ids = example_id[order]
+  is_last = np.ones(len(sorted_ids), dtype=bool)
+  is_last[:-1] = sorted_ids[1:] != sorted_ids[:-1]
+  rows = order[is_last]
+  annotation_splits, annotations = _ragged_take(annotation_splits, rows)
+  short_span_splits, short_spans = _ragged_take(short_span_splits,
+                                                annotations)
+  return GoldStore(
+      example_id=example_id[rows],
+      annotation_splits=annotation_splits,
+      long_span=arrays['long_span'][annotations],
+      yes_no=arrays['yes_no'][annotations],
+      short_span_splits=short_span_splits,
+      short_span=arrays['short_span'][short_spans])
+
+
+def read_gold_store(path_name, n_threads=10, chunk_bytes=_CHUNK_BYTES,
+                    profiler=None):
+  """Reads gzipped jsonl gold data into a `GoldStore` with all cores.
+
+  The shards are decompressed by one thread each, and cut into blocks of
+  whole lines that are parsed by a pool of `n_threads` processes. Idle
+  processes take the next block of whichever shard is available, so a single
+  shard, or a few shards of very different sizes, still keep every process
+  busy. Each block is returned as a few numpy arrays instead of a pickled
+  dictionary of NQLabels.
+
+  The blocks are decompressed in this process and sent to the pool as raw
+  text, since a gzip stream cannot be entered at an offset. A single shard is
+  therefore read no faster than one thread can decompress it, and its text is
+  pickled to the workers.
+
+  With a `profiling.Profiler`, every block gets a `decompress` event in the
+  thread of its shard, a `parse` event in the process that parsed it, and a
+  `transfer` event from the end of its parse to the arrival of its arrays in
+  this process, which is mostly pickling. Building the store is the `merge`
+  stage.
+
+  Args:
+    path_name: Glob pattern of gzipped jsonl gold files. If an example id
+      occurs more than once, its last occurrence in the sorted files is kept.
+    n_threads (10): Number of processes. With 1, blocks are parsed in this
+      process.
+    chunk_bytes: Approximate number of uncompressed bytes in a block.
+    profiler (None): Optional `profiling.Profiler`.
+
+  Returns:
+    A `GoldStore`, empty if the files contain no examples.
+
+  Raises:
+    IOError: If no files match `path_name`.
+  """
+  profiler = profiling.ensure(profiler)
+  if profiler.enabled:
+    iter_line_chunks = functools.partial(
+        _profile_line_chunks, chunk_bytes=chunk_bytes, profiler=profiler)
+    read_chunk = _profile_annotation_chunk
+  else:
+    iter_line_chunks = functools.partial(
+        _iter_line_chunks, chunk_bytes=chunk_bytes)
+    read_chunk = _read_annotation_chunk
+
+  input_paths = sorted(glob.glob(path_name))
+  if not input_paths:
+    raise IOError('No gold files match: %s' % path_name)
+  for path in input_paths:
+    logging.info('parsing %s ..... ', path)
+  if n_threads <= 1:
+    chunks = [
+        read_chunk(chunk)
+        for path in input_paths
+        for chunk in iter_line_chunks(path)
+    ]
+  else:
+    pool = multiprocessing.Pool(n_threads)
+    # Bounds the number of decompressed blocks waiting to be parsed.
+    in_flight = threading.BoundedSemaphore(2 * n_threads)
+
+    def release(_):
+      in_flight.release()
+
+    def received(result):
+      if profiler.enabled:
+        _, event = result
+        end = event['start'] + event['wall_seconds']
+        profiler.add_event({
+            'name': 'transfer',
+            'pid': event['pid'],
+            'tid': event['tid'],
+            'start': end,
+            'wall_seconds': time.time() - end,
+            'cpu_seconds': 0.0,
+            'peak_rss_bytes': event['peak_rss_bytes'],
+            'counts': {'examples': event['counts']['examples']},
+        })
+      release(result)
+
+    def read_shard(path):
+      results = []
+      for chunk in iter_line_chunks(path):
+        in_flight.acquire()
+        results.append(
+            pool.apply_async(
+                read_chunk, (chunk,),
+                callback=received,
+                error_callback=release))
+      return results
+
+    try:
+      # zlib releases the GIL, so the shards are decompressed concurrently.
+      with futures.ThreadPoolExecutor(
+          max(1, min(len(input_paths), n_threads))) as readers:
+        shard_results = list(readers.map(read_shard, input_paths))
+      chunks = [
+          result.get() for results in shard_results for result in results
+      ]
+    finally:
+      pool.close()
+      pool.join()
+
+  if profiler.enabled:
+    for _, event in chunks:
+      profiler.add_event(event)
+    chunks = [arrays for arrays, _ in chunks]
+  with profiler.stage('merge') as counts:
+    gold_store = _merge_chunks(chunks)
+    counts['examples'] = len(gold_store)
+  return gold_store
+
+
+def read_gold(path_name, n_threads=10, profiler=None):
+  """Reads gold annotations from a `GoldStore` directory or gzipped jsonl."""
+  if is_gold_store(path_name):
+    with profiling.ensure(profiler).stage('load_gold_store') as counts:
+      gold_store = load_gold_store(path_name)
+      counts['examples'] = len(gold_store)
+    return gold_store
+  return read_gold_store(path_name, n_threads=n_threads, profiler=profiler)
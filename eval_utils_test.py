@@ -18,7 +18,14 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import gzip
+import io
+import json
+import os
+import pickle
+
 import eval_utils as util
+import profiling
 
 import tensorflow.compat.v1 as tf
 
@@ -37,6 +44,22 @@ class EvalUtilsTest(tf.test.TestCase):
     self.assertTrue(util.Span(-1, -1, -1, -1).is_null_span())
     self.assertFalse(util.Span(-1, -1, 0, 1).is_null_span())
 
+  def testSharedNullSpan(self):
+    null_record = {'start_byte': -1, 'end_byte': -1,
+                   'start_token': -1, 'end_token': -1}
+    self.assertIs(util.span_from_record(null_record), util.NULL_SPAN)
+    span = util.span_from_record(dict(null_record, start_token=3, end_token=5))
+    self.assertFalse(span.is_null_span())
+    self.assertEqual((span.start_token_idx, span.end_token_idx), (3, 5))
+    with self.assertRaises(ValueError):
+      util.span_from_record(dict(null_record, start_token=3))
+    with self.assertRaises(AttributeError):
+      span.score = 1.0
+    with self.assertRaises(AttributeError):
+      util.NULL_SPAN.start_token_idx = 3
+    self.assertTrue(util.NULL_SPAN.is_null_span())
+    self.assertIs(pickle.loads(pickle.dumps(util.NULL_SPAN)), util.NULL_SPAN)
+
   def testSpanEqual(self):
     """Test span equals."""
     span_a = util.Span(100, 102, -1, -1)
@@ -66,6 +89,205 @@ class EvalUtilsTest(tf.test.TestCase):
     self.assertFalse(
         util.span_set_equal([span_a1], [span_a2, span_b, null_span]))
 
+  def testGoldStore(self):
+    """Test gold store round trip."""
+    null_span = util.Span(-1, -1, -1, -1)
+    annotation_dict = {
+        3: [
+            util.NQLabel(example_id=3, long_answer_span=util.Span(10, 20, 1, 5),
+                         short_answer_span_list=[util.Span(12, 14, 2, 3),
+                                                 util.Span(15, 17, 3, 4)],
+                         long_score=0, short_score=0, yes_no_answer='none'),
+            util.NQLabel(example_id=3, long_answer_span=null_span,
+                         short_answer_span_list=[],
+                         long_score=0, short_score=0, yes_no_answer='yes'),
+        ],
+        -7: [
+            util.NQLabel(example_id=-7, long_answer_span=null_span,
+                         short_answer_span_list=[null_span],
+                         long_score=0, short_score=0, yes_no_answer='none'),
+        ],
+    }
+    store_dir = os.path.join(self.get_temp_dir(), 'gold_store')
+    util.GoldStore.from_annotation_dict(annotation_dict).save(store_dir)
+    self.assertTrue(util.is_gold_store(store_dir))
+
+    store = util.load_gold_store(store_dir)
+    self.assertEqual(len(store), 2)
+    self.assertEqual(store.keys(), [-7, 3])
+    self.assertNotIn(5, store)
+    gold_dict = store.to_annotation_dict()
+    self.assertEqual(sorted(gold_dict.keys()), [-7, 3])
+    for example_id, labels in annotation_dict.items():
+      self.assertEqual(repr(gold_dict[example_id]), repr(labels))
+
+  def testScanGoldFields(self):
+    """The scanner agrees with json, and gives up on unexpected layouts."""
+    annotations = [{
+        'annotation_id': 1,
+        'long_answer': {'start_byte': 1, 'end_byte': 9,
+                        'start_token': 0, 'end_token': 3},
+        'short_answers': [{'start_byte': 2, 'end_byte': 4,
+                           'start_token': 1, 'end_token': 2}],
+        'yes_no_answer': 'NONE',
+    }]
+    example = {
+        'document_html': '<P> "annotations": [ ] \\" [</P>',
+        'annotations': annotations,
+        'document_tokens': [{'token': ']'}, {'token': '"example_id": 5,'}],
+        'example_id': -123456789012,
+    }
+    for separators in [(', ', ': '), (',', ':')]:
+      line = json.dumps(example, separators=separators).encode('utf-8')
+      self.assertEqual(util.scan_gold_fields(line), {
+          'example_id': -123456789012,
+          'annotations': annotations
+      })
+    nested = dict(example, question={'annotations': []})
+    self.assertIsNone(util.scan_gold_fields(json.dumps(nested).encode('utf-8')))
+
+    path = os.path.join(self.get_temp_dir(), 'gold.jsonl.gz')
+    with gzip.open(path, 'wb') as f:
+      for i, value in enumerate([example, nested]):
+        f.write(json.dumps(dict(value, example_id=i)).encode('utf-8') + b'\n')
+    self.assertEqual(
+        repr(sorted(util.read_annotation_from_one_split(path).items())),
+        repr(sorted(util.read_annotation_from_one_split(path,
+                                                        scan=False).items())))
+
+  def testReadGoldStore(self):
+    """Chunked parallel reading agrees with reading one shard at a time."""
+    def example(example_id, start_byte):
+      return {
+          'example_id': example_id,
+          'annotations': [{
+              'long_answer': {'start_byte': start_byte, 'end_byte': 90,
+                              'start_token': 1, 'end_token': 9},
+              'short_answers': [{'start_byte': start_byte, 'end_byte': 20,
+                                 'start_token': 1, 'end_token': 2}] * (
+                                     example_id % 3),
+              'yes_no_answer': 'NONE',
+          }] * (example_id % 4),
+          'document_html': 'x' * 100,
+      }
+
+    expected = {}
+    for shard in range(2):
+      path = os.path.join(self.get_temp_dir(), 'nq-%d.jsonl.gz' % shard)
+      with gzip.open(path, 'wb') as f:
+        # Example ids are repeated within and across shards.
+        for i in range(shard * 20, shard * 20 + 40):
+          f.write(json.dumps(example(i % 30, i % 20)).encode('utf-8') + b'\n')
+      expected.update(util.read_annotation_from_one_split(path))
+
+    pattern = os.path.join(self.get_temp_dir(), 'nq-?.jsonl.gz')
+    for n_threads in [1, 2]:
+      store = util.read_gold_store(pattern, n_threads=n_threads,
+                                   chunk_bytes=300)
+      self.assertEqual(store.keys(), sorted(expected.keys()))
+      self.assertEqual(repr(sorted(store.to_annotation_dict().items())),
+                       repr(sorted(expected.items())))
+
+      profiler = profiling.Profiler()
+      profiled_store = util.read_gold_store(
+          pattern, n_threads=n_threads, chunk_bytes=300, profiler=profiler)
+      self.assertEqual(profiled_store.keys(), store.keys())
+      stages = profiler.report()['stages']
+      self.assertEqual(stages['decompress']['counts']['bytes'],
+                       stages['parse']['counts']['bytes'])
+      self.assertEqual(stages['parse']['counts']['examples'], 80)
+      self.assertEqual(stages['merge']['counts']['examples'], len(store))
+      self.assertEqual('transfer' in stages, n_threads > 1)
+
+  def testReadGoldStoreEmpty(self):
+    """Empty shards give an empty store, and unmatched globs an IOError."""
+    path = os.path.join(self.get_temp_dir(), 'empty-0.jsonl.gz')
+    with gzip.open(path, 'wb'):
+      pass
+    pattern = os.path.join(self.get_temp_dir(), 'empty-*.jsonl.gz')
+    for n_threads in [1, 2]:
+      store = util.read_gold_store(pattern, n_threads=n_threads)
+      self.assertEmpty(store)
+      self.assertEqual(util.read_annotation(pattern, n_threads=n_threads), {})
+    with self.assertRaises(IOError):
+      util.read_gold_store(os.path.join(self.get_temp_dir(), 'missing-*'))
+
+  def _get_predictions(self):
+    return [{
+        'example_id': -2226525965842375672,
+        'long_answer': {'start_byte': 62657, 'end_byte': 64776,
+                        'start_token': 391, 'end_token': 604},
+        'long_answer_score': 13.5,
+        'short_answers': [{'start_byte': 64206, 'end_byte': 64280,
+                           'start_token': 555, 'end_token': 560}],
+        'short_answers_score': 26.4,
+        'yes_no_answer': 'NONE'
+    }, {
+        'example_id': 17,
+        'long_answer_score': 1,
+        'short_answers_score': -2e-3,
+        'yes_no_answer': 'YES'
+    }]
+
+  def testIterPredictionJson(self):
+    """Streaming reader handles small windows and unrelated keys."""
+    predictions = self._get_predictions()
+    text = json.dumps({'model': 'x' * 50, 'predictions': predictions,
+                       'count': 12345}, indent=1)
+    for read_size in [1, 7, 1 << 16]:
+      labels = list(util.iter_prediction_json(io.StringIO(text),
+                                              read_size=read_size))
+      self.assertEqual([label.example_id for label in labels],
+                       [-2226525965842375672, 17])
+      self.assertEqual(labels[0].short_score, 26.4)
+      self.assertEqual(labels[1].yes_no_answer, 'yes')
+      self.assertTrue(labels[1].long_answer_span.is_null_span())
+
+    self.assertEqual(
+        list(util.iter_prediction_json(io.StringIO('{"predictions": []}'))),
+        [])
+    with self.assertRaises(KeyError):
+      list(util.iter_prediction_json(io.StringIO('{}')))
+
+    bad = dict(predictions[1], short_answers=predictions[0]['short_answers'])
+    with self.assertRaises(ValueError):
+      list(util.iter_prediction_json(
+          io.StringIO(json.dumps({'predictions': [bad]}))))
+
+  def testIterPredictionJsonNumbers(self):
+    """Numbers cut off by the end of the window are read whole."""
+    predictions = [
+        dict(prediction, long_answer_score=score, short_answers_score=-score)
+        for prediction, score in zip(self._get_predictions() * 2,
+                                     [12.5e3, 1e-7, 123456789, 0.25])
+    ]
+    text = ('{"version": 12.5e3, "predictions": %s, "epsilon": -1.5E+10}' %
+            json.dumps(predictions))
+    for read_size in range(1, len(text) + 1):
+      labels = list(util.iter_prediction_json(io.StringIO(text),
+                                              read_size=read_size))
+      self.assertEqual([label.long_score for label in labels],
+                       [12.5e3, 1e-7, 123456789, 0.25])
+      self.assertEqual([label.short_score for label in labels],
+                       [-12.5e3, -1e-7, -123456789, -0.25])
+
+  def testReadPredictionJsonLines(self):
+    """JSON and sharded JSON-lines predictions give the same labels."""
+    predictions = self._get_predictions()
+    json_path = os.path.join(self.get_temp_dir(), 'predictions.json')
+    with open(json_path, 'w') as f:
+      json.dump({'predictions': predictions}, f)
+    for i, prediction in enumerate(predictions):
+      with open(os.path.join(self.get_temp_dir(),
+                             'predictions-%d.jsonl' % i), 'w') as f:
+        f.write(json.dumps(prediction) + '\n')
+
+    from_json = util.read_prediction_json(json_path)
+    from_jsonl = util.read_prediction_json(
+        os.path.join(self.get_temp_dir(), 'predictions-*.jsonl'))
+    self.assertEqual(repr(from_json), repr(from_jsonl))
+    self.assertEqual(len(from_json), 2)
+
 
 if __name__ == '__main__':
   tf.test.main()
@@ -0,0 +1,137 @@
+# coding=utf-8
+# Copyright 2018 The Google AI Language Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Evaluates predictions incrementally, as shards of predictions arrive.
+
+Example usage:
+
+  evaluator = IncrementalEvaluator(eval_utils.read_gold(gold_path))
+  for path in prediction_shards:
+    evaluator.add_predictions(eval_utils.read_prediction_json(path))
+    print(evaluator.get_metrics())
+
+`nq_eval.score_answers` requires predictions for exactly the gold examples.
+Here, every batch of predictions is scored as it is added, and the answer
+stats are merged into arrays kept sorted by decreasing score. Computing the
+metrics at any time neither rescores the predictions nor sorts the answer
+stats again: only the batch is sorted, and it is merged in linear time.
+
+Provisional metrics are computed on the examples scored so far, as if they
+were the whole gold set, and are reported along with the coverage. Once every
+gold example has been scored, the metrics are identical to those of nq_eval.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import batch_eval
+import nq_eval as ev
+import numpy as np
+
+
+class _SortedAnswerStats(object):
+  """Answer stats kept sorted by decreasing score."""
+
+  def __init__(self):
+    self.columns = batch_eval.to_stat_arrays([])
+
+  def __len__(self):
+    return len(self.columns.score)
+
+  def add(self, answer_stats):
+    """Merges a list of (has_gold, has_pred, is_correct, score) tuples."""
+    new = batch_eval.to_stat_arrays(answer_stats)
+    new = batch_eval.AnswerStatArrays(
+        *[column[np.argsort(-new.score, kind='stable')] for column in new])
+    positions = np.searchsorted(
+        -self.columns.score, -new.score, side='right')
+    self.columns = batch_eval.AnswerStatArrays(*[
+        np.insert(old, positions, values)
+        for old, values in zip(self.columns, new)
+    ])
+
+
+class IncrementalEvaluator(object):
+  """Scores batches of predictions and reports metrics at any point."""
+
+  def __init__(self, gold_annotation_dict):
+    """Constructor.
+
+    Args:
+      gold_annotation_dict: Dict from example id to list of gold NQLabels, or
+        a `GoldStore`, as returned by `eval_utils.read_gold`.
+    """
+    self.gold_annotation_dict = gold_annotation_dict
+    self.num_gold = len(gold_annotation_dict)
+    self.scored_ids = set()
+    self.long_answer_stats = _SortedAnswerStats()
+    self.short_answer_stats = _SortedAnswerStats()
+
+  def add_predictions(self, pred_dict):
+    """Scores a batch of predictions.
+
+    Args:
+      pred_dict: Dict from example id to the predicted NQLabel, e.g. one shard
+        as returned by `eval_utils.read_prediction_json`.
+
+    Raises:
+      ValueError: If an example is not in the gold set, or was already scored.
+        The batch is not added in that case.
+    """
+    for example_id in pred_dict:
+      if example_id in self.scored_ids:
+        raise ValueError('Example %s was already scored.' % example_id)
+      if example_id not in self.gold_annotation_dict:
+        raise ValueError('Example %s is not in the gold set.' % example_id)
+
+    long_answer_stats = []
+    short_answer_stats = []
+    for example_id, pred in pred_dict.items():
+      gold = self.gold_annotation_dict[example_id]
+      long_answer_stats.append(ev.score_long_answer(gold, pred))
+      short_answer_stats.append(ev.score_short_answer(gold, pred))
+    self.long_answer_stats.add(long_answer_stats)
+    self.short_answer_stats.add(short_answer_stats)
+    self.scored_ids.update(pred_dict.keys())
+
+  @property
+  def num_scored(self):
+    return len(self.scored_ids)
+
+  @property
+  def coverage(self):
+    """Fraction of the gold examples that have been scored."""
+    return ev.safe_divide(self.num_scored, self.num_gold)
+
+  @property
+  def is_complete(self):
+    return self.num_scored == self.num_gold
+
+  def get_answer_stats(self):
+    """Returns the long and short `batch_eval.AnswerStatArrays` so far."""
+    return self.long_answer_stats.columns, self.short_answer_stats.columns
+
+  def get_metrics(self):
+    """Returns the metrics of `nq_eval.get_metrics_with_answer_stats`.
+
+    The metrics are computed on the scored examples only. `coverage`,
+    `num-scored` and `num-gold` are added to the dictionary.
+    """
+    metrics = ev.get_metrics_with_answer_stats(
+        *self.get_answer_stats(), is_sorted=True)
+    metrics['coverage'] = self.coverage
+    metrics['num-scored'] = self.num_scored
+    metrics['num-gold'] = self.num_gold
+    return metrics
@@ -0,0 +1,73 @@
+# coding=utf-8
+# Copyright 2018 The Google AI Language Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Testing code for incremental_eval."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import random
+
+import incremental_eval
+import nq_eval as ev
+import tensorflow.compat.v1 as tf
+import test_utils
+
+
+class IncrementalEvalTest(tf.test.TestCase):
+  """Testing codes for incremental_eval"""
+
+  def testMatchesBatchMetrics(self):
+    """After the last shard, the metrics are those of nq_eval."""
+    rng = random.Random(0)
+    gold_dict = {}
+    pred_dict = {}
+    for example_id in range(200):
+      gold_dict[example_id] = [
+          test_utils.random_label(rng, example_id) for _ in range(5)
+      ]
+      pred_dict[example_id] = test_utils.random_label(rng, example_id,
+                                                      rng.randint(0, 10))
+
+    evaluator = incremental_eval.IncrementalEvaluator(gold_dict)
+    example_ids = list(pred_dict.keys())
+    rng.shuffle(example_ids)
+    for start in range(0, len(example_ids), 30):
+      shard = dict([(i, pred_dict[i]) for i in example_ids[start:start + 30]])
+      evaluator.add_predictions(shard)
+      metrics = evaluator.get_metrics()
+      self.assertEqual(metrics['num-scored'], min(start + 30, 200))
+      scored = example_ids[:start + 30]
+      provisional = ev.get_metrics_with_answer_stats(*ev.score_answers(
+          dict([(i, gold_dict[i]) for i in scored]),
+          dict([(i, pred_dict[i]) for i in scored])))
+      for key, value in provisional.items():
+        self.assertEqual(metrics[key], value)
+      self.assertEqual(metrics['coverage'], min(start + 30, 200) / 200)
+
+    self.assertTrue(evaluator.is_complete)
+    expected = ev.get_metrics_with_answer_stats(
+        *ev.score_answers(gold_dict, pred_dict))
+    for key, value in expected.items():
+      self.assertEqual(metrics[key], value)
+
+    with self.assertRaises(ValueError):
+      evaluator.add_predictions({0: pred_dict[0]})
+    with self.assertRaises(ValueError):
+      evaluator.add_predictions({1000: pred_dict[0]})
+
+
+if __name__ == '__main__':
+  tf.test.main()
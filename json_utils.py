@@ -0,0 +1,155 @@
+# coding=utf-8
+# Copyright 2018 The Google AI Language Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Pluggable JSON decoding for the Natural Questions jsonl readers.
+
+Natural Questions examples are several hundred KB of JSON per line, most of
+which is `document_html` and `document_tokens`. This module decodes them with
+the fastest parser that is installed:
+
+  orjson:   https://github.com/ijl/orjson
+  simdjson: https://github.com/TkTech/pysimdjson
+  json:     the standard library, always available.
+
+The parser is chosen by --json_backend, or by `set_backend`. With `auto`, the
+first installed parser of the list above is used.
+
+`loads_fields` decodes only some of the top level fields of an object. With
+simdjson, the other fields are never materialized as Python objects, which
+avoids building the hundreds of thousands of token dicts of `document_tokens`
+when only `annotations` are needed.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+import json
+import threading
+
+from absl import flags
+
+try:
+  import orjson  # pylint: disable=g-import-not-at-top
+except ImportError:
+  orjson = None
+
+try:
+  import simdjson  # pylint: disable=g-import-not-at-top
+except ImportError:
+  simdjson = None
+
+BACKENDS = ('auto', 'orjson', 'simdjson', 'json')
+
+flags.DEFINE_enum(
+    'json_backend', 'auto', list(BACKENDS),
+    'Parser used to decode jsonl examples. `auto` uses orjson or simdjson if '
+    'installed, and the standard library json module otherwise.')
+
+FLAGS = flags.FLAGS
+
+# Backend set with `set_backend`, overriding --json_backend.
+_backend = None
+
+# simdjson parsers hold a single document, so each thread needs its own.
+_local = threading.local()
+
+
+def available_backends():
+  """Returns the names of the installed parsers, fastest first."""
+  installed = {'orjson': orjson, 'simdjson': simdjson, 'json': json}
+  return [name for name in BACKENDS[1:] if installed[name] is not None]
+
+
+def set_backend(name):
+  """Selects the parser used by `loads`; None defers to --json_backend."""
+  global _backend
+  if name is not None:
+    _resolve(name)
+  _backend = name
+
+
+def _resolve(name):
+  if name == 'auto':
+    return available_backends()[0]
+  if name not in available_backends():
+    raise ValueError('JSON backend %s is not installed.' % name)
+  return name
+
+
+def get_backend():
+  """Returns the name of the parser used by `loads`."""
+  name = _backend
+  if name is None:
+    name = FLAGS.json_backend if FLAGS.is_parsed() else 'auto'
+  return _resolve(name)
+
+
+def _simdjson_parser():
+  parser = getattr(_local, 'parser', None)
+  if parser is None:
+    parser = _local.parser = simdjson.Parser()
+  return parser
+
+
+def _materialize(value):
+  """Converts simdjson proxies to Python objects."""
+  if isinstance(value, simdjson.Object):
+    return value.as_dict()
+  if isinstance(value, simdjson.Array):
+    return value.as_list()
+  return value
+
+
+def loads(data):
+  """Decodes a JSON document, given as bytes or str."""
+  backend = get_backend()
+  if backend == 'orjson':
+    try:
+      return orjson.loads(data)
+    except orjson.JSONDecodeError:
+      # orjson is stricter than json, e.g. for NaN or integers of more than
+      # 64 bits. Genuinely invalid documents raise again below.
+      return json.loads(data)
+  if backend == 'simdjson':
+    if isinstance(data, str):
+      data = data.encode('utf-8')
+    return _simdjson_parser().parse(data, True)
+  return json.loads(data)
+
+
+def loads_fields(data, fields):
+  """Decodes a JSON object, keeping only some of its top level fields.
+
+  Args:
+    data: A JSON object, as bytes or str.
+    fields: Names of the fields to keep.
+
+  Returns:
+    An OrderedDict with the fields of `fields` that are present in `data`, in
+    the order of `fields`.
+  """
+  backend = get_backend()
+  if backend == 'simdjson':
+    if isinstance(data, str):
+      data = data.encode('utf-8')
+    document = _simdjson_parser().parse(data)
+    return collections.OrderedDict([(name, _materialize(document[name]))
+                                    for name in fields
+                                    if name in document])
+  document = loads(data)
+  return collections.OrderedDict([
+      (name, document[name]) for name in fields if name in document
+  ])
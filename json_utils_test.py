@@ -0,0 +1,67 @@
+# coding=utf-8
+# Copyright 2018 The Google AI Language Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Testing code for json_utils."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+import math
+
+import json_utils
+import tensorflow.compat.v1 as tf
+
+EXAMPLE = {
+    'annotations': [{
+        'long_answer': {'start_byte': 0, 'end_byte': 9},
+        'yes_no_answer': 'NONE',
+    }],
+    'document_html': u'<P> "café" \\ </P>',
+    'document_tokens': [{'token': u'café', 'html_token': False}],
+    'example_id': -6543210987654321012,
+    'question_text': 'what is a café',
+}
+
+
+class JsonUtilsTest(tf.test.TestCase):
+  """Testing codes for json_utils"""
+
+  def tearDown(self):
+    json_utils.set_backend(None)
+    super(JsonUtilsTest, self).tearDown()
+
+  def testBackendsAgree(self):
+    """Every installed backend decodes bytes and str like json.loads."""
+    line = json.dumps(EXAMPLE)
+    for backend in json_utils.available_backends():
+      json_utils.set_backend(backend)
+      self.assertEqual(json_utils.get_backend(), backend)
+      self.assertEqual(json_utils.loads(line), EXAMPLE)
+      self.assertEqual(json_utils.loads(line.encode('utf-8')), EXAMPLE)
+      self.assertEqual(
+          dict(json_utils.loads_fields(line, ['example_id', 'annotations',
+                                              'missing'])),
+          {'example_id': EXAMPLE['example_id'],
+           'annotations': EXAMPLE['annotations']})
+      self.assertTrue(math.isnan(json_utils.loads('[NaN]')[0]))
+
+  def testUnknownBackend(self):
+    with self.assertRaises(ValueError):
+      json_utils.set_backend('not-a-parser')
+
+
+if __name__ == '__main__':
+  tf.test.main()
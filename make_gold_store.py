@@ -0,0 +1,57 @@
+# coding=utf-8
+# Copyright 2018 The Google AI Language Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Converts gzipped NQ jsonlines into a memory mapped gold store.
+
+Example usage:
+
+make_gold_store --gold_path=<path-to-gold-data> --output_dir=<dir>
+
+The output directory can then be passed as `--gold_path` to nq_eval, which
+opens it with `np.load(mmap_mode='r')` instead of parsing the jsonlines.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from absl import app
+from absl import flags
+from absl import logging
+
+import eval_utils as util
+
+FLAGS = flags.FLAGS
+
+
+def define_flags():
+  """Defines the flags of the script, which are also flags of nq_eval."""
+  flags.DEFINE_string('gold_path', None, 'Path to gold data.')
+  flags.DEFINE_string('output_dir', None,
+                      'Directory to write the gold store to.')
+  flags.DEFINE_integer('num_threads', 10, 'Number of processes for reading.')
+
+
+def main(_):
+  store = util.read_gold_store(FLAGS.gold_path, n_threads=FLAGS.num_threads)
+  store.save(FLAGS.output_dir)
+  logging.info('Wrote %d examples to %s', len(store), FLAGS.output_dir)
+
+
+if __name__ == '__main__':
+  define_flags()
+  flags.mark_flag_as_required('gold_path')
+  flags.mark_flag_as_required('output_dir')
+
+  app.run(main)
@@ -24,97 +24,237 @@ The logic to generate fake scores is as follows:
 2. Scores are assigned uniformly at random in the range [0, 2].
 3. If generate_false_positives is true, then long answers consisting of the
    first token are added for null documents, with scores in the range [0,1].
+
+To load test the evaluator beyond the size of the gold data, every gold
+example can be replicated under new example ids, along with matching
+synthetic gold shards:
+
+make_test_data --gold_path=<path-to-gold-data> --replicas=1300 \
+  --output_path=preds.jsonl.gz --gold_output_dir=<dir>
+
+nq_eval --gold_path='<dir>/nq-synthetic-*.jsonl.gz' \
+  --predictions_path=preds.jsonl.gz
+
+Predictions are written example by example, as JSON lines if output_path
+contains `.jsonl`, so memory use does not grow with the number of replicas.
+Replica `r` of the `i`-th gold example has the id `r * num_gold + i`, and
+replica 0 keeps the original ids. The random numbers of each replica are
+drawn from a generator seeded with --seed and `r`, so that the output is
+deterministic.
 """
 
 from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import gzip
 import json
+import os
 import random
 from absl import app
 from absl import flags
 
 import eval_utils as util
-import six
-
-flags.DEFINE_string('gold_path', None, 'Path to gold data.')
-flags.DEFINE_string('output_path', None, 'Path to write JSON.')
-flags.DEFINE_integer('num_threads', 10, 'Number of threads for reading.')
-flags.DEFINE_float('desired_recall', 1.0,
-                   'Desired maximum recall of predictions.')
-flags.DEFINE_bool('generate_false_positives', False,
-                  'Whether or not to generate false positives for null docs.')
 
 FLAGS = flags.FLAGS
 
 
-def main(_):
-  nq_gold_dict = util.read_annotation(FLAGS.gold_path,
-                                      n_threads=FLAGS.num_threads)
+def define_flags():
+  """Defines the flags of the script.
+
+  The flags are only defined when the module is run, so that its functions
+  can be imported along with nq_eval, which defines some of the same flags.
+  """
+  flags.DEFINE_string('gold_path', None, 'Path to gold data.')
+  flags.DEFINE_string('output_path', None, 'Path to write JSON.')
+  flags.DEFINE_integer('num_threads', 10, 'Number of threads for reading.')
+  flags.DEFINE_float('desired_recall', 1.0,
+                     'Desired maximum recall of predictions.')
+  flags.DEFINE_bool('generate_false_positives', False,
+                    'Whether or not to generate false positives for null docs.')
+  flags.DEFINE_integer('replicas', 1,
+                       'Number of times each gold example is replicated.')
+  flags.DEFINE_integer('seed', 0, 'Random seed of the generated predictions.')
+  flags.DEFINE_string(
+      'gold_output_dir', None,
+      'If set, write the replicated gold examples to gzipped JSON-lines shards '
+      '`nq-synthetic-XXXXX.jsonl.gz` in this directory.')
+  flags.DEFINE_integer('examples_per_shard', 10000,
+                       'Number of examples per synthetic gold shard.')
+
 
-  def label_to_pred(labels):
-    """Convert a list of gold human annotations to a perfect prediction."""
-    gold_has_short_answer = util.gold_has_short_answer(labels)
-
-    gold_has_long_answer = util.gold_has_long_answer(labels)
-
-    # We did not put `long_answer` and `yes_no_answer`, and they should be
-    # considered as null when loading from data.
-
-    pred = {
-        'example_id': labels[0].example_id,
-        'short_answers': [],
-        'short_answers_score': random.random(),
-        'long_answer_score': random.random()
-    }
-
-    keep_answer = random.random() <= FLAGS.desired_recall
-    for label in labels:
-      if gold_has_short_answer and keep_answer:
-        pred['short_answers_score'] *= 2
-        if not util.is_null_span_list(label.short_answer_span_list):
-          pred['short_answers'] = (
-              [{'start_token': span.start_token_idx,
-                'end_token': span.end_token_idx,
-                'start_byte': span.start_byte,
-                'end_byte': span.end_byte}
-               for span in label.short_answer_span_list])
-          pred['yes_no_answer'] = 'none'
-        elif label.yes_no_answer != 'none':
-          pred['short_answers'] = []
-          pred['yes_no_answer'] = label.yes_no_answer
-
-      if (gold_has_long_answer and not label.long_answer_span.is_null_span() and
-          keep_answer):
-        pred['long_answer'] = {
-            'start_token': label.long_answer_span.start_token_idx,
-            'end_token': label.long_answer_span.end_token_idx,
-            'start_byte': label.long_answer_span.start_byte,
-            'end_byte': label.long_answer_span.end_byte
-        }
-        pred['long_answer_score'] *= 2
-
-    if FLAGS.generate_false_positives:
-      if not gold_has_short_answer:
+def _span_to_json(span):
+  return {
+      'start_token': span.start_token_idx,
+      'end_token': span.end_token_idx,
+      'start_byte': span.start_byte,
+      'end_byte': span.end_byte
+  }
+
+
+def label_to_pred(example_id, labels, rng, desired_recall=1.0,
+                  generate_false_positives=False):
+  """Convert a list of gold human annotations to a perfect prediction."""
+  gold_has_short_answer = util.gold_has_short_answer(labels)
+
+  gold_has_long_answer = util.gold_has_long_answer(labels)
+
+  # We did not put `long_answer` and `yes_no_answer`, and they should be
+  # considered as null when loading from data.
+
+  pred = {
+      'example_id': example_id,
+      'short_answers': [],
+      'short_answers_score': rng.random(),
+      'long_answer_score': rng.random()
+  }
+
+  keep_answer = rng.random() <= desired_recall
+  for label in labels:
+    if gold_has_short_answer and keep_answer:
+      pred['short_answers_score'] *= 2
+      if not util.is_null_span_list(label.short_answer_span_list):
         pred['short_answers'] = [
-            {'start_token': 0, 'end_token': 1,
-             'start_byte': -1, 'end_byte': -1}]
+            _span_to_json(span) for span in label.short_answer_span_list
+        ]
+        pred['yes_no_answer'] = 'none'
+      elif label.yes_no_answer != 'none':
+        pred['short_answers'] = []
+        pred['yes_no_answer'] = label.yes_no_answer
+
+    if (gold_has_long_answer and not label.long_answer_span.is_null_span() and
+        keep_answer):
+      pred['long_answer'] = _span_to_json(label.long_answer_span)
+      pred['long_answer_score'] *= 2
+
+  if generate_false_positives:
+    if not gold_has_short_answer:
+      pred['short_answers'] = [
+          {'start_token': 0, 'end_token': 1,
+           'start_byte': -1, 'end_byte': -1}]
+
+    if not gold_has_long_answer:
+      pred['long_answer_start_token'] = 0
+      pred['long_answer_end_token'] = 1
+
+  return pred
 
-      if not gold_has_long_answer:
-        pred['long_answer_start_token'] = 0
-        pred['long_answer_end_token'] = 1
 
-    return pred
+def labels_to_gold(example_id, labels):
+  """Returns the gold jsonl example, as read by nq_eval, of a list of labels."""
+  return {
+      'example_id': example_id,
+      'annotations': [{
+          'annotation_id': i,
+          'long_answer': _span_to_json(label.long_answer_span),
+          'short_answers': [
+              _span_to_json(span)
+              for span in label.short_answer_span_list
+              if not span.is_null_span()
+          ],
+          'yes_no_answer': label.yes_no_answer.upper()
+      } for i, label in enumerate(labels)]
+  }
+
+
+def iter_replicas(nq_gold_dict, replicas, seed=0):
+  """Yields (example_id, labels, rng) for every replica of every example.
+
+  Args:
+    nq_gold_dict: Dict from example id to list of gold NQLabels.
+    replicas: Number of times each example is replicated.
+    seed (0): Seed of the random number generators.
+
+  Raises:
+    ValueError: If a replicated example id collides with a gold example id.
+  """
+  example_ids = sorted(nq_gold_dict.keys())
+  gold_ids = set(example_ids)
+  for replica in range(replicas):
+    rng = random.Random('%d-%d' % (seed, replica))
+    for i, gold_id in enumerate(example_ids):
+      example_id = gold_id
+      if replica:
+        example_id = replica * len(example_ids) + i
+        if example_id in gold_ids:
+          raise ValueError('Replicated id %d is a gold id.' % example_id)
+      yield example_id, nq_gold_dict[gold_id], rng
+
+
+def _open_output(path):
+  if path.endswith('.gz'):
+    # Synthetic data compresses well, and the default level 9 is slow.
+    return gzip.open(path, 'wt', compresslevel=1)
+  return open(path, 'w')
+
+
+def write_predictions(path, predictions):
+  """Writes predictions one by one, as JSON lines if `path` has `.jsonl`."""
+  jsonl = '.jsonl' in os.path.basename(path)
+  with _open_output(path) as f:
+    if not jsonl:
+      f.write('{"predictions": [')
+    for i, pred in enumerate(predictions):
+      if jsonl:
+        f.write(json.dumps(pred) + '\n')
+      else:
+        f.write((', ' if i else '') + json.dumps(pred))
+    if not jsonl:
+      f.write(']}')
+
+
+class GoldShardWriter(object):
+  """Writes gold examples to numbered gzipped JSON-lines shards."""
+
+  def __init__(self, directory, examples_per_shard):
+    self.directory = directory
+    self.examples_per_shard = examples_per_shard
+    self.num_examples = 0
+    self._file = None
+
+  def write(self, gold_example):
+    if not self.num_examples % self.examples_per_shard:
+      self.close()
+      self._file = _open_output(
+          os.path.join(
+              self.directory, 'nq-synthetic-%05d.jsonl.gz' %
+              (self.num_examples // self.examples_per_shard)))
+    self._file.write(json.dumps(gold_example) + '\n')
+    self.num_examples += 1
+
+  def close(self):
+    if self._file:
+      self._file.close()
+      self._file = None
+
+
+def main(_):
+  nq_gold_dict = util.read_annotation(FLAGS.gold_path,
+                                      n_threads=FLAGS.num_threads)
+
+  gold_writer = None
+  if FLAGS.gold_output_dir:
+    if not os.path.isdir(FLAGS.gold_output_dir):
+      os.makedirs(FLAGS.gold_output_dir)
+    gold_writer = GoldShardWriter(FLAGS.gold_output_dir,
+                                  FLAGS.examples_per_shard)
 
-  predictions = []
-  for _, labels in six.iteritems(nq_gold_dict):
-    predictions.append(label_to_pred(labels))
+  def predictions():
+    for example_id, labels, rng in iter_replicas(nq_gold_dict, FLAGS.replicas,
+                                                 FLAGS.seed):
+      if gold_writer:
+        gold_writer.write(labels_to_gold(example_id, labels))
+      yield label_to_pred(example_id, labels, rng, FLAGS.desired_recall,
+                          FLAGS.generate_false_positives)
 
-  with open(FLAGS.output_path, 'w') as f:
-    json.dump({'predictions': predictions}, f)
+  try:
+    write_predictions(FLAGS.output_path, predictions())
+  finally:
+    if gold_writer:
+      gold_writer.close()
 
 if __name__ == '__main__':
+  define_flags()
   flags.mark_flag_as_required('gold_path')
   flags.mark_flag_as_required('output_path')
 
@@ -0,0 +1,86 @@
+# coding=utf-8
+# Copyright 2018 The Google AI Language Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Testing code for make_test_data."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import glob
+import os
+import random
+
+import eval_utils as util
+import make_test_data
+import tensorflow.compat.v1 as tf
+import test_utils
+
+
+def label_tuple(label):
+  spans = [label.long_answer_span] + label.short_answer_span_list
+  return ([(s.start_byte, s.end_byte, s.start_token_idx, s.end_token_idx)
+           for s in spans if not s.is_null_span()], label.yes_no_answer)
+
+
+class MakeTestDataTest(tf.test.TestCase):
+  """Testing codes for make_test_data"""
+
+  def write(self, name, gold_dict, replicas):
+    directory = os.path.join(self.get_temp_dir(), name)
+    os.makedirs(directory)
+    gold_writer = make_test_data.GoldShardWriter(directory, 7)
+
+    def predictions():
+      for example_id, labels, rng in make_test_data.iter_replicas(
+          gold_dict, replicas, seed=1):
+        gold_writer.write(make_test_data.labels_to_gold(example_id, labels))
+        yield make_test_data.label_to_pred(example_id, labels, rng, 0.5)
+
+    predictions_path = os.path.join(directory, 'predictions.jsonl.gz')
+    make_test_data.write_predictions(predictions_path, predictions())
+    gold_writer.close()
+    return directory, predictions_path
+
+  def testReplicas(self):
+    rng = random.Random(0)
+    gold_dict = {}
+    for i in range(10):
+      example_id = 10**18 + i
+      gold_dict[example_id] = [
+          test_utils.random_label(rng, example_id) for _ in range(5)
+      ]
+
+    directory, predictions_path = self.write('first', gold_dict, 3)
+    self.assertLen(glob.glob(os.path.join(directory, 'nq-synthetic-*')), 5)
+    replicated = util.read_annotation(
+        os.path.join(directory, 'nq-synthetic-*.jsonl.gz'), n_threads=1)
+    predictions = util.read_prediction_json(predictions_path)
+    self.assertLen(replicated, 30)
+    self.assertCountEqual(replicated.keys(), predictions.keys())
+    for i, example_id in enumerate(sorted(gold_dict)):
+      for replica_id in [example_id, 10 + i, 20 + i]:
+        self.assertEqual(
+            [label_tuple(label) for label in replicated[replica_id]],
+            [label_tuple(label) for label in gold_dict[example_id]])
+
+    # The output only depends on the seed.
+    _, same_predictions_path = self.write('second', gold_dict, 3)
+    self.assertEqual(
+        repr(sorted(util.read_prediction_json(same_predictions_path).items())),
+        repr(sorted(predictions.items())))
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -0,0 +1,566 @@
+# coding=utf-8
+# Copyright 2018 The Google AI Language Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+r"""Benchmarks of the evaluation and data pipelines.
+
+Example usage:
+
+  python nq_benchmark.py --results_path=before.json
+  # ... upgrade a dependency or change the code ...
+  python nq_benchmark.py --results_path=after.json --baseline_path=before.json
+
+By default, the inputs are synthetic dev examples in the original NQ format,
+generated from --seed, so that runs with the same flags time the same inputs.
+With --gold_path, e.g. the sample dev data, the gold shards are read from
+there instead. Predictions are generated from the gold shards unless
+--predictions_path is given.
+
+Every benchmark is run --repeats times and the best time is kept. The stages
+are:
+
+  read_gold_store: The steps of `eval_utils.read_gold_store` in one process:
+    decompressing the shards into blocks of lines, parsing the blocks into
+    arrays, and merging them into a `GoldStore`.
+  read_annotation: `eval_utils.read_annotation_from_one_split` on every
+    shard, decoding the whole examples and with `eval_utils.scan_gold_fields`,
+    which are checked to return the same labels, and the speedup of the
+    scanner. Then `eval_utils.read_annotation` with each of --read_threads.
+  read_prediction_json: `eval_utils.read_prediction_json`.
+  score_answers: `nq_eval.score_answers` and the vectorized
+    `batch_eval.score_answers`.
+  compute_pr_curves: `nq_eval.compute_pr_curves` for each of
+    --pr_curve_sizes random answer stats.
+  simplify_nq_example: `text_utils.simplify_nq_example` and
+    `text_utils.fast_simplify_nq_example`, which are checked to return the
+    same JSON.
+  nq_browser: Rendering the features page of examples, from the parsed JSON,
+    and the index page.
+
+The results are written as JSON, with a `seconds` entry for every benchmark.
+With --baseline_path, every benchmark is compared with the results of a
+previous run, and the exit status is 1 if one of them is more than
+--max_slowdown slower. Benchmarks faster than --min_seconds in the baseline
+are too noisy to be reported as regressions.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+import copy
+import glob
+import gzip
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from absl import app
+from absl import flags
+import batch_eval
+import eval_utils as util
+import jinja2
+import json_utils
+import nq_browser
+import nq_eval as ev
+import numpy as np
+import text_utils
+
+flags.DEFINE_string('results_path', None,
+                    'Path to write the JSON results to. Defaults to stdout.')
+flags.DEFINE_string('baseline_path', None,
+                    'Results of a previous run to compare with.')
+flags.DEFINE_float(
+    'max_slowdown', 0.2,
+    'Relative slowdown over the baseline above which a benchmark is reported '
+    'as a regression.')
+flags.DEFINE_float(
+    'min_seconds', 0.01,
+    'Benchmarks that took less than this in the baseline are compared, but '
+    'not reported as regressions, since their timings are noisy.')
+flags.DEFINE_list('stages', None,
+                  'Stages to run, see the module doc. Defaults to all.')
+flags.DEFINE_integer('repeats', 3, 'Number of timed runs of each benchmark.')
+flags.DEFINE_integer('seed', 0, 'Random seed of the synthetic inputs.')
+flags.DEFINE_integer('num_examples', 2000,
+                     'Number of synthetic gold examples.')
+flags.DEFINE_integer('num_shards', 4, 'Number of synthetic gold shards.')
+flags.DEFINE_integer('tokens_per_example', 2000,
+                     'Approximate number of tokens of synthetic examples.')
+flags.DEFINE_integer(
+    'num_sample_examples', 200,
+    'Number of full examples used by the simplify_nq_example and nq_browser '
+    'stages.')
+flags.DEFINE_list('read_threads', ['1', '2', '4'],
+                  'Numbers of threads used by read_annotation.')
+flags.DEFINE_list('pr_curve_sizes', ['1000', '10000', '100000', '1000000'],
+                  'Numbers of answer stats used by compute_pr_curves.')
+flags.DEFINE_string(
+    'work_dir', None,
+    'Directory for the synthetic inputs. Defaults to a temporary directory, '
+    'which is deleted afterwards.')
+
+FLAGS = flags.FLAGS
+
+STAGES = ('read_gold_store', 'read_annotation', 'read_prediction_json',
+          'score_answers', 'compute_pr_curves', 'simplify_nq_example',
+          'nq_browser')
+
+# Precision targets of nq_eval.
+_TARGETS = [0.5, 0.75, 0.9]
+
+# Words of the synthetic documents.
+_WORDS = ('the', 'a', 'cat', 'sat', 'on', 'mat', 'in', 'Paris', '1972', 'of',
+          'river', 'is', 'was', 'by', 'and', 'Table', ',', '.')
+
+BenchmarkInputs = collections.namedtuple(
+    'BenchmarkInputs', ['gold_path', 'predictions_path', 'sample_examples'])
+
+
+def synthetic_example(rng, example_id, num_tokens, num_annotations=5):
+  """Returns a random example in the original NQ format.
+
+  Args:
+    rng: `random.Random` instance.
+    example_id: Example id.
+    num_tokens: Approximate number of document tokens.
+    num_annotations (5): Number of annotations, 5 as in the dev data.
+  """
+  tokens = []
+  num_bytes = [0]
+
+  def add_token(token, html_token):
+    tokens.append({
+        'token': token,
+        'start_byte': num_bytes[0],
+        'end_byte': num_bytes[0] + len(token),
+        'html_token': html_token
+    })
+    num_bytes[0] += len(token) + 1
+
+  candidates = []
+  while len(tokens) < num_tokens:
+    start_token = len(tokens)
+    add_token('<P>', True)
+    for _ in range(rng.randint(10, 60)):
+      add_token(rng.choice(_WORDS), False)
+    add_token('</P>', True)
+    candidates.append({
+        'start_token': start_token,
+        'end_token': len(tokens),
+        'start_byte': tokens[start_token]['start_byte'],
+        'end_byte': tokens[-1]['end_byte'],
+        'top_level': True
+    })
+
+  annotations = []
+  for annotation_id in range(num_annotations):
+    long_answer = {'start_token': -1, 'end_token': -1, 'start_byte': -1,
+                   'end_byte': -1, 'candidate_index': -1}
+    short_answers = []
+    yes_no_answer = 'NONE'
+    if rng.random() < 0.5:
+      # Annotators agree on one of the first candidates.
+      candidate_index = rng.randrange(min(3, len(candidates)))
+      candidate = candidates[candidate_index]
+      long_answer = dict(candidate, candidate_index=candidate_index)
+      del long_answer['top_level']
+      if rng.random() < 0.5:
+        start = rng.randint(candidate['start_token'] + 1,
+                            candidate['end_token'] - 2)
+        end = min(start + rng.randint(1, 3), candidate['end_token'] - 1)
+        short_answers.append({
+            'start_token': start,
+            'end_token': end,
+            'start_byte': tokens[start]['start_byte'],
+            'end_byte': tokens[end - 1]['end_byte']
+        })
+      elif rng.random() < 0.2:
+        yes_no_answer = rng.choice(['YES', 'NO'])
+    annotations.append({
+        'annotation_id': annotation_id,
+        'long_answer': long_answer,
+        'short_answers': short_answers,
+        'yes_no_answer': yes_no_answer
+    })
+
+  return {
+      'example_id': example_id,
+      'document_url': 'https://en.wikipedia.org/wiki/%d' % example_id,
+      'document_title': 'Example %d' % example_id,
+      'document_html': ' '.join([t['token'] for t in tokens]),
+      'document_tokens': tokens,
+      'question_text': 'what is %d' % example_id,
+      'question_tokens': ['what', 'is', str(example_id)],
+      'long_answer_candidates': candidates,
+      'annotations': annotations,
+  }
+
+
+def synthetic_prediction(rng, json_example):
+  """Returns a random prediction for an example, often one of its answers."""
+  annotation = rng.choice(json_example['annotations'])
+  candidates = json_example['long_answer_candidates']
+  long_answer = annotation['long_answer']
+  if rng.random() < 0.3 and candidates:
+    long_answer = rng.choice(candidates)
+  return {
+      'example_id': json_example['example_id'],
+      'long_answer': {
+          'start_token': long_answer['start_token'],
+          'end_token': long_answer['end_token'],
+          'start_byte': long_answer['start_byte'],
+          'end_byte': long_answer['end_byte']
+      },
+      'long_answer_score': rng.random() * 10,
+      'short_answers': annotation['short_answers'],
+      'short_answers_score': rng.random() * 10,
+      'yes_no_answer': annotation['yes_no_answer']
+  }
+
+
+def write_synthetic_gold(directory, rng):
+  """Writes synthetic gold shards, and returns their glob pattern."""
+  num_shards = max(1, FLAGS.num_shards)
+  for shard in range(num_shards):
+    with gzip.open(
+        os.path.join(directory, 'nq-dev-%02d.jsonl.gz' % shard), 'wt') as f:
+      for i in range(shard, FLAGS.num_examples, num_shards):
+        f.write(json.dumps(
+            synthetic_example(rng, 10**18 + i, FLAGS.tokens_per_example)) +
+                '\n')
+  return os.path.join(directory, 'nq-dev-*.jsonl.gz')
+
+
+def prepare_inputs(work_dir):
+  """Writes or locates the inputs of the benchmarks.
+
+  Args:
+    work_dir: Directory to write synthetic inputs to.
+
+  Returns:
+    `BenchmarkInputs`.
+  """
+  rng = random.Random(FLAGS.seed)
+  gold_path = FLAGS.gold_path or write_synthetic_gold(work_dir, rng)
+  paths = sorted(glob.glob(gold_path))
+  if not paths:
+    raise IOError('No gold shards match: %s' % gold_path)
+
+  predictions_path = FLAGS.predictions_path
+  sample_examples = []
+  predictions = []
+  for path in paths:
+    with gzip.open(path, 'rb') as f:
+      for line in f:
+        json_example = json_utils.loads(line)
+        if len(sample_examples) < FLAGS.num_sample_examples:
+          sample_examples.append(json_example)
+        if not predictions_path:
+          predictions.append(synthetic_prediction(rng, json_example))
+  if not predictions_path:
+    predictions_path = os.path.join(work_dir, 'predictions.json')
+    with open(predictions_path, 'w') as f:
+      json.dump({'predictions': predictions}, f)
+  return BenchmarkInputs(gold_path, predictions_path, sample_examples)
+
+
+def time_best(fn, repeats=None):
+  """Returns (best time in seconds, result) of `repeats` calls to `fn`."""
+  best = float('inf')
+  result = None
+  for _ in range(repeats or FLAGS.repeats):
+    start = time.time()
+    result = fn()
+    best = min(best, time.time() - start)
+  return best, result
+
+
+def benchmark_read_gold_store(inputs, results):
+  # pylint: disable=protected-access
+  paths = sorted(glob.glob(inputs.gold_path))
+  seconds, chunks = time_best(lambda: [
+      chunk for path in paths
+      for chunk in util._iter_line_chunks(path, util._CHUNK_BYTES)
+  ])
+  megabytes = sum(len(chunk) for chunk in chunks) / 2.0**20
+  results['read_gold_store/gunzip'] = {
+      'seconds': seconds,
+      'megabytes_per_second': megabytes / seconds,
+  }
+
+  seconds, arrays = time_best(
+      lambda: [util._read_annotation_chunk(chunk) for chunk in chunks])
+  num_examples = sum(len(a['example_id']) for a in arrays)
+  results['read_gold_store/parse'] = {
+      'seconds': seconds,
+      'megabytes_per_second': megabytes / seconds,
+      'examples_per_second': num_examples / seconds,
+  }
+
+  seconds, _ = time_best(lambda: util._merge_chunks(arrays))
+  results['read_gold_store/merge'] = {
+      'seconds': seconds,
+      'examples_per_second': num_examples / seconds,
+  }
+
+
+def benchmark_read_annotation(inputs, results):
+  paths = sorted(glob.glob(inputs.gold_path))
+  num_shards = len(paths)
+  outputs = []
+  for name, scan in [('full', False), ('scan', True)]:
+    seconds, gold = time_best(lambda scan=scan: [
+        util.read_annotation_from_one_split(path, scan=scan) for path in paths
+    ])
+    outputs.append(repr([sorted(shard.items()) for shard in gold]))
+    results['read_annotation/one_split/' + name] = {
+        'seconds': seconds,
+        'seconds_per_shard': seconds / num_shards,
+        'examples_per_second': sum(len(shard) for shard in gold) / seconds,
+    }
+  results['read_annotation/one_split/scan']['speedup'] = (
+      results['read_annotation/one_split/full']['seconds'] /
+      results['read_annotation/one_split/scan']['seconds'])
+  if outputs[0] != outputs[1]:
+    raise ValueError('read_annotation_from_one_split with scan_gold_fields '
+                     'differs from decoding the whole examples.')
+
+  for num_threads in [int(n) for n in FLAGS.read_threads]:
+    seconds, gold = time_best(
+        lambda n=num_threads: util.read_annotation(inputs.gold_path, n))
+    results['read_annotation/threads=%d' % num_threads] = {
+        'seconds': seconds,
+        'seconds_per_shard': seconds / num_shards,
+        'examples_per_second': len(gold) / seconds,
+    }
+
+
+def benchmark_read_prediction_json(inputs, results):
+  seconds, predictions = time_best(
+      lambda: util.read_prediction_json(inputs.predictions_path))
+  results['read_prediction_json'] = {
+      'seconds': seconds,
+      'examples_per_second': len(predictions) / seconds,
+      'megabytes': os.path.getsize(inputs.predictions_path) / 2.0**20,
+  }
+
+
+def benchmark_score_answers(inputs, results):
+  gold_dict = util.read_annotation(inputs.gold_path)
+  gold_store = util.read_gold(inputs.gold_path)
+  pred_dict = util.read_prediction_json(inputs.predictions_path)
+  for name, score, gold in [('loop', ev.score_answers, gold_dict),
+                            ('vectorized', batch_eval.score_answers,
+                             gold_store)]:
+    seconds, _ = time_best(lambda s=score, g=gold: s(g, pred_dict))
+    results['score_answers/' + name] = {
+        'seconds': seconds,
+        'examples_per_second': len(pred_dict) / seconds,
+    }
+
+
+def benchmark_compute_pr_curves(inputs, results):
+  del inputs
+  rng = np.random.RandomState(FLAGS.seed)
+  for size in [int(n) for n in FLAGS.pr_curve_sizes]:
+    has_gold = rng.rand(size) < 0.6
+    has_pred = rng.rand(size) < 0.8
+    answer_stats = list(
+        zip(has_gold.tolist(), has_pred.tolist(),
+            (has_gold & has_pred & (rng.rand(size) < 0.7)).tolist(),
+            np.round(rng.rand(size), 3).tolist()))
+    seconds, _ = time_best(
+        lambda s=answer_stats: ev.compute_pr_curves(s, _TARGETS))
+    results['compute_pr_curves/n=%d' % size] = {
+        'seconds': seconds,
+        'examples_per_second': size / seconds,
+    }
+
+
+def benchmark_simplify_nq_example(inputs, results):
+  examples = inputs.sample_examples
+  outputs = []
+  for name, simplify, mutates in [
+      ('simplify_nq_example', text_utils.simplify_nq_example, True),
+      ('fast_simplify_nq_example', text_utils.fast_simplify_nq_example, False)
+  ]:
+    best = float('inf')
+    for _ in range(FLAGS.repeats):
+      # Copies of the inputs are made outside of the timed section.
+      inputs_copy = copy.deepcopy(examples) if mutates else examples
+      start = time.time()
+      simplified = [simplify(example) for example in inputs_copy]
+      best = min(best, time.time() - start)
+    outputs.append(json.dumps(simplified))
+    results['simplify_nq_example/' + name] = {
+        'seconds': best,
+        'examples_per_second': len(examples) / best,
+    }
+  if outputs[0] != outputs[1]:
+    raise ValueError('fast_simplify_nq_example differs from '
+                     'simplify_nq_example.')
+
+
+def benchmark_nq_browser(inputs, results):
+  # The synthetic examples have five way annotations, as in the dev data.
+  env = jinja2.Environment(
+      loader=jinja2.FileSystemLoader(
+          os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                       'templates')))
+  features_template = env.get_template('features.html')
+  index_template = env.get_template('index.html')
+
+  def render_features():
+    latencies = []
+    for json_example in inputs.sample_examples:
+      start = time.time()
+      features_template.render(
+          dataset='Dev', example=nq_browser.Example(json_example, 'dev'))
+      latencies.append(time.time() - start)
+    return latencies
+
+  seconds, latencies = time_best(render_features)
+  results['nq_browser/features'] = {
+      'seconds': seconds,
+      'latency_ms_p50': 1000 * float(np.percentile(latencies, 50)),
+      'latency_ms_p90': 1000 * float(np.percentile(latencies, 90)),
+      'latency_ms_max': 1000 * max(latencies),
+  }
+
+  with open(sorted(glob.glob(inputs.gold_path))[0], 'rb') as f:
+    summaries = list(nq_browser.load_example_index(f, 'dev').values())
+  seconds, _ = time_best(lambda: index_template.render(
+      dataset='Dev', examples=summaries[:FLAGS.page_size], page=0,
+      num_pages=1))
+  results['nq_browser/index'] = {
+      'seconds': seconds,
+      'latency_ms': 1000 * seconds,
+  }
+
+
+_BENCHMARKS = {
+    'read_gold_store': benchmark_read_gold_store,
+    'read_annotation': benchmark_read_annotation,
+    'read_prediction_json': benchmark_read_prediction_json,
+    'score_answers': benchmark_score_answers,
+    'compute_pr_curves': benchmark_compute_pr_curves,
+    'simplify_nq_example': benchmark_simplify_nq_example,
+    'nq_browser': benchmark_nq_browser,
+}
+
+
+def environment():
+  """Returns a description of the machine and library versions."""
+  return collections.OrderedDict([
+      ('python', platform.python_version()),
+      ('numpy', np.__version__),
+      ('platform', platform.platform()),
+      ('cpu_count', os.cpu_count()),
+      ('json_backend', json_utils.get_backend()),
+  ])
+
+
+def compare_results(results, baseline, max_slowdown, min_seconds=0):
+  """Compares the benchmarks of two runs.
+
+  Args:
+    results: Dict from benchmark name to measurements with `seconds`.
+    baseline: Same as `results`, for the baseline run.
+    max_slowdown: Relative slowdown above which a benchmark regressed.
+    min_seconds (0): Baseline time below which a benchmark never regresses.
+
+  Returns:
+    List of (name, baseline seconds, seconds, ratio, regressed) tuples for
+    the benchmarks of both runs.
+  """
+  rows = []
+  for name, measurements in results.items():
+    if name not in baseline:
+      continue
+    baseline_seconds = baseline[name]['seconds']
+    seconds = measurements['seconds']
+    ratio = seconds / baseline_seconds if baseline_seconds else float('inf')
+    rows.append((name, baseline_seconds, seconds, ratio,
+                 ratio > 1 + max_slowdown and baseline_seconds >= min_seconds))
+  return rows
+
+
+def report_comparison(rows, f=sys.stderr):
+  """Prints the rows of `compare_results` to `f`.
+
+  Returns:
+    The exit status of the run: 1 if any benchmark regressed, 0 otherwise.
+  """
+  print('%-48s %10s %10s %8s' % ('benchmark', 'baseline', 'seconds', 'ratio'),
+        file=f)
+  for name, baseline_seconds, seconds, ratio, regressed in rows:
+    print('%-48s %9.4fs %9.4fs %7.2fx%s' %
+          (name, baseline_seconds, seconds, ratio,
+           '  REGRESSION' if regressed else ''), file=f)
+  return 1 if any(row[-1] for row in rows) else 0
+
+
+def main(_):
+  stages = FLAGS.stages or list(STAGES)
+  for stage in stages:
+    if stage not in _BENCHMARKS:
+      raise ValueError('Unknown stage: %s' % stage)
+
+  work_dir = FLAGS.work_dir or tempfile.mkdtemp(prefix='nq_benchmark-')
+  results = collections.OrderedDict()
+  try:
+    inputs = prepare_inputs(work_dir)
+    for stage in stages:
+      print('Running %s' % stage, file=sys.stderr)
+      _BENCHMARKS[stage](inputs, results)
+  finally:
+    if not FLAGS.work_dir:
+      shutil.rmtree(work_dir, ignore_errors=True)
+
+  output = collections.OrderedDict([
+      ('environment', environment()),
+      ('flags', collections.OrderedDict([
+          (name, FLAGS[name].value)
+          for name in ['seed', 'num_examples', 'num_shards',
+                       'tokens_per_example', 'num_sample_examples', 'gold_path',
+                       'predictions_path', 'repeats']
+      ])),
+      ('benchmarks', results),
+  ])
+  if FLAGS.results_path:
+    with open(FLAGS.results_path, 'w') as f:
+      json.dump(output, f, indent=2)
+  else:
+    print(json.dumps(output, indent=2))
+
+  if FLAGS.baseline_path:
+    with open(FLAGS.baseline_path) as f:
+      baseline = json.load(f)
+    if baseline['flags'] != output['flags']:
+      print('WARNING: the baseline was run with different flags: %s' %
+            baseline['flags'], file=sys.stderr)
+    return report_comparison(
+        compare_results(results, baseline['benchmarks'], FLAGS.max_slowdown,
+                        FLAGS.min_seconds))
+  return 0
+
+
+if __name__ == '__main__':
+  app.run(main)
@@ -0,0 +1,83 @@
+# coding=utf-8
+# Copyright 2018 The Google AI Language Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Testing code for nq_benchmark."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import io
+
+import nq_benchmark
+import tensorflow.compat.v1 as tf
+
+
+def measurements(**seconds):
+  return {name: {'seconds': s} for name, s in seconds.items()}
+
+
+class NqBenchmarkTest(tf.test.TestCase):
+  """Testing codes for nq_benchmark"""
+
+  def testCompareResults(self):
+    baseline = measurements(fast=0.001, same=1.0, slower=1.0, faster=1.0,
+                            removed=1.0, zero=0.0)
+    results = measurements(fast=0.01, same=1.0, slower=1.5, faster=0.5,
+                           added=1.0, zero=0.1)
+    rows = {row[0]: row[1:] for row in nq_benchmark.compare_results(
+        results, baseline, max_slowdown=0.2, min_seconds=0.01)}
+
+    self.assertCountEqual(
+        ['fast', 'same', 'slower', 'faster', 'zero'], rows.keys())
+    self.assertEqual((1.0, 1.5, 1.5, True), rows['slower'])
+    self.assertEqual((1.0, 0.5, 0.5, False), rows['faster'])
+    self.assertFalse(rows['same'][-1])
+    # Ten times slower, but below --min_seconds in the baseline.
+    self.assertAllClose(10.0, rows['fast'][2])
+    self.assertFalse(rows['fast'][-1])
+    self.assertEqual(float('inf'), rows['zero'][2])
+    self.assertFalse(rows['zero'][-1])
+
+    rows = {row[0]: row[1:] for row in nq_benchmark.compare_results(
+        results, baseline, max_slowdown=0.2)}
+    self.assertTrue(rows['fast'][-1])
+    self.assertTrue(rows['zero'][-1])
+    rows = {row[0]: row[1:] for row in nq_benchmark.compare_results(
+        results, baseline, max_slowdown=0.5)}
+    self.assertFalse(rows['slower'][-1])
+
+  def testReportComparison(self):
+    baseline = measurements(a=1.0, b=1.0)
+
+    f = io.StringIO()
+    rows = nq_benchmark.compare_results(
+        measurements(a=1.1, b=0.9), baseline, max_slowdown=0.2)
+    self.assertEqual(0, nq_benchmark.report_comparison(rows, f))
+    self.assertNotIn('REGRESSION', f.getvalue())
+
+    f = io.StringIO()
+    rows = nq_benchmark.compare_results(
+        measurements(a=1.1, b=2.0), baseline, max_slowdown=0.2)
+    self.assertEqual(1, nq_benchmark.report_comparison(rows, f))
+    lines = f.getvalue().splitlines()
+    self.assertLen(lines, 3)
+    self.assertNotIn('REGRESSION', lines[1])
+    self.assertIn('REGRESSION', lines[2])
+
+    self.assertEqual(0, nq_benchmark.report_comparison([], io.StringIO()))
+
+
+if __name__ == '__main__':
+  tf.test.main()
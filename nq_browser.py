@@ -19,10 +19,18 @@ Example usage:
 pip install absl-py
 pip install jinja2
 pip install tornado
-pip install wsgiref
 
 python nq_browser --nq_jsonl=nq-train-sample.jsonl.gz
 python nq_browser --nq_jsonl=nq-dev-sample.jsonl.gz --dataset=dev --port=8081
+
+Only a short summary of each example is kept in memory, and examples are read
+from the input file when they are first viewed. To browse a whole shard, pass
+--max_examples=-1. Reading an example from a gzipped file decompresses the
+gzip member that contains it, so large shards should first be rechunked into
+small members with nq_index.py:
+
+python nq_index.py --shard_pattern=nq-train-00.jsonl.gz --index_dir=indexed
+python nq_browser --nq_jsonl=indexed/nq-train-00.jsonl.gz --max_examples=-1
 """
 
 from __future__ import absolute_import
@@ -30,19 +38,21 @@ from __future__ import division
 from __future__ import print_function
 
 import base64
-import gzip
-import json
+import collections
+from concurrent import futures
+import itertools
 import os
-
-import wsgiref.simple_server
+import threading
 
 from absl import app
 from absl import flags
 
 import jinja2
+import json_utils
+import nq_index
 import numpy as np
+import tornado.ioloop
 import tornado.web
-import tornado.wsgi
 
 
 FLAGS = flags.FLAGS
@@ -53,8 +63,19 @@ flags.DEFINE_boolean('gzipped', True, 'Whether the jsonlines are gzipped.')
 flags.DEFINE_enum('dataset', 'train', ['train', 'dev'],
                   'Whether this is training data or dev data.')
 flags.DEFINE_integer('port', 8080, 'Port to listen on.')
-flags.DEFINE_integer('max_examples', 200,
-                     'Max number of examples to load in the browser.')
+flags.DEFINE_integer(
+    'max_examples', 200, 'Max number of examples to index in the browser. '
+    'Use -1 to index every example in the file.')
+flags.DEFINE_integer(
+    'cache_bytes', 256 << 20,
+    'Examples are parsed when they are first viewed, and kept in a LRU cache '
+    'bounded by this many bytes of serialized json.')
+flags.DEFINE_integer('page_size', 200,
+                     'Number of examples listed on each page of the index.')
+flags.DEFINE_integer(
+    'num_render_threads', 8,
+    'Number of threads used to parse examples and render pages, so that a '
+    'slow page does not block other requests.')
 flags.DEFINE_enum('mode', 'all_examples',
                   ['all_examples', 'long_answers', 'short_answers'],
                   'Subset of examples to show.')
@@ -76,42 +97,60 @@ class LongAnswerCandidate(object):
       self.style = 'not_answer'
 
 
+def get_answer_flags(json_example, dataset=None):
+  """Returns (has_long_answer, has_short_answer) for a json example.
+
+  Args:
+    json_example: Example with its `annotations`.
+    dataset (None): `train` or `dev`, defaults to --dataset.
+  """
+  dataset = dataset or FLAGS.dataset
+  if dataset == 'train':
+    if len(json_example['annotations']) != 1:
+      raise ValueError(
+          'Train set json_examples should have a single annotation.')
+    annotation = json_example['annotations'][0]
+    has_long_answer = annotation['long_answer']['start_byte'] >= 0
+    has_short_answer = bool(
+        annotation['short_answers'] or annotation['yes_no_answer'] != 'NONE')
+
+  elif dataset == 'dev':
+    if len(json_example['annotations']) != 5:
+      raise ValueError('Dev set json_examples should have five annotations.')
+    has_long_answer = sum([
+        annotation['long_answer']['start_byte'] >= 0
+        for annotation in json_example['annotations']
+    ]) >= 2
+    has_short_answer = sum([
+        bool(annotation['short_answers']) or
+        annotation['yes_no_answer'] != 'NONE'
+        for annotation in json_example['annotations']
+    ]) >= 2
+
+  return has_long_answer, has_short_answer
+
+
+def encode_example_id(example_id):
+  """Returns the url safe id used to refer to an example in the browser."""
+  return base64.urlsafe_b64encode(
+      str(example_id).encode('utf-8')).decode('ascii')
+
+
 class Example(object):
   """Example representation."""
 
-  def __init__(self, json_example):
+  def __init__(self, json_example, dataset=None):
     self.json_example = json_example
 
     # Whole example info.
     self.url = json_example['document_url']
     self.title = json_example.get('document_title', 'Wikipedia')
-    self.example_id = base64.urlsafe_b64encode(
-        str(self.json_example['example_id']).encode('utf-8'))
+    self.example_id = encode_example_id(self.json_example['example_id'])
     self.document_html = self.json_example['document_html'].encode('utf-8')
     self.document_tokens = self.json_example['document_tokens']
     self.question_text = json_example['question_text']
-
-    if FLAGS.dataset == 'train':
-      if len(json_example['annotations']) != 1:
-        raise ValueError(
-            'Train set json_examples should have a single annotation.')
-      annotation = json_example['annotations'][0]
-      self.has_long_answer = annotation['long_answer']['start_byte'] >= 0
-      self.has_short_answer = annotation[
-          'short_answers'] or annotation['yes_no_answer'] != 'NONE'
-
-    elif FLAGS.dataset == 'dev':
-      if len(json_example['annotations']) != 5:
-        raise ValueError('Dev set json_examples should have five annotations.')
-      self.has_long_answer = sum([
-          annotation['long_answer']['start_byte'] >= 0
-          for annotation in json_example['annotations']
-      ]) >= 2
-      self.has_short_answer = sum([
-          bool(annotation['short_answers']) or
-          annotation['yes_no_answer'] != 'NONE'
-          for annotation in json_example['annotations']
-      ]) >= 2
+    self.has_long_answer, self.has_short_answer = get_answer_flags(
+        json_example, dataset)
 
     self.long_answers = [
         a['long_answer']
@@ -254,118 +293,271 @@ def has_short_answer(json_example):
   return False
 
 
-def load_examples(fileobj):
-  """Reads jsonlines containing NQ examples.
+# Lightweight record of an example that is kept for every indexed example.
+# The position fields locate the serialized example in the input file, see
+# `nq_index.iter_lines`.
+ExampleSummary = collections.namedtuple('ExampleSummary', [
+    'example_id', 'url', 'title', 'question_text', 'has_long_answer',
+    'has_short_answer', 'block_offset', 'line_offset', 'num_bytes'
+])
 
-  Args:
-    fileobj: File object containing NQ examples.
+# Fields of the json examples needed to build an `ExampleSummary`.
+_SUMMARY_FIELDS = ('example_id', 'document_url', 'document_title',
+                   'question_text', 'annotations')
 
-  Returns:
-    Dictionary mapping example id to `Example` object.
-  """
-
-  def _load(examples, f):
-    """Read serialized json from `f`, create examples, and add to `examples`."""
 
-    for l in f:
-      json_example = json.loads(l)
-      if FLAGS.mode == 'long_answers' and not has_long_answer(json_example):
-        continue
+def _iter_plain_lines(fileobj):
+  """Yields (offset, 0, line) for an uncompressed file, see `iter_lines`."""
+  offset = 0
+  for line in fileobj:
+    yield offset, 0, line
+    offset += len(line)
 
-      elif FLAGS.mode == 'short_answers' and not has_short_answer(json_example):
-        continue
 
-      example = Example(json_example)
-      examples[example.example_id] = example
+def load_example_index(fileobj, dataset=None):
+  """Reads jsonlines containing NQ examples and keeps a summary of each.
 
-      if len(examples) == FLAGS.max_examples:
-        break
+  Args:
+    fileobj: Binary file object containing NQ examples.
+    dataset (None): `train` or `dev`, defaults to --dataset.
 
-  examples = {}
+  Returns:
+    OrderedDict mapping example id to `ExampleSummary`.
+  """
   if FLAGS.gzipped:
-    _load(examples, gzip.GzipFile(fileobj=fileobj))
+    lines = nq_index.iter_lines(fileobj)
   else:
-    _load(examples, fileobj)
+    lines = _iter_plain_lines(fileobj)
+
+  summaries = collections.OrderedDict()
+  for block_offset, line_offset, l in lines:
+    if not l.strip():
+      continue
+    json_example = json_utils.loads_fields(l, _SUMMARY_FIELDS)
+    if FLAGS.mode == 'long_answers' and not has_long_answer(json_example):
+      continue
+
+    elif FLAGS.mode == 'short_answers' and not has_short_answer(json_example):
+      continue
+
+    example_has_long_answer, example_has_short_answer = get_answer_flags(
+        json_example, dataset)
+    summary = ExampleSummary(
+        example_id=encode_example_id(json_example['example_id']),
+        url=json_example['document_url'],
+        title=json_example.get('document_title', 'Wikipedia'),
+        question_text=json_example['question_text'],
+        has_long_answer=example_has_long_answer,
+        has_short_answer=example_has_short_answer,
+        block_offset=block_offset,
+        line_offset=line_offset,
+        num_bytes=len(l))
+    summaries[summary.example_id] = summary
+
+    if len(summaries) == FLAGS.max_examples:
+      break
+
+  return summaries
+
+
+class ExampleCache(object):
+  """Thread safe LRU cache of `Example` objects, bounded by their size."""
+
+  def __init__(self, max_bytes):
+    self.max_bytes = max_bytes
+    self.num_bytes = 0
+    self._entries = collections.OrderedDict()
+    self._lock = threading.Lock()
+
+  def get(self, key):
+    """Returns the cached example for `key`, or None."""
+    with self._lock:
+      entry = self._entries.pop(key, None)
+      if entry is None:
+        return None
+      self._entries[key] = entry
+      return entry[0]
+
+  def put(self, key, example, num_bytes):
+    """Adds an example, evicting the least recently used ones if needed."""
+    with self._lock:
+      if key in self._entries:
+        return
+      self._entries[key] = (example, num_bytes)
+      self.num_bytes += num_bytes
+      # Always keep the most recent example, even if it exceeds the budget.
+      while self.num_bytes > self.max_bytes and len(self._entries) > 1:
+        _, (_, evicted_bytes) = self._entries.popitem(last=False)
+        self.num_bytes -= evicted_bytes
+
+
+class LazyExamples(object):
+  """Maps example ids to `Example` objects that are built on first request."""
+
+  def __init__(self, path, summaries, cache_bytes):
+    """Constructor.
 
-  return examples
+    Args:
+      path: Path of the jsonlines file that `summaries` were read from.
+      summaries: OrderedDict mapping example id to `ExampleSummary`.
+      cache_bytes: Budget of the example cache, in serialized json bytes.
+    """
+    self.path = path
+    self.summaries = summaries
+    self.cache = ExampleCache(cache_bytes)
+
+  def __len__(self):
+    return len(self.summaries)
+
+  def __contains__(self, example_id):
+    return example_id in self.summaries
+
+  def read_json_example(self, summary):
+    """Reads the serialized example for `summary` from the input file."""
+    with open(self.path, 'rb') as f:
+      if FLAGS.gzipped:
+        line = nq_index.read_line(f, summary.block_offset, summary.line_offset)
+      else:
+        f.seek(summary.block_offset)
+        line = f.readline()
+    return json_utils.loads(line)
+
+  def __getitem__(self, example_id):
+    summary = self.summaries[example_id]
+    example = self.cache.get(example_id)
+    if example is None:
+      example = Example(self.read_json_example(summary))
+      self.cache.put(example_id, example, summary.num_bytes)
+    return example
 
 
 class MainHandler(tornado.web.RequestHandler):
-  """Displays an overview table of the loaded NQ examples."""
+  """Displays an overview table of the indexed NQ examples."""
 
-  def initialize(self, jinja2_env, examples):
+  def initialize(self, jinja2_env, examples, executor):
     self.env = jinja2_env
     self.tmpl = self.env.get_template('index.html')
     self.examples = examples
-
-  def get(self):
-    res = self.tmpl.render(
-        dataset=FLAGS.dataset.capitalize(), examples=self.examples.values())
+    self.executor = executor
+
+  def num_pages(self):
+    return max(1, -(-len(self.examples) // FLAGS.page_size))
+
+  def render_page(self, page):
+    """Renders page `page`, which must be in [0, num_pages)."""
+    summaries = itertools.islice(self.examples.summaries.values(),
+                                 page * FLAGS.page_size,
+                                 (page + 1) * FLAGS.page_size)
+    return self.tmpl.render(
+        dataset=FLAGS.dataset.capitalize(),
+        examples=list(summaries),
+        page=page,
+        num_pages=self.num_pages())
+
+  async def get(self):
+    try:
+      page = int(self.get_argument('page', 0))
+    except ValueError:
+      raise tornado.web.HTTPError(400, 'page must be an integer')
+    page = min(max(page, 0), self.num_pages() - 1)
+    res = await tornado.ioloop.IOLoop.current().run_in_executor(
+        self.executor, self.render_page, page)
     self.write(res)
 
 
+def get_example(examples, example_id):
+  """Returns `examples[example_id]`, or raises a 404 error."""
+  if example_id not in examples:
+    raise tornado.web.HTTPError(404)
+  return examples[example_id]
+
+
 class HtmlHandler(tornado.web.RequestHandler):
   """Displays the html field contained in a NQ example."""
 
-  def initialize(self, examples):
+  def initialize(self, examples, executor):
     self.examples = examples
+    self.executor = executor
 
-  def get(self):
+  async def get(self):
     example_id = str(self.get_argument('example_id'))
-    self.write(self.examples[example_id].document_html)
+    example = await tornado.ioloop.IOLoop.current().run_in_executor(
+        self.executor, get_example, self.examples, example_id)
+    self.write(example.document_html)
 
 
 class FeaturesHandler(tornado.web.RequestHandler):
   """Displays a detailed view of the features extracted from a NQ example."""
 
-  def initialize(self, jinja2_env, examples):
+  def initialize(self, jinja2_env, examples, executor):
     self.env = jinja2_env
     self.tmpl = self.env.get_template('features.html')
     self.examples = examples
+    self.executor = executor
 
-  def get(self):
+  def render_example(self, example_id):
+    return self.tmpl.render(
+        dataset=FLAGS.dataset.capitalize(),
+        example=get_example(self.examples, example_id))
+
+  async def get(self):
     example_id = str(self.get_argument('example_id'))
-    res = self.tmpl.render(
-        dataset=FLAGS.dataset.capitalize(), example=self.examples[example_id])
+    res = await tornado.ioloop.IOLoop.current().run_in_executor(
+        self.executor, self.render_example, example_id)
     self.write(res)
 
 
 class NqServer(object):
-  """Serves all different tools."""
+  """Serves all different tools.
+
+    Requests are handled on Tornado's IOLoop. Parsing examples and rendering
+    templates happens in a thread pool, so that one large page does not block
+    other requests. Responses are gzip compressed.
+
+  """
 
   def __init__(self, web_path, examples):
-    """
+    """Constructor.
+
+    Args:
+      web_path: Directory containing the `templates` and `static` directories.
+      examples: `LazyExamples` to serve.
     """
     tmpl_path = web_path + '/templates'
     static_path = web_path + '/static'
     jinja2_env = jinja2.Environment(loader=jinja2.FileSystemLoader(tmpl_path))
+    executor = futures.ThreadPoolExecutor(FLAGS.num_render_threads)
 
-    self.application = tornado.wsgi.WSGIApplication([
+    self.application = tornado.web.Application([
         (r'/', MainHandler, {
             'jinja2_env': jinja2_env,
-            'examples': examples
+            'examples': examples,
+            'executor': executor
         }),
         (r'/html', HtmlHandler, {
-            'examples': examples
+            'examples': examples,
+            'executor': executor
         }),
         (r'/features', FeaturesHandler, {
             'jinja2_env': jinja2_env,
-            'examples': examples
+            'examples': examples,
+            'executor': executor
         }),
         (r'/static/(.*)', tornado.web.StaticFileHandler, {
             'path': static_path
         }),
-    ])
+    ], compress_response=True)
 
   def serve(self):
     """Main entry point for the NqSever."""
-    server = wsgiref.simple_server.make_server('', FLAGS.port, self.application)
-    server.serve_forever()
+    self.application.listen(FLAGS.port)
+    tornado.ioloop.IOLoop.current().start()
 
 
 def main(unused_argv):
-  with open(FLAGS.nq_jsonl) as fileobj:
-    examples = load_examples(fileobj)
+  with open(FLAGS.nq_jsonl, 'rb') as fileobj:
+    summaries = load_example_index(fileobj)
+  examples = LazyExamples(FLAGS.nq_jsonl, summaries, FLAGS.cache_bytes)
 
   web_path = os.path.dirname(os.path.realpath(__file__))
   NqServer(web_path, examples).serve()
@@ -27,7 +27,8 @@ r"""Official evaluation script for Natural Questions.
   if your model populates the score fields of the prediction JSON format.
 
   gold_path should point to the five way annotated dev data in the
-  original download format (gzipped jsonlines).
+  original download format (gzipped jsonlines), or to a gold store directory
+  written by make_gold_store.py.
 
   predictions_path should point to a json file containing the predictions in
   the format given below.
@@ -52,6 +53,10 @@ r"""Official evaluation script for Natural Questions.
     }, ... ]
   }
 
+  Predictions may also be given in JSON-lines files ending in `.jsonl` or
+  `.jsonl.gz`, with one prediction object per line. In this case,
+  predictions_path may be a glob pattern matching several shards.
+
   The prediction format mirrors the annotation format in defining each long or
   short answer span both in terms of byte offsets and token offsets. We do not
   expect participants to supply both.
@@ -94,30 +99,66 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+from collections import namedtuple
 from collections import OrderedDict
 import json
 import os
-import pickle
 from absl import app
 from absl import flags
 from absl import logging
+import batch_eval
+import bootstrap_eval
 import eval_utils as util
+import numpy as np
+import profiling
 import six
 
 flags.DEFINE_string(
     'gold_path', None, 'Path to the gzip JSON data. For '
     'multiple files, should be a glob '
     'pattern (e.g. "/path/to/files-*"')
-flags.DEFINE_string('predictions_path', None, 'Path to prediction JSON.')
+flags.DEFINE_string(
+    'predictions_path', None, 'Path to prediction JSON, or a glob pattern '
+    'matching JSON-lines prediction shards.')
 flags.DEFINE_bool(
     'cache_gold_data', False,
-    'Whether to cache gold data in Pickle format to speed up '
+    'Whether to cache gold data in a memory mapped columnar format to speed up '
     'multiple evaluations.')
 flags.DEFINE_integer('num_threads', 10, 'Number of threads for reading.')
 flags.DEFINE_bool('pretty_print', False, 'Whether to pretty print output.')
+flags.DEFINE_bool(
+    'vectorized_scoring', True,
+    'Whether to score all examples at once with NumPy arrays instead of '
+    'looping over examples in Python. The results are identical.')
+flags.DEFINE_integer(
+    'bootstrap_samples', 0,
+    'If positive, report bootstrap confidence intervals of the best threshold '
+    'and R@P metrics computed from this many replicates.')
+flags.DEFINE_integer('bootstrap_seed', 0, 'Random seed of the bootstrap.')
+flags.DEFINE_float('bootstrap_confidence', 0.95,
+                   'Coverage of the bootstrap confidence intervals.')
+flags.DEFINE_integer('bootstrap_workers', 1,
+                     'Number of processes computing bootstrap replicates.')
+flags.DEFINE_string(
+    'baseline_predictions_path', None,
+    'If set with --bootstrap_samples, also run a paired bootstrap test of '
+    'whether the predictions improve on these baseline predictions.')
+flags.DEFINE_string(
+    'profile_path', None,
+    'If set, write the wall time, CPU time, peak RSS and item counts of every '
+    'stage of the evaluation to this path as JSON, see profiling.py.')
+flags.DEFINE_string(
+    'profile_trace_path', None,
+    'If set, write the profiled stages to this path in the Chrome trace event '
+    'format.')
 
 FLAGS = flags.FLAGS
 
+# A precision/recall curve, with one entry per unique score threshold.
+PrCurve = namedtuple('PrCurve', [
+    'threshold', 'precision', 'recall', 'f1', 'num_correct', 'num_predicted'
+])
+
 
 def safe_divide(x, y):
   """Compute x / y, but return 0 if y is zero."""
@@ -249,6 +290,38 @@ def score_answers(gold_annotation_dict, pred_dict):
   return long_answer_stats, short_answer_stats
 
 
+# Flags read by `score_all_answers`, see `scoring_flag_values`.
+_SCORING_FLAGS = ('vectorized_scoring', 'long_non_null_threshold',
+                  'short_non_null_threshold')
+
+
+def scoring_flag_values():
+  """Returns the values of the flags read by `score_all_answers`."""
+  return dict([(name, FLAGS[name].value) for name in _SCORING_FLAGS])
+
+
+def set_scoring_flags(flag_values):
+  """Sets the flags of `scoring_flag_values` in a worker process.
+
+  Processes that are spawned rather than forked start with unparsed flags, so
+  pool initializers are given the values of this process explicitly.
+
+  Args:
+    flag_values: Dictionary returned by `scoring_flag_values`.
+  """
+  if not FLAGS.is_parsed():
+    FLAGS.mark_as_parsed()
+  for name, value in flag_values.items():
+    setattr(FLAGS, name, value)
+
+
+def score_all_answers(gold_annotation_dict, pred_dict):
+  """Scores all answers with the scorer selected by --vectorized_scoring."""
+  if FLAGS.vectorized_scoring:
+    return batch_eval.score_answers(gold_annotation_dict, pred_dict)
+  return score_answers(gold_annotation_dict, pred_dict)
+
+
 def compute_f1(answer_stats, prefix=''):
   """Computes F1, precision, recall for a list of answer scores.
 
@@ -290,67 +363,113 @@ def compute_final_f1(long_answer_stats, short_answer_stats):
   return scores
 
 
-def compute_pr_curves(answer_stats, targets=None):
+def compute_pr_curve_arrays(answer_stats, is_sorted=False):
+  """Computes the full PR curve, with one point per unique score threshold.
+
+  Predictions are sorted by decreasing score, and the point for a threshold
+  counts every prediction with a score >= the threshold, so that ties are
+  collapsed into a single point.
+
+  Arguments:
+    answer_stats: List of statistic tuples from the answer scores, or
+      `batch_eval.AnswerStatArrays`. Need not be sorted.
+    is_sorted (False): Whether `answer_stats` are already sorted by decreasing
+      score, in which case they are not sorted again.
+
+  Returns:
+    `PrCurve` of arrays, ordered by decreasing threshold.
+  """
+  has_gold, has_pred, is_correct, score = batch_eval.to_stat_arrays(
+      answer_stats)
+  has_gold = has_gold.astype(np.int64)
+  has_pred = has_pred.astype(np.int64)
+  is_correct = is_correct.astype(np.int64)
+
+  if not is_sorted:
+    order = np.argsort(-score, kind='stable')
+    score = score[order]
+    is_correct = is_correct[order]
+    has_pred = has_pred[order]
+  num_correct = np.cumsum(is_correct)
+  num_predicted = np.cumsum(has_pred)
+  total_has_gold = has_gold.sum()
+
+  # Keep the last row of each group of tied scores.
+  last = np.flatnonzero(np.append(score[1:] != score[:-1], True))[:len(score)]
+  num_correct = num_correct[last]
+  num_predicted = num_predicted[last]
+
+  precision = np.zeros(len(last))
+  np.divide(num_correct, num_predicted, out=precision, where=num_predicted > 0)
+  recall = np.zeros(len(last))
+  if total_has_gold:
+    recall = num_correct / total_has_gold
+  f1 = np.zeros(len(last))
+  np.divide(2 * precision * recall, precision + recall, out=f1,
+            where=(precision + recall) > 0)
+
+  return PrCurve(
+      threshold=score[last],
+      precision=precision,
+      recall=recall,
+      f1=f1,
+      num_correct=num_correct,
+      num_predicted=num_predicted)
+
+
+def compute_pr_curves(answer_stats, targets=None, is_sorted=False):
   """Computes PR curve and returns R@P for specific targets.
 
   The values are computed as follows: find the (precision, recall) point
   with maximum recall and where precision > target.
 
   Arguments:
-    answer_stats: List of statistic tuples from the answer scores.
+    answer_stats: List of statistic tuples from the answer scores, or
+      `batch_eval.AnswerStatArrays`.
     targets (None): List of precision thresholds to target.
+    is_sorted (False): See `compute_pr_curve_arrays`.
 
   Returns:
     List of table with rows: [target, r, p, score].
   """
-  total_correct = 0
-  total_has_pred = 0
-  total_has_gold = 0
-
-  # Count the number of gold annotations.
-  for has_gold, _, _, _ in answer_stats:
-    total_has_gold += has_gold
-
-  # Keep track of the point of maximum recall for each target.
-  max_recall = [0 for _ in targets]
-  max_precision = [0 for _ in targets]
-  max_scores = [None for _ in targets]
-
-  # Only keep track of unique thresholds in this dictionary.
-  scores_to_stats = OrderedDict()
-
-  # Loop through every possible threshold and compute precision + recall.
-  for has_gold, has_pred, is_correct, score in answer_stats:
-    total_correct += is_correct
-    total_has_pred += has_pred
-
-    precision = safe_divide(total_correct, total_has_pred)
-    recall = safe_divide(total_correct, total_has_gold)
-
-    # If there are any ties, this will be updated multiple times until the
-    # ties are all counted.
-    scores_to_stats[score] = [precision, recall]
+  targets = list(targets or [])
+  curve = compute_pr_curve_arrays(answer_stats, is_sorted)
 
   best_f1 = 0.0
   best_precision = 0.0
   best_recall = 0.0
   best_threshold = 0.0
-
-  for threshold, (precision, recall) in six.iteritems(scores_to_stats):
-    # Match the thresholds to the find the closest precision above some target.
-    for t, target in enumerate(targets):
-      if precision >= target and recall > max_recall[t]:
-        max_recall[t] = recall
-        max_precision[t] = precision
-        max_scores[t] = threshold
-
-    # Compute optimal threshold.
-    f1 = safe_divide(2 * precision * recall, precision + recall)
-    if f1 > best_f1:
-      best_f1 = f1
-      best_precision = precision
-      best_recall = recall
-      best_threshold = threshold
+  if len(curve.f1) and curve.f1.max() > 0:
+    # Ties are broken by the highest threshold.
+    i = np.argmax(curve.f1)
+    best_f1 = curve.f1[i].item()
+    best_precision = curve.precision[i].item()
+    best_recall = curve.recall[i].item()
+    best_threshold = curve.threshold[i].item()
+
+  # For each target, find the lowest threshold with precision >= target. Recall
+  # is non-decreasing as the threshold decreases, so this point has the maximum
+  # recall. Precision is non-increasing while recall is constant, so the
+  # highest threshold with the same recall also satisfies the target.
+  max_recall = [0 for _ in targets]
+  max_precision = [0 for _ in targets]
+  max_scores = [None for _ in targets]
+  if targets and len(curve.precision):
+    by_precision = np.argsort(-curve.precision, kind='stable')
+    lowest_threshold = np.maximum.accumulate(by_precision)
+    num_above = np.searchsorted(-curve.precision[by_precision],
+                                -np.asarray(targets, dtype=np.float64),
+                                side='right')
+    for t, k in enumerate(num_above.tolist()):
+      if not k:
+        continue
+      j = lowest_threshold[k - 1]
+      if curve.recall[j] <= 0:
+        continue
+      j = np.searchsorted(curve.num_correct, curve.num_correct[j], side='left')
+      max_recall[t] = curve.recall[j].item()
+      max_precision[t] = curve.precision[j].item()
+      max_scores[t] = curve.threshold[j].item()
 
   return ((best_f1, best_precision, best_recall, best_threshold),
           list(zip(targets, max_recall, max_precision, max_scores)))
@@ -369,34 +488,53 @@ def print_r_at_p_table(answer_stats):
         target, recall, precision, row))
 
 
-def get_metrics_as_dict(gold_path, prediction_path, num_threads=10):
+def get_metrics_as_dict(gold_path, prediction_path, num_threads=10,
+                        profiler=None):
   """Library version of the end-to-end evaluation.
 
   Arguments:
     gold_path: Path to the gzip JSON data. For multiple files, should be a glob
-      pattern (e.g. "/path/to/files-*")
+      pattern (e.g. "/path/to/files-*"). May also be a gold store directory.
     prediction_path: Path to the JSON prediction data.
     num_threads (10): Number of threads to use when parsing multiple files.
+    profiler (None): Optional `profiling.Profiler` recording the stages of the
+      evaluation.
 
   Returns:
     metrics: A dictionary mapping string names to metric scores.
   """
+  profiler = profiling.ensure(profiler)
+  with profiler.stage('read_gold'):
+    nq_gold_dict = util.read_gold(
+        gold_path, n_threads=num_threads, profiler=profiler)
+  with profiler.stage('read_predictions') as counts:
+    nq_pred_dict = util.read_prediction_json(prediction_path)
+    counts['predictions'] = len(nq_pred_dict)
+  with profiler.stage('score', predictions=len(nq_pred_dict)):
+    long_answer_stats, short_answer_stats = score_all_answers(
+        nq_gold_dict, nq_pred_dict)
+  with profiler.stage('compute_metrics'):
+    return get_metrics_with_answer_stats(long_answer_stats,
+                                         short_answer_stats)
+
+
+def get_metrics_with_answer_stats(long_answer_stats, short_answer_stats,
+                                  is_sorted=False):
+  """Generate metrics dict using long and short answer stats.
 
-  nq_gold_dict = util.read_annotation(gold_path, n_threads=num_threads)
-  nq_pred_dict = util.read_prediction_json(prediction_path)
-  long_answer_stats, short_answer_stats = score_answers(nq_gold_dict,
-                                                        nq_pred_dict)
-
-  return get_metrics_with_answer_stats(long_answer_stats, short_answer_stats)
-
+  Arguments:
+    long_answer_stats: Answer stats of the long answers.
+    short_answer_stats: Answer stats of the short answers.
+    is_sorted (False): See `compute_pr_curve_arrays`.
 
-def get_metrics_with_answer_stats(long_answer_stats, short_answer_stats):
-  """Generate metrics dict using long and short answer stats."""
+  Returns:
+    Dictionary mapping metric names to values.
+  """
 
   def _get_metric_dict(answer_stats, prefix=''):
     """Compute all metrics for a set of answer statistics."""
     opt_result, pr_table = compute_pr_curves(
-        answer_stats, targets=[0.5, 0.75, 0.9])
+        answer_stats, targets=[0.5, 0.75, 0.9], is_sorted=is_sorted)
     f1, precision, recall, threshold = opt_result
     metrics = OrderedDict({
         'best-threshold-f1': f1,
@@ -416,44 +554,128 @@ def get_metrics_with_answer_stats(long_answer_stats, short_answer_stats):
   return metrics
 
 
+def get_bootstrap_metrics(nq_gold_dict, nq_pred_dict, baseline_pred_dict=None):
+  """Computes bootstrap confidence intervals, and optionally paired tests.
+
+  Arguments:
+    nq_gold_dict: Gold annotations.
+    nq_pred_dict: Predictions.
+    baseline_pred_dict (None): Baseline predictions to compare against.
+
+  Returns:
+    Dictionary mapping metric names, e.g. `long-best-threshold-f1-ci-low` or
+    `long-best-threshold-f1-p-value`, to values.
+  """
+  kwargs = {
+      'num_samples': FLAGS.bootstrap_samples,
+      'seed': FLAGS.bootstrap_seed,
+      'num_workers': FLAGS.bootstrap_workers,
+      'confidence': FLAGS.bootstrap_confidence,
+  }
+  system = batch_eval.score_answer_arrays(nq_gold_dict, nq_pred_dict)
+  baseline = None
+  if baseline_pred_dict is not None:
+    baseline = batch_eval.score_answer_arrays(nq_gold_dict, baseline_pred_dict)
+
+  metrics = OrderedDict()
+  for i, prefix in enumerate(['long-', 'short-']):
+    intervals = bootstrap_eval.confidence_intervals(system[i], **kwargs)
+    for name, (low, high) in six.iteritems(intervals):
+      metrics[prefix + name + '-ci-low'] = low
+      metrics[prefix + name + '-ci-high'] = high
+    if baseline is not None:
+      tests = bootstrap_eval.paired_bootstrap_test(system[i], baseline[i],
+                                                   **kwargs)
+      for name, result in six.iteritems(tests):
+        for key, value in six.iteritems(result):
+          metrics[prefix + name + '-' + key] = value
+  return metrics
+
+
 def main(_):
-  cache_path = os.path.join(os.path.dirname(FLAGS.gold_path), 'cache')
-  if FLAGS.cache_gold_data and os.path.exists(cache_path):
-    logging.info('Reading from cache: %s', format(cache_path))
-    nq_gold_dict = pickle.load(open(cache_path, 'r'))
-  else:
-    nq_gold_dict = util.read_annotation(
-        FLAGS.gold_path, n_threads=FLAGS.num_threads)
-    if FLAGS.cache_gold_data:
-      logging.info('Caching gold data for next time to: %s', format(cache_path))
-      pickle.dump(nq_gold_dict, open(cache_path, 'w'))
-
-  nq_pred_dict = util.read_prediction_json(FLAGS.predictions_path)
-
-  long_answer_stats, short_answer_stats = score_answers(nq_gold_dict,
-                                                        nq_pred_dict)
-
-  if FLAGS.pretty_print:
-    print('*' * 20)
-    print('LONG ANSWER R@P TABLE:')
-    print_r_at_p_table(long_answer_stats)
-    print('*' * 20)
-    print('SHORT ANSWER R@P TABLE:')
-    print_r_at_p_table(short_answer_stats)
-
-    scores = compute_final_f1(long_answer_stats, short_answer_stats)
-    print('*' * 20)
-    print('METRICS IGNORING SCORES (n={}):'.format(scores['long-answer-n']))
-    print('              F1     /  P      /  R')
-    print('Long answer  {: >7.2%} / {: >7.2%} / {: >7.2%}'.format(
-        scores['long-answer-f1'], scores['long-answer-precision'],
-        scores['long-answer-recall']))
-    print('Short answer {: >7.2%} / {: >7.2%} / {: >7.2%}'.format(
-        scores['short-answer-f1'], scores['short-answer-precision'],
-        scores['short-answer-recall']))
-  else:
-    metrics = get_metrics_with_answer_stats(long_answer_stats,
-                                            short_answer_stats)
+  profiler = None
+  if FLAGS.profile_path or FLAGS.profile_trace_path:
+    profiler = profiling.Profiler()
+  try:
+    evaluate(profiling.ensure(profiler))
+  finally:
+    if FLAGS.profile_path:
+      profiler.write_report(FLAGS.profile_path)
+    if FLAGS.profile_trace_path:
+      profiler.write_chrome_trace(FLAGS.profile_trace_path)
+
+
+def evaluate(profiler):
+  """Runs the evaluation configured by the flags, recording its stages."""
+  cache_path = os.path.join(os.path.dirname(FLAGS.gold_path), 'gold_cache')
+  with profiler.stage('read_gold'):
+    if FLAGS.cache_gold_data and util.is_gold_store(cache_path):
+      logging.info('Reading from cache: %s', format(cache_path))
+      nq_gold_dict = util.read_gold(cache_path, profiler=profiler)
+    else:
+      nq_gold_dict = util.read_gold(
+          FLAGS.gold_path, n_threads=FLAGS.num_threads, profiler=profiler)
+      if FLAGS.cache_gold_data and not util.is_gold_store(FLAGS.gold_path):
+        logging.info('Caching gold data for next time to: %s',
+                     format(cache_path))
+        try:
+          nq_gold_dict.save(cache_path)
+        except OSError:
+          # Another evaluation filled the cache first.
+          if not util.is_gold_store(cache_path):
+            raise
+          logging.info('Reusing the cache written meanwhile: %s', cache_path)
+          nq_gold_dict = util.read_gold(cache_path, profiler=profiler)
+
+  with profiler.stage('read_predictions') as counts:
+    nq_pred_dict = util.read_prediction_json(FLAGS.predictions_path)
+    counts['predictions'] = len(nq_pred_dict)
+
+  with profiler.stage('score', predictions=len(nq_pred_dict)):
+    long_answer_stats, short_answer_stats = score_all_answers(
+        nq_gold_dict, nq_pred_dict)
+
+  with profiler.stage('compute_metrics'):
+    if FLAGS.pretty_print:
+      print('*' * 20)
+      print('LONG ANSWER R@P TABLE:')
+      print_r_at_p_table(long_answer_stats)
+      print('*' * 20)
+      print('SHORT ANSWER R@P TABLE:')
+      print_r_at_p_table(short_answer_stats)
+
+      scores = compute_final_f1(long_answer_stats, short_answer_stats)
+      print('*' * 20)
+      print('METRICS IGNORING SCORES (n={}):'.format(scores['long-answer-n']))
+      print('              F1     /  P      /  R')
+      print('Long answer  {: >7.2%} / {: >7.2%} / {: >7.2%}'.format(
+          scores['long-answer-f1'], scores['long-answer-precision'],
+          scores['long-answer-recall']))
+      print('Short answer {: >7.2%} / {: >7.2%} / {: >7.2%}'.format(
+          scores['short-answer-f1'], scores['short-answer-precision'],
+          scores['short-answer-recall']))
+    else:
+      metrics = get_metrics_with_answer_stats(long_answer_stats,
+                                              short_answer_stats)
+
+  if FLAGS.bootstrap_samples > 0:
+    with profiler.stage('bootstrap', samples=FLAGS.bootstrap_samples):
+      baseline_pred_dict = None
+      if FLAGS.baseline_predictions_path:
+        baseline_pred_dict = util.read_prediction_json(
+            FLAGS.baseline_predictions_path)
+      bootstrap_metrics = get_bootstrap_metrics(nq_gold_dict, nq_pred_dict,
+                                                baseline_pred_dict)
+    if FLAGS.pretty_print:
+      print('*' * 20)
+      print('BOOTSTRAP ({} samples, {:.0%} confidence):'.format(
+          FLAGS.bootstrap_samples, FLAGS.bootstrap_confidence))
+      for name, value in six.iteritems(bootstrap_metrics):
+        print('{}: {:.4f}'.format(name, value))
+    else:
+      metrics.update(bootstrap_metrics)
+
+  if not FLAGS.pretty_print:
     print(json.dumps(metrics))
 
 
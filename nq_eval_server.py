@@ -0,0 +1,269 @@
+# coding=utf-8
+# Copyright 2018 The Google AI Language Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+r"""Long running evaluator, which keeps the gold data in memory.
+
+Example usage:
+
+  nq_eval_server --gold_sets=dev=/path/to/nq-dev-??.jsonl.gz \
+    --unix_socket=/tmp/nq_eval.sock
+
+The gold sets are loaded once at startup. Predictions are then scored by
+POSTing them to `/evaluate`, either as the request body:
+
+  curl --unix-socket /tmp/nq_eval.sock --data-binary @predictions.json \
+    'http://localhost/evaluate?gold=dev'
+
+or as a path that the server can read:
+
+  curl --unix-socket /tmp/nq_eval.sock -X POST \
+    'http://localhost/evaluate?gold=dev&predictions_path=/path/to/preds.json'
+
+The response is the JSON dictionary of `nq_eval.get_metrics_with_answer_stats`.
+Bodies are read as JSON lines if `format=jsonl` is given, and as the
+`{"predictions": [...]}` JSON of nq_eval otherwise. `GET /gold` lists the
+loaded gold sets.
+
+Request bodies are streamed to a temporary file as they arrive, instead of
+being buffered in memory, and are limited to --max_body_size bytes. Requests
+are scored concurrently by --num_workers processes, which open the gold sets
+as memory mapped gold stores, so they share the gold data with each other
+whether they are forked or spawned. Gold sets that are not gold store
+directories, see make_gold_store.py, are saved to a temporary directory while
+the server runs. The latency of an evaluation is the time it takes to read
+and score the predictions.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+from concurrent import futures
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+from absl import app
+from absl import flags
+from absl import logging
+import eval_utils as util
+import nq_eval as ev
+import tornado.httpserver
+import tornado.ioloop
+import tornado.netutil
+import tornado.web
+
+FLAGS = flags.FLAGS
+
+
+def define_flags():
+  """Defines the flags of the server.
+
+  They are defined only when the module is run, so that the server can be
+  imported by tests and by other scripts that define flags of the same name.
+  """
+  flags.DEFINE_string(
+      'gold_sets', None, 'Comma separated list of name=path gold sets to load. '
+      'Defaults to --gold_path, named `default`.')
+  flags.DEFINE_integer('port', 8889, 'Port to listen on.')
+  flags.DEFINE_string('unix_socket', None,
+                      'Listen on this Unix socket instead of --port.')
+  flags.DEFINE_integer('num_workers', multiprocessing.cpu_count(),
+                       'Number of processes scoring predictions.')
+  flags.DEFINE_integer(
+      'max_body_size', 1 << 34,
+      'Largest request body accepted, in bytes. Bodies are streamed to disk, '
+      'so this does not bound the memory used by the server.')
+
+
+# Gold sets used by `evaluate`, set by `init_worker`.
+_GOLD_SETS = None
+
+
+def init_worker(gold_store_paths, flag_values):
+  """Opens the gold stores and sets the scoring flags of a worker process.
+
+  Args:
+    gold_store_paths: Dictionary from gold set name to gold store directory.
+    flag_values: `nq_eval.scoring_flag_values` of the server.
+  """
+  global _GOLD_SETS
+  ev.set_scoring_flags(flag_values)
+  _GOLD_SETS = dict([(name, util.load_gold_store(path))
+                     for name, path in gold_store_paths.items()])
+
+
+def parse_gold_sets(gold_sets, gold_path):
+  """Returns an OrderedDict mapping gold set name to path.
+
+  Args:
+    gold_sets: Value of --gold_sets, or None.
+    gold_path: Value of --gold_path, loaded as `default` without --gold_sets.
+
+  Raises:
+    ValueError: If neither flag is set, or a gold set is not name=path.
+  """
+  if not gold_sets:
+    if not gold_path:
+      raise ValueError('Either --gold_sets or --gold_path must be set.')
+    return collections.OrderedDict([('default', gold_path)])
+  paths = collections.OrderedDict()
+  for gold_set in gold_sets.split(','):
+    name, sep, path = gold_set.partition('=')
+    if not sep or not name or not path:
+      raise ValueError('Expected name=path, got: %s' % gold_set)
+    paths[name.strip()] = path.strip()
+  return paths
+
+
+def evaluate(gold_name, predictions_path):
+  """Returns the metrics of predictions on the gold set `gold_name`.
+
+  Args:
+    gold_name: Name of a gold set loaded by `init_worker`.
+    predictions_path: Prediction file, read as JSON lines if it ends in
+      `.jsonl`, see `eval_utils.iter_predictions`.
+  """
+  nq_pred_dict = util.read_prediction_json(predictions_path)
+  long_answer_stats, short_answer_stats = ev.score_all_answers(
+      _GOLD_SETS[gold_name], nq_pred_dict)
+  return ev.get_metrics_with_answer_stats(long_answer_stats,
+                                          short_answer_stats)
+
+
+class GoldHandler(tornado.web.RequestHandler):
+  """Lists the loaded gold sets and their number of examples."""
+
+  def initialize(self, gold_sets):
+    self.gold_sets = gold_sets
+
+  def get(self):
+    self.write(dict([(name, len(gold))
+                     for name, gold in self.gold_sets.items()]))
+
+
+@tornado.web.stream_request_body
+class EvaluateHandler(tornado.web.RequestHandler):
+  """Scores the predictions of a request.
+
+    The body is written to a temporary file as it is received, and the file
+    is read by the worker that scores it.
+
+  """
+
+  def initialize(self, gold_sets, executor):
+    self.gold_sets = gold_sets
+    self.executor = executor
+    self.body_file = None
+
+  def prepare(self):
+    self.gold_name = self.get_argument('gold', None)
+    if self.gold_name is None and len(self.gold_sets) == 1:
+      self.gold_name = list(self.gold_sets.keys())[0]
+    if self.gold_name not in self.gold_sets:
+      raise tornado.web.HTTPError(404, 'Unknown gold set: %s' % self.gold_name)
+    self.predictions_path = self.get_argument('predictions_path', None)
+    if not self.predictions_path:
+      # The suffix selects the reader of `eval_utils.iter_predictions`.
+      suffix = '.jsonl' if self.get_argument('format',
+                                             'json') == 'jsonl' else '.json'
+      self.body_file = tempfile.NamedTemporaryFile(
+          prefix='nq_eval_server-', suffix=suffix, delete=False)
+      self.predictions_path = self.body_file.name
+
+  def data_received(self, chunk):
+    if self.body_file is not None:
+      self.body_file.write(chunk)
+
+  async def post(self):
+    if self.body_file is not None:
+      self.body_file.close()
+    try:
+      metrics = await tornado.ioloop.IOLoop.current().run_in_executor(
+          self.executor, evaluate, self.gold_name, self.predictions_path)
+    except (IOError, ValueError, KeyError) as e:
+      # Malformed or incomplete predictions, see `nq_eval.score_answers`.
+      self.set_status(400)
+      self.write({'error': '%s: %s' % (type(e).__name__, e)})
+      return
+    self.set_header('Content-Type', 'application/json')
+    self.write(json.dumps(metrics))
+
+  def on_finish(self):
+    self._remove_body_file()
+
+  def on_connection_close(self):
+    self._remove_body_file()
+
+  def _remove_body_file(self):
+    if self.body_file is not None:
+      self.body_file.close()
+      os.remove(self.body_file.name)
+      self.body_file = None
+
+
+def make_application(gold_sets, executor):
+  """Returns the Tornado application serving `gold_sets`."""
+  return tornado.web.Application([
+      (r'/gold', GoldHandler, {
+          'gold_sets': gold_sets
+      }),
+      (r'/evaluate', EvaluateHandler, {
+          'gold_sets': gold_sets,
+          'executor': executor
+      }),
+  ])
+
+
+def main(_):
+  gold_paths = parse_gold_sets(FLAGS.gold_sets, FLAGS.gold_path)
+  gold_sets = collections.OrderedDict()
+  gold_store_paths = {}
+  temp_dir = tempfile.mkdtemp(prefix='nq_eval_server-')
+  try:
+    for name, path in gold_paths.items():
+      gold_sets[name] = util.read_gold(path, n_threads=FLAGS.num_threads)
+      logging.info('Loaded gold set %s: %d examples.', name,
+                   len(gold_sets[name]))
+      if util.is_gold_store(path):
+        gold_store_paths[name] = path
+      else:
+        gold_store_paths[name] = os.path.join(temp_dir, 'gold-%d' %
+                                              len(gold_store_paths))
+        gold_sets[name].save(gold_store_paths[name])
+
+    executor = futures.ProcessPoolExecutor(
+        max(1, FLAGS.num_workers),
+        initializer=init_worker,
+        initargs=(gold_store_paths, ev.scoring_flag_values()))
+    server = tornado.httpserver.HTTPServer(
+        make_application(gold_sets, executor),
+        max_body_size=FLAGS.max_body_size)
+    if FLAGS.unix_socket:
+      server.add_socket(tornado.netutil.bind_unix_socket(FLAGS.unix_socket))
+      logging.info('Listening on %s', FLAGS.unix_socket)
+    else:
+      server.listen(FLAGS.port)
+      logging.info('Listening on port %d', FLAGS.port)
+    tornado.ioloop.IOLoop.current().start()
+  finally:
+    shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+  define_flags()
+  app.run(main)
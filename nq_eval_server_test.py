@@ -0,0 +1,118 @@
+# coding=utf-8
+# Copyright 2018 The Google AI Language Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Testing code for nq_eval_server."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+from concurrent import futures
+import json
+import os
+import random
+import tempfile
+
+import eval_utils as util
+import nq_eval as ev
+import nq_eval_server
+import tensorflow.compat.v1 as tf
+import test_utils
+import tornado.testing
+
+
+class NqEvalServerTest(tornado.testing.AsyncHTTPTestCase, tf.test.TestCase):
+
+  def get_app(self):
+    rng = random.Random(0)
+    self.temp_dir = tempfile.mkdtemp(dir=self.get_temp_dir())
+    self.gold_path = os.path.join(self.temp_dir, 'nq-dev-00.jsonl.gz')
+    test_utils.write_random_gold(self.gold_path, rng, 30)
+    self.predictions_path = os.path.join(self.temp_dir, 'predictions.json')
+    self.predictions = test_utils.write_random_predictions(
+        self.predictions_path, rng, 30)
+    self.expected = ev.get_metrics_as_dict(
+        self.gold_path, self.predictions_path, num_threads=1)
+
+    gold_store_path = os.path.join(self.temp_dir, 'gold_store')
+    util.read_gold(self.gold_path, n_threads=1).save(gold_store_path)
+    gold_sets = collections.OrderedDict([
+        ('dev', util.load_gold_store(gold_store_path))])
+    self.executor = futures.ProcessPoolExecutor(
+        1,
+        initializer=nq_eval_server.init_worker,
+        initargs=({'dev': gold_store_path}, ev.scoring_flag_values()))
+    return nq_eval_server.make_application(gold_sets, self.executor)
+
+  def tearDown(self):
+    self.executor.shutdown()
+    super(NqEvalServerTest, self).tearDown()
+
+  def evaluate(self, query, body=b''):
+    response = self.fetch('/evaluate?' + query, method='POST', body=body)
+    return response.code, json.loads(response.body)
+
+  def testParseGoldSets(self):
+    self.assertEqual(
+        nq_eval_server.parse_gold_sets('dev=a/*.gz, train = b', None),
+        collections.OrderedDict([('dev', 'a/*.gz'), ('train', 'b')]))
+    self.assertEqual(nq_eval_server.parse_gold_sets(None, 'c'),
+                     {'default': 'c'})
+    with self.assertRaisesRegex(ValueError, '--gold_path'):
+      nq_eval_server.parse_gold_sets(None, None)
+    with self.assertRaisesRegex(ValueError, 'name=path'):
+      nq_eval_server.parse_gold_sets('dev', None)
+
+  def testGold(self):
+    response = self.fetch('/gold')
+    self.assertEqual(json.loads(response.body), {'dev': 30})
+
+  def testEvaluateBody(self):
+    code, metrics = self.evaluate(
+        'gold=dev', json.dumps({'predictions': self.predictions}))
+    self.assertEqual(code, 200)
+    self.assertEqual(metrics, self.expected)
+
+    code, metrics = self.evaluate(
+        'format=jsonl', '\n'.join(json.dumps(p) for p in self.predictions))
+    self.assertEqual(code, 200)
+    self.assertEqual(metrics, self.expected)
+
+  def testEvaluatePath(self):
+    code, metrics = self.evaluate('predictions_path=' + self.predictions_path)
+    self.assertEqual(code, 200)
+    self.assertEqual(metrics, self.expected)
+
+  def testErrors(self):
+    response = self.fetch('/evaluate?gold=test', method='POST', body=b'{}')
+    self.assertEqual(response.code, 404)
+
+    code, result = self.evaluate('gold=dev', b'{"predictions": [')
+    self.assertEqual(code, 400)
+    self.assertIn('error', result)
+
+    code, result = self.evaluate(
+        'gold=dev', json.dumps({'predictions': self.predictions[1:]}))
+    self.assertEqual(code, 400)
+    self.assertIn('example ids', result['error'])
+
+    code, result = self.evaluate(
+        'predictions_path=' + os.path.join(self.temp_dir, 'missing.json'))
+    self.assertEqual(code, 400)
+    self.assertIn('missing.json', result['error'])
+
+
+if __name__ == '__main__':
+  tf.test.main()
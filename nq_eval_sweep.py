@@ -0,0 +1,181 @@
+# coding=utf-8
+# Copyright 2018 The Google AI Language Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+r"""Evaluates many prediction files against a single load of the gold data.
+
+Example usage:
+
+  nq_eval_sweep --gold_path=<path-to-gold-files> \
+    --predictions_glob='/path/to/ckpt-*/predictions.json' \
+    --output_path=metrics.jsonl
+
+The gold data is read once, and the prediction files are scored in parallel
+by --num_workers processes. The workers open the gold data as a memory mapped
+gold store, so they share its pages with each other instead of each getting a
+pickled copy. If --gold_path is not already a gold store directory, see
+make_gold_store.py, it is written to a temporary directory for the duration
+of the sweep. One row of `nq_eval.get_metrics_with_answer_stats` metrics is
+written per prediction file, as JSON lines or CSV, in the sorted order of the
+paths.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+import csv
+import glob
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+
+from absl import app
+from absl import flags
+from absl import logging
+import eval_utils as util
+import nq_eval as ev
+
+FLAGS = flags.FLAGS
+
+
+def define_flags():
+  """Defines the flags of the sweep.
+
+  nq_eval_server and sliced_eval also define `num_workers` and `output_path`,
+  so the flags are only defined when the sweep is run as a script.
+  """
+  flags.DEFINE_string(
+      'predictions_glob', None, 'Comma separated list of prediction files or '
+      'glob patterns matching prediction files.')
+  flags.DEFINE_string('output_path', None,
+                      'Path to write metrics to. Defaults to stdout.')
+  flags.DEFINE_enum('output_format', 'jsonl', ['jsonl', 'csv'],
+                    'Format of the metrics rows.')
+  flags.DEFINE_integer('num_workers', multiprocessing.cpu_count(),
+                       'Number of processes scoring prediction files.')
+
+
+# Gold annotations used by `evaluate_predictions`, set by `_init_worker`.
+_GOLD = None
+
+
+def _init_worker(gold_store_path, flag_values):
+  """Opens the gold store and sets the scoring flags of a worker process."""
+  global _GOLD
+  ev.set_scoring_flags(flag_values)
+  _GOLD = util.load_gold_store(gold_store_path)
+
+
+def evaluate_predictions(predictions_path):
+  """Returns the metrics row for one prediction file."""
+  nq_pred_dict = util.read_prediction_json(predictions_path)
+  long_answer_stats, short_answer_stats = ev.score_all_answers(
+      _GOLD, nq_pred_dict)
+  metrics = ev.get_metrics_with_answer_stats(long_answer_stats,
+                                             short_answer_stats)
+  row = collections.OrderedDict([('predictions_path', predictions_path)])
+  row.update(sorted(metrics.items()))
+  return row
+
+
+def expand_prediction_paths(predictions_glob):
+  """Returns the sorted prediction files matching comma separated globs."""
+  paths = set()
+  for pattern in predictions_glob.split(','):
+    matches = glob.glob(pattern.strip())
+    if not matches:
+      raise IOError('No prediction files match: %s' % pattern)
+    paths.update(matches)
+  return sorted(paths)
+
+
+def sweep(nq_gold_dict, prediction_paths, num_workers, gold_store_path=None):
+  """Scores every prediction file against the same gold annotations.
+
+  Args:
+    nq_gold_dict: `eval_utils.GoldStore` of the gold annotations, as returned
+      by `eval_utils.read_gold`.
+    prediction_paths: List of prediction files.
+    num_workers: Number of processes. With 1, files are scored in this
+      process.
+    gold_store_path (None): Gold store directory that `nq_gold_dict` was
+      loaded from, if any. Otherwise, the workers open a copy of
+      `nq_gold_dict` saved to a temporary directory.
+
+  Yields:
+    Metrics rows in the order of `prediction_paths`.
+  """
+  global _GOLD
+  if num_workers <= 1:
+    _GOLD = nq_gold_dict
+    for path in prediction_paths:
+      yield evaluate_predictions(path)
+    return
+
+  temp_dir = None
+  if gold_store_path is None:
+    temp_dir = tempfile.mkdtemp()
+    gold_store_path = os.path.join(temp_dir, 'gold_store')
+    nq_gold_dict.save(gold_store_path)
+  try:
+    pool = multiprocessing.Pool(
+        num_workers,
+        initializer=_init_worker,
+        initargs=(gold_store_path, ev.scoring_flag_values()))
+    try:
+      for row in pool.imap(evaluate_predictions, prediction_paths):
+        yield row
+    finally:
+      pool.close()
+      pool.join()
+  finally:
+    if temp_dir is not None:
+      shutil.rmtree(temp_dir)
+
+
+def main(_):
+  prediction_paths = expand_prediction_paths(FLAGS.predictions_glob)
+  nq_gold_dict = util.read_gold(FLAGS.gold_path, n_threads=FLAGS.num_threads)
+  gold_store_path = None
+  if util.is_gold_store(FLAGS.gold_path):
+    gold_store_path = FLAGS.gold_path
+  logging.info('Scoring %d prediction files.', len(prediction_paths))
+
+  f = open(FLAGS.output_path, 'w') if FLAGS.output_path else sys.stdout
+  try:
+    writer = None
+    for row in sweep(nq_gold_dict, prediction_paths, FLAGS.num_workers,
+                     gold_store_path=gold_store_path):
+      if FLAGS.output_format == 'csv':
+        if writer is None:
+          writer = csv.DictWriter(f, fieldnames=list(row.keys()))
+          writer.writeheader()
+        writer.writerow(row)
+      else:
+        f.write(json.dumps(row) + '\n')
+      f.flush()
+  finally:
+    if f is not sys.stdout:
+      f.close()
+
+
+if __name__ == '__main__':
+  define_flags()
+  flags.mark_flag_as_required('gold_path')
+  flags.mark_flag_as_required('predictions_glob')
+  app.run(main)
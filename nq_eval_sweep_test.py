@@ -0,0 +1,60 @@
+# coding=utf-8
+# Copyright 2018 The Google AI Language Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Testing code for nq_eval_sweep."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import random
+
+import eval_utils as util
+import nq_eval as ev
+import nq_eval_sweep
+import tensorflow.compat.v1 as tf
+import test_utils
+
+
+class NqEvalSweepTest(tf.test.TestCase):
+
+  def testSweepMatchesNqEval(self):
+    """Every row has the metrics of one nq_eval run on its file."""
+    rng = random.Random(0)
+    gold_path = os.path.join(self.get_temp_dir(), 'nq-dev-00.jsonl.gz')
+    test_utils.write_random_gold(gold_path, rng, 50)
+
+    prediction_paths = []
+    for i in range(3):
+      path = os.path.join(self.get_temp_dir(), 'predictions-%d.json' % i)
+      test_utils.write_random_predictions(path, rng, 50)
+      prediction_paths.append(path)
+
+    expected = [ev.get_metrics_as_dict(gold_path, path, num_threads=1)
+                for path in prediction_paths]
+    nq_gold_dict = util.read_gold(gold_path, n_threads=1)
+    store_path = os.path.join(self.get_temp_dir(), 'gold_store')
+    nq_gold_dict.save(store_path)
+    for num_workers, gold_store_path in [(1, None), (2, None),
+                                         (2, store_path)]:
+      rows = list(nq_eval_sweep.sweep(nq_gold_dict, prediction_paths,
+                                      num_workers, gold_store_path))
+      self.assertEqual([row.pop('predictions_path') for row in rows],
+                       prediction_paths)
+      self.assertEqual(rows, expected)
+
+
+if __name__ == '__main__':
+  tf.test.main()
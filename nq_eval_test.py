@@ -18,9 +18,50 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+from collections import OrderedDict
+import os
+import random
+from unittest import mock
+
+from absl.testing import flagsaver
 import eval_utils as util
 import nq_eval as ev
+import profiling
 import tensorflow.compat.v1 as tf
+import test_utils
+
+
+def reference_compute_pr_curves(answer_stats, targets):
+  """Original tuple-by-tuple implementation of `compute_pr_curves`."""
+  total_correct = 0
+  total_has_pred = 0
+  total_has_gold = sum([has_gold for has_gold, _, _, _ in answer_stats])
+
+  max_recall = [0 for _ in targets]
+  max_precision = [0 for _ in targets]
+  max_scores = [None for _ in targets]
+
+  scores_to_stats = OrderedDict()
+  for _, has_pred, is_correct, score in answer_stats:
+    total_correct += is_correct
+    total_has_pred += has_pred
+    precision = ev.safe_divide(total_correct, total_has_pred)
+    recall = ev.safe_divide(total_correct, total_has_gold)
+    scores_to_stats[score] = [precision, recall]
+
+  best = (0.0, 0.0, 0.0, 0.0)
+  for threshold, (precision, recall) in scores_to_stats.items():
+    for t, target in enumerate(targets):
+      if precision >= target and recall > max_recall[t]:
+        max_recall[t] = recall
+        max_precision[t] = precision
+        max_scores[t] = threshold
+
+    f1 = ev.safe_divide(2 * precision * recall, precision + recall)
+    if f1 > best[0]:
+      best = (f1, precision, recall, threshold)
+
+  return best, list(zip(targets, max_recall, max_precision, max_scores))
 
 
 class EvalUtilsTest(tf.test.TestCase):
@@ -195,6 +236,53 @@ class EvalUtilsTest(tf.test.TestCase):
     self.assertEqual(target_pr_scores_list[2][0], 0.9)
     self.assertEqual(target_pr_scores_list[2][1], 0.0)  # recall@0.5
 
+  def testPrCurveMatchesReference(self):
+    """Array implementation equals the tuple-by-tuple implementation."""
+    rng = random.Random(0)
+    targets = [i / 100 for i in range(101)]
+    for n in [0, 1, 2, 10, 100, 1000]:
+      answer_stats = []
+      for _ in range(n):
+        has_gold = rng.random() < 0.6
+        has_pred = rng.random() < 0.8
+        is_correct = has_gold and has_pred and rng.random() < 0.5
+        answer_stats.append(
+            (has_gold, has_pred, is_correct, rng.randint(0, 30) / 3))
+      answer_stats.sort(key=lambda x: x[-1], reverse=True)
+
+      self.assertEqual(
+          ev.compute_pr_curves(answer_stats, targets=targets),
+          reference_compute_pr_curves(answer_stats, targets))
+      self.assertEqual(
+          ev.compute_pr_curves(answer_stats, targets=targets, is_sorted=True),
+          reference_compute_pr_curves(answer_stats, targets))
+
+  def testConcurrentGoldCache(self):
+    """The cache written by another evaluation in the meantime is reused."""
+    rng = random.Random(0)
+    directory = self.create_tempdir().full_path
+    gold_path = os.path.join(directory, 'nq-dev-00.jsonl.gz')
+    test_utils.write_random_gold(gold_path, rng, 20)
+    predictions_path = os.path.join(directory, 'predictions.json')
+    test_utils.write_random_predictions(predictions_path, rng, 20)
+    cache_path = os.path.join(directory, 'gold_cache')
+    read_gold = util.read_gold
+
+    def read_gold_racing(path, *args, **kwargs):
+      gold = read_gold(path, *args, **kwargs)
+      if not util.is_gold_store(cache_path):
+        read_gold(path, n_threads=1).save(cache_path)
+      return gold
+
+    with flagsaver.flagsaver(gold_path=gold_path,
+                             predictions_path=predictions_path,
+                             cache_gold_data=True, num_threads=1):
+      with mock.patch.object(util, 'read_gold', side_effect=read_gold_racing):
+        ev.evaluate(profiling.ensure(None))
+    self.assertTrue(util.is_gold_store(cache_path))
+    self.assertFalse([name for name in os.listdir(directory)
+                      if name.startswith('.tmp-')])
+
 
 if __name__ == '__main__':
   tf.test.main()
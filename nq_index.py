@@ -0,0 +1,299 @@
+# coding=utf-8
+# Copyright 2018 The Google AI Language Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+r"""Random access to examples in gzipped NQ shards.
+
+A gzip file may consist of several independently compressed members, and is
+still read as a single stream by `gzip`, `zcat` and all tools in this
+repository. This script rewrites each shard as a sequence of members of about
+`--block_bytes` uncompressed bytes, and records the member (block) and the
+offset within the block of every example:
+
+  python nq_index.py --shard_pattern=/path/to/nq-dev-??.jsonl.gz \
+    --index_dir=/path/to/indexed-dev
+
+Fetching an example then only decompresses the block that contains it:
+
+  index = nq_index.NqIndex('/path/to/indexed-dev')
+  example = index.get_example(-2226525965842375672)
+
+With `--norechunk`, the shards are indexed in place. This is only useful for
+files that already consist of many members, since a single member file has to
+be decompressed from the start to reach any example.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import glob
+import os
+import re
+import shutil
+import tempfile
+import zlib
+
+from absl import app
+from absl import flags
+from absl import logging
+
+import array_store
+import json_utils
+import numpy as np
+
+FLAGS = flags.FLAGS
+
+flags.DEFINE_string('shard_pattern', None,
+                    'Glob pattern matching gzipped NQ jsonlines shards.')
+flags.DEFINE_string('index_dir', None,
+                    'Directory containing the (rechunked) shards and index.')
+flags.DEFINE_integer('block_bytes', 1 << 20,
+                     'Approximate uncompressed size of each gzip member.')
+flags.DEFINE_bool('rechunk', True,
+                  'Whether to rewrite shards into small gzip members.')
+
+# Names of the arrays that make up the index.
+INDEX_ARRAYS = ('example_id', 'shard', 'block_offset', 'line_offset')
+
+# File in the index directory listing the indexed shards, one per line.
+SHARDS_FILENAME = 'shards.txt'
+
+# zlib `wbits` for reading and writing gzip members.
+_GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+_EXAMPLE_ID_RE = re.compile(br'"example_id":\s*(-?\d+)')
+
+
+def iter_lines(fileobj, offset=0, read_size=1 << 20):
+  """Yields the lines of a (multi-member) gzip file with their positions.
+
+  Args:
+    fileobj: Binary file object, positioned at the start of a gzip member.
+    offset (0): Position of `fileobj` in the file, added to block offsets.
+    read_size: Number of compressed bytes to read at a time.
+
+  Yields:
+    Tuples of (block_offset, line_offset, line), where `block_offset` is the
+    file position of the gzip member in which the line starts and
+    `line_offset` is the position of the line in the uncompressed member.
+  """
+  decompressor = zlib.decompressobj(_GZIP_WBITS)
+  block_offset = offset
+  block_consumed = 0
+  block_pos = 0
+  line_start = (block_offset, 0)
+  pending = []
+
+  data = fileobj.read(read_size)
+  while data:
+    text = decompressor.decompress(data)
+    start = 0
+    while True:
+      end = text.find(b'\n', start) + 1
+      if not end:
+        if start < len(text):
+          pending.append(text[start:])
+        break
+      pending.append(text[start:end])
+      yield line_start[0], line_start[1], b''.join(pending)
+      pending = []
+      line_start = (block_offset, block_pos + end)
+      start = end
+    block_pos += len(text)
+
+    if decompressor.eof:
+      unused = decompressor.unused_data
+      block_offset += block_consumed + len(data) - len(unused)
+      block_consumed = 0
+      block_pos = 0
+      if not pending:
+        line_start = (block_offset, 0)
+      decompressor = zlib.decompressobj(_GZIP_WBITS)
+      data = unused or fileobj.read(read_size)
+    else:
+      block_consumed += len(data)
+      data = fileobj.read(read_size)
+
+  if pending:
+    yield line_start[0], line_start[1], b''.join(pending)
+
+
+def read_line(fileobj, block_offset, line_offset):
+  """Returns the line starting at `line_offset` in the block `block_offset`."""
+  fileobj.seek(block_offset)
+  for line_block, line_pos, line in iter_lines(fileobj, offset=block_offset):
+    if line_block == block_offset and line_pos == line_offset:
+      return line
+    if line_block > block_offset or line_pos > line_offset:
+      break
+  raise KeyError('No line at block %d, offset %d.' % (block_offset,
+                                                      line_offset))
+
+
+def get_example_id(line):
+  """Returns the `example_id` of a serialized NQ example."""
+  match = _EXAMPLE_ID_RE.search(line)
+  if match:
+    return int(match.group(1))
+  return json_utils.loads_fields(line, ['example_id'])['example_id']
+
+
+def rechunk_shard(inpath, outpath, block_bytes):
+  """Rewrites a gzipped shard as a sequence of gzip members.
+
+  Args:
+    inpath: Input gzip file.
+    outpath: Output gzip file.
+    block_bytes: Approximate uncompressed size of each member. Members always
+      contain whole lines.
+  """
+  with open(inpath, 'rb') as fin, open(outpath, 'wb') as fout:
+    block = []
+    block_size = 0
+    for _, _, line in iter_lines(fin):
+      block.append(line)
+      block_size += len(line)
+      if block_size >= block_bytes:
+        compressor = zlib.compressobj(6, zlib.DEFLATED, _GZIP_WBITS)
+        fout.write(compressor.compress(b''.join(block)) + compressor.flush())
+        block = []
+        block_size = 0
+    if block:
+      compressor = zlib.compressobj(6, zlib.DEFLATED, _GZIP_WBITS)
+      fout.write(compressor.compress(b''.join(block)) + compressor.flush())
+
+
+def index_shard(path):
+  """Returns (example_ids, block_offsets, line_offsets) lists for a shard."""
+  example_ids = []
+  block_offsets = []
+  line_offsets = []
+  with open(path, 'rb') as f:
+    for block_offset, line_offset, line in iter_lines(f):
+      if not line.strip():
+        continue
+      example_ids.append(get_example_id(line))
+      block_offsets.append(block_offset)
+      line_offsets.append(line_offset)
+  return example_ids, block_offsets, line_offsets
+
+
+def build_index(shard_pattern, index_dir, block_bytes=1 << 20, rechunk=True):
+  """Builds a random access index for all shards matching `shard_pattern`.
+
+  Args:
+    shard_pattern: Glob pattern matching gzipped jsonlines shards.
+    index_dir: Output directory. Must not exist yet.
+    block_bytes: Approximate uncompressed size of each gzip member.
+    rechunk: Whether to write rechunked copies of the shards to `index_dir`.
+      Otherwise the index refers to the input shards by absolute path.
+  """
+  inpaths = sorted(glob.glob(shard_pattern))
+  if not inpaths:
+    raise IOError('No shards match: %s' % shard_pattern)
+
+  parent = os.path.dirname(os.path.abspath(index_dir))
+  tmp_dir = tempfile.mkdtemp(dir=parent, prefix='.tmp-')
+  try:
+    shards = []
+    arrays = dict([(name, []) for name in INDEX_ARRAYS])
+    for i, inpath in enumerate(inpaths):
+      if rechunk:
+        shard = os.path.basename(inpath)
+        logging.info('Rechunking %s', inpath)
+        rechunk_shard(inpath, os.path.join(tmp_dir, shard), block_bytes)
+        path = os.path.join(tmp_dir, shard)
+      else:
+        shard = os.path.abspath(inpath)
+        path = shard
+      logging.info('Indexing %s', path)
+      example_ids, block_offsets, line_offsets = index_shard(path)
+      shards.append(shard)
+      arrays['example_id'].extend(example_ids)
+      arrays['shard'].extend([i] * len(example_ids))
+      arrays['block_offset'].extend(block_offsets)
+      arrays['line_offset'].extend(line_offsets)
+
+    order = np.argsort(np.array(arrays['example_id'], dtype=np.int64),
+                       kind='stable')
+    array_store.save_arrays(
+        os.path.join(tmp_dir, 'index'), {
+            'example_id':
+                np.array(arrays['example_id'], dtype=np.int64)[order],
+            'shard':
+                np.array(arrays['shard'], dtype=np.int32)[order],
+            'block_offset':
+                np.array(arrays['block_offset'], dtype=np.int64)[order],
+            'line_offset':
+                np.array(arrays['line_offset'], dtype=np.int64)[order],
+        })
+    with open(os.path.join(tmp_dir, SHARDS_FILENAME), 'w') as f:
+      f.write(''.join([shard + '\n' for shard in shards]))
+    os.rename(tmp_dir, index_dir)
+  except:
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    raise
+
+
+class NqIndex(object):
+  """Random access to the examples in a directory written by `build_index`."""
+
+  def __init__(self, index_dir):
+    self.index_dir = index_dir
+    arrays = array_store.load_arrays(
+        os.path.join(index_dir, 'index'), INDEX_ARRAYS)
+    self.example_id = arrays['example_id']
+    self.shard = arrays['shard']
+    self.block_offset = arrays['block_offset']
+    self.line_offset = arrays['line_offset']
+    with open(os.path.join(index_dir, SHARDS_FILENAME)) as f:
+      self.shards = [
+          os.path.join(index_dir, line.rstrip('\n')) for line in f
+      ]
+
+  def __len__(self):
+    return len(self.example_id)
+
+  def __contains__(self, example_id):
+    i = int(np.searchsorted(self.example_id, example_id))
+    return i < len(self.example_id) and self.example_id[i] == example_id
+
+  def locate(self, example_id):
+    """Returns (shard path, block offset, line offset) of `example_id`."""
+    i = int(np.searchsorted(self.example_id, example_id))
+    if i >= len(self.example_id) or self.example_id[i] != example_id:
+      raise KeyError(example_id)
+    return (self.shards[self.shard[i]], int(self.block_offset[i]),
+            int(self.line_offset[i]))
+
+  def get_line(self, example_id):
+    """Returns the serialized example `example_id`."""
+    path, block_offset, line_offset = self.locate(example_id)
+    with open(path, 'rb') as f:
+      return read_line(f, block_offset, line_offset)
+
+  def get_example(self, example_id):
+    """Returns the example `example_id` as a dictionary."""
+    return json_utils.loads(self.get_line(example_id))
+
+
+def main(_):
+  build_index(FLAGS.shard_pattern, FLAGS.index_dir, FLAGS.block_bytes,
+              FLAGS.rechunk)
+
+
+if __name__ == '__main__':
+  flags.mark_flag_as_required('shard_pattern')
+  flags.mark_flag_as_required('index_dir')
+  app.run(main)
@@ -0,0 +1,84 @@
+# coding=utf-8
+# Copyright 2018 The Google AI Language Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Testing code for nq_index."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import gzip
+import json
+import os
+
+import nq_index
+import tensorflow.compat.v1 as tf
+
+
+class NqIndexTest(tf.test.TestCase):
+  """Testing codes for nq_index"""
+
+  def _write_shards(self, num_shards=2, examples_per_shard=20):
+    examples = {}
+    for shard in range(num_shards):
+      path = os.path.join(self.get_temp_dir(), 'nq-dev-%02d.jsonl.gz' % shard)
+      with gzip.open(path, 'wt') as f:
+        for i in range(examples_per_shard):
+          example_id = (shard * examples_per_shard + i) * 7919 - 10**12
+          example = {
+              'annotations': [],
+              'document_html': '<P> "example_id": 1 </P>' * i,
+              'example_id': example_id,
+          }
+          examples[example_id] = example
+          f.write(json.dumps(example) + '\n')
+    return examples
+
+  def testIterLines(self):
+    """Lines and offsets of a multi-member gzip file."""
+    path = os.path.join(self.get_temp_dir(), 'members.gz')
+    with open(path, 'wb') as f:
+      f.write(gzip.compress(b'a\nbb\n'))
+      offset = f.tell()
+      f.write(gzip.compress(b'ccc\nd'))
+    with open(path, 'rb') as f:
+      lines = list(nq_index.iter_lines(f, read_size=3))
+    self.assertEqual(lines, [(0, 0, b'a\n'), (0, 2, b'bb\n'),
+                             (offset, 0, b'ccc\n'), (offset, 4, b'd')])
+    with open(path, 'rb') as f:
+      self.assertEqual(nq_index.read_line(f, offset, 4), b'd')
+
+  def testGetExample(self):
+    """Every example can be fetched by id, with and without rechunking."""
+    examples = self._write_shards()
+    pattern = os.path.join(self.get_temp_dir(), 'nq-dev-??.jsonl.gz')
+    for rechunk in [True, False]:
+      index_dir = os.path.join(self.get_temp_dir(), 'index-%s' % rechunk)
+      nq_index.build_index(pattern, index_dir, block_bytes=200,
+                           rechunk=rechunk)
+      index = nq_index.NqIndex(index_dir)
+      self.assertEqual(len(index), len(examples))
+      for example_id, example in examples.items():
+        self.assertIn(example_id, index)
+        self.assertEqual(index.get_example(example_id), example)
+      self.assertNotIn(5, index)
+
+    rechunked = os.path.join(self.get_temp_dir(), 'index-True',
+                             'nq-dev-00.jsonl.gz')
+    with gzip.open(rechunked, 'rt') as f:
+      self.assertEqual(len(f.readlines()), 20)
+
+
+if __name__ == '__main__':
+  tf.test.main()
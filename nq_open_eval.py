@@ -0,0 +1,339 @@
+# coding=utf-8
+# Copyright 2018 The Google AI Language Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+r"""Exact match evaluation of NQ-open predictions.
+
+Example usage:
+
+  nq_open_eval --references_path=nq_open/NQ-open.dev.jsonl \
+    --predictions_jsonl_path=<path_to_jsonl>
+
+references_path points to one of the `nq_open/*.jsonl` splits. The
+predictions are JSON lines of the form:
+
+  {"question": "who signed the sugauli treaty on behalf of nepal",
+   "prediction": "Raj Guru Gajaraj Mishra"}
+
+A prediction is correct if its normalized text is equal to one of the
+normalized reference answers of its question, see `normalize_answer`, as in
+the NQ-open evaluation script linked from nq_open/README.md. The reference
+answers are normalized once, into one set per question, so that every
+prediction is scored with one normalization and one set lookup while the
+predictions are streamed.
+
+The SQuAD token F1 of a prediction is its best F1 against the reference
+answers of its question, over the bags of tokens of the normalized strings.
+It is computed for batches of predictions at once by `TokenF1Scorer`, e.g.
+for all the candidates of n-best lists.
+
+The exact match and F1 are reported for every answer field of the
+references, e.g. `answer`, `def_correct_predictions`,
+`poss_correct_predictions` and `answer_and_def_correct_predictions` for the
+EfficientQA test set. Questions without a prediction count as incorrect.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+import gzip
+import json
+import re
+import string
+import unicodedata
+
+from absl import app
+from absl import flags
+import json_utils
+import numpy as np
+
+flags.DEFINE_string('references_path', None,
+                    'Path to an NQ-open split in JSON-lines format.')
+flags.DEFINE_string(
+    'predictions_jsonl_path', None,
+    'Path to JSON-lines predictions with `question` and `prediction` fields.')
+flags.DEFINE_list(
+    'answer_fields', None,
+    'Answer fields of the references to evaluate against. Defaults to all '
+    'the fields of `ANSWER_FIELDS` present in the references.')
+
+FLAGS = flags.FLAGS
+
+# Fields of the NQ-open splits that contain reference answer strings.
+ANSWER_FIELDS = ('answer', 'def_correct_predictions',
+                 'poss_correct_predictions',
+                 'answer_and_def_correct_predictions')
+
+# Number of predictions scored at once by `score_predictions`.
+_F1_BATCH_SIZE = 100000
+
+_PUNCTUATION_TABLE = dict.fromkeys([ord(c) for c in string.punctuation])
+_ARTICLES_RE = re.compile(r'\b(a|an|the)\b', re.UNICODE)
+
+
+def normalize_answer(s):
+  """Lower cases `s` and removes punctuation, articles and extra whitespace."""
+  s = unicodedata.normalize('NFD', s).lower().translate(_PUNCTUATION_TABLE)
+  return ' '.join(_ARTICLES_RE.sub(' ', s).split())
+
+
+def _open(path):
+  return gzip.open(path, 'rb') if path.endswith('.gz') else open(path, 'rb')
+
+
+def read_references(path, answer_fields=None):
+  """Reads and normalizes the reference answers of an NQ-open split.
+
+  Args:
+    path: Path to a JSON-lines NQ-open split.
+    answer_fields: Answer fields to read. Defaults to all the fields of
+      `ANSWER_FIELDS` present in the first line.
+
+  Returns:
+    answer_fields: List of the answer fields read.
+    references: OrderedDict from question to a tuple of frozensets, one per
+      answer field, of normalized answers.
+
+  Raises:
+    ValueError: If a question has no answer field, or is repeated.
+  """
+  references = collections.OrderedDict()
+  with _open(path) as f:
+    for line in f:
+      reference = json_utils.loads(line)
+      if answer_fields is None:
+        answer_fields = [a for a in ANSWER_FIELDS if a in reference]
+      question = reference['question']
+      if question in references:
+        raise ValueError('Repeated question: %s' % question)
+      try:
+        references[question] = tuple(
+            frozenset([normalize_answer(answer)
+                       for answer in reference[field]])
+            for field in answer_fields)
+      except KeyError as e:
+        raise ValueError('Question has no %s field: %s' % (e, question))
+  return list(answer_fields or []), references
+
+
+def iter_predictions(path):
+  """Yields the (question, prediction) pairs of a JSON-lines file."""
+  with _open(path) as f:
+    for line in f:
+      prediction = json_utils.loads(line)
+      yield prediction['question'], prediction['prediction']
+
+
+def _ragged_range(starts, lengths):
+  """Returns (g, starts[g] + k) for every group g and k < lengths[g]."""
+  group = np.repeat(np.arange(len(lengths)), lengths)
+  offsets = np.zeros(len(lengths), dtype=np.int64)
+  np.cumsum(lengths[:-1], out=offsets[1:])
+  return group, starts[group] + np.arange(len(group)) - offsets[group]
+
+
+class TokenF1Scorer(object):
+  """Computes the token F1 of batches of predictions with array operations.
+
+  The tokens of the normalized reference answers are interned once, and every
+  answer is stored as sorted (answer, token id) keys with counts. The overlap
+  of a prediction with an answer, i.e. the sum over tokens of the minimum of
+  their counts, is then found for all (prediction, answer) pairs of a batch
+  with one `np.searchsorted`.
+  """
+
+  def __init__(self, references, field_index=0):
+    """Constructor.
+
+    Args:
+      references: Dict from question to the tuple of normalized answer sets of
+        `read_references`.
+      field_index (0): Index of the answer field to score against.
+    """
+    self._question_index = {}
+    self._vocab = {}
+    num_answers = []
+    answer_lengths = []
+    answer_tokens = []
+    for question, answer_sets in references.items():
+      self._question_index[question] = len(num_answers)
+      answers = sorted(answer_sets[field_index])
+      num_answers.append(len(answers))
+      for answer in answers:
+        tokens = answer.split()
+        answer_lengths.append(len(tokens))
+        answer_tokens.append(
+            [self._vocab.setdefault(t, len(self._vocab)) for t in tokens])
+
+    # Tokens that are not in any answer share the id `len(self._vocab)`.
+    self._num_ids = len(self._vocab) + 1
+    self._answer_splits = np.zeros(len(num_answers) + 1, dtype=np.int64)
+    np.cumsum(num_answers, out=self._answer_splits[1:])
+    self._answer_lengths = np.array(answer_lengths, dtype=np.int64)
+    answers = np.repeat(np.arange(len(answer_lengths)), answer_lengths)
+    token_ids = np.array(
+        [t for tokens in answer_tokens for t in tokens], dtype=np.int64)
+    self._keys, self._counts = np.unique(
+        answers * self._num_ids + token_ids, return_counts=True)
+
+  def score(self, questions, predictions, normalized=False):
+    """Returns the token F1 of every prediction.
+
+    Args:
+      questions: N questions, e.g. each question repeated for the candidates
+        of its n-best list.
+      predictions: N predicted answer strings.
+      normalized (False): Whether the predictions are already normalized with
+        `normalize_answer`.
+
+    Returns:
+      (N,) float array of the best F1 of each prediction against the answers
+      of its question, or 0 if the question has no answers.
+
+    Raises:
+      ValueError: If a question is not in the references.
+    """
+    try:
+      question_ids = np.array([self._question_index[q] for q in questions],
+                              dtype=np.int64)
+    except KeyError as e:
+      raise ValueError('Question is not in the references: %s' % e)
+    unknown_id = self._num_ids - 1
+    get_id = self._vocab.get
+    lengths = []
+    token_ids = []
+    for prediction in predictions:
+      if not normalized:
+        prediction = normalize_answer(prediction)
+      tokens = prediction.split()
+      lengths.append(len(tokens))
+      token_ids.extend([get_id(t, unknown_id) for t in tokens])
+    lengths = np.array(lengths, dtype=np.int64)
+    num_predictions = len(lengths)
+
+    # The (prediction, answer) pairs, grouped by prediction.
+    first_answer = self._answer_splits[question_ids]
+    num_answers = self._answer_splits[question_ids + 1] - first_answer
+    pair_splits = np.zeros(num_predictions + 1, dtype=np.int64)
+    np.cumsum(num_answers, out=pair_splits[1:])
+    pair_predictions, pair_answers = _ragged_range(first_answer, num_answers)
+
+    # The distinct tokens of every prediction, with their counts.
+    prediction_keys, prediction_counts = np.unique(
+        np.repeat(np.arange(num_predictions), lengths) * self._num_ids +
+        np.array(token_ids, dtype=np.int64),
+        return_counts=True)
+    key_predictions = prediction_keys // self._num_ids
+
+    # Every distinct token of a prediction, for every answer of its question.
+    key_pairs, pairs = _ragged_range(pair_splits[key_predictions],
+                                     num_answers[key_predictions])
+    keys = (pair_answers[pairs] * self._num_ids +
+            prediction_keys[key_pairs] % self._num_ids)
+    positions = np.minimum(
+        np.searchsorted(self._keys, keys), max(len(self._keys) - 1, 0))
+    found = self._keys[positions] == keys if len(self._keys) else np.zeros(
+        len(keys), dtype=bool)
+    overlap = np.bincount(
+        pairs[found],
+        weights=np.minimum(prediction_counts[key_pairs[found]],
+                           self._counts[positions[found]]),
+        minlength=pair_splits[-1])
+
+    pair_f1 = np.zeros(len(overlap))
+    matched = overlap > 0
+    # F1 = 2PR / (P + R) = 2 * overlap / (len(prediction) + len(answer)).
+    pair_f1[matched] = 2 * overlap[matched] / (
+        lengths[pair_predictions[matched]] +
+        self._answer_lengths[pair_answers[matched]])
+    f1 = np.zeros(num_predictions)
+    np.maximum.at(f1, pair_predictions, pair_f1)
+    return f1
+
+
+def score_predictions(answer_fields, references, predictions):
+  """Computes the exact match and F1 of predictions for every answer field.
+
+  Args:
+    answer_fields: List of answer field names, as returned by
+      `read_references`.
+    references: Dict from question to the tuple of normalized answer sets of
+      `read_references`.
+    predictions: Iterable of (question, prediction) pairs.
+
+  Returns:
+    OrderedDict with `<field>-exact-match` and `<field>-f1` for every answer
+    field, and the number of questions and predictions.
+
+  Raises:
+    ValueError: If a question is not in the references, or is predicted more
+      than once.
+  """
+  num_correct = [0] * len(answer_fields)
+  total_f1 = np.zeros(len(answer_fields))
+  scorers = [
+      TokenF1Scorer(references, i) for i in range(len(answer_fields))
+  ]
+  batch_questions = []
+  batch_predictions = []
+
+  def score_batch():
+    for i, scorer in enumerate(scorers):
+      total_f1[i] += scorer.score(
+          batch_questions, batch_predictions, normalized=True).sum()
+    del batch_questions[:]
+    del batch_predictions[:]
+
+  predicted = set()
+  for question, prediction in predictions:
+    answer_sets = references.get(question)
+    if answer_sets is None:
+      raise ValueError('Question is not in the references: %s' % question)
+    if question in predicted:
+      raise ValueError('Question was already predicted: %s' % question)
+    predicted.add(question)
+    normalized = normalize_answer(prediction)
+    for i, answers in enumerate(answer_sets):
+      if normalized in answers:
+        num_correct[i] += 1
+    batch_questions.append(question)
+    batch_predictions.append(normalized)
+    if len(batch_questions) == _F1_BATCH_SIZE:
+      score_batch()
+  score_batch()
+
+  num_questions = len(references)
+  metrics = collections.OrderedDict()
+  for field, correct, f1 in zip(answer_fields, num_correct, total_f1):
+    metrics[field + '-exact-match'] = (
+        correct / num_questions if num_questions else 0)
+    metrics[field + '-f1'] = f1 / num_questions if num_questions else 0
+  metrics['num-questions'] = num_questions
+  metrics['num-predictions'] = len(predicted)
+  return metrics
+
+
+def main(_):
+  answer_fields, references = read_references(FLAGS.references_path,
+                                              FLAGS.answer_fields)
+  metrics = score_predictions(answer_fields, references,
+                              iter_predictions(FLAGS.predictions_jsonl_path))
+  print(json.dumps(metrics))
+
+
+if __name__ == '__main__':
+  flags.mark_flag_as_required('references_path')
+  flags.mark_flag_as_required('predictions_jsonl_path')
+  app.run(main)
@@ -0,0 +1,94 @@
+# coding=utf-8
+# Copyright 2018 The Google AI Language Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Testing code for nq_open_eval."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+import os
+
+import nq_open_eval
+import tensorflow.compat.v1 as tf
+
+
+class NqOpenEvalTest(tf.test.TestCase):
+  """Testing codes for nq_open_eval"""
+
+  def testNormalizeAnswer(self):
+    self.assertEqual(
+        nq_open_eval.normalize_answer(u'  The  Beatles, (an) band!'),
+        'beatles band')
+    self.assertEqual(nq_open_eval.normalize_answer(u'Théâtre'),
+                     nq_open_eval.normalize_answer(u'Théâtre'))
+    self.assertEqual(nq_open_eval.normalize_answer(u'theatre a-b'),
+                     'theatre ab')
+
+  def testScorePredictions(self):
+    references_path = os.path.join(self.get_temp_dir(), 'references.jsonl')
+    with open(references_path, 'w') as f:
+      for reference in [
+          {'question': 'q1', 'answer': ['The Beatles'],
+           'def_correct_predictions': ['beatles!'],
+           'poss_correct_predictions': []},
+          {'question': 'q2', 'answer': ['1972'],
+           'def_correct_predictions': [],
+           'poss_correct_predictions': ['December 1972']},
+          {'question': 'q3', 'answer': ['x'],
+           'def_correct_predictions': [],
+           'poss_correct_predictions': []},
+      ]:
+        f.write(json.dumps(reference) + '\n')
+
+    answer_fields, references = nq_open_eval.read_references(references_path)
+    self.assertEqual(answer_fields, ['answer', 'def_correct_predictions',
+                                     'poss_correct_predictions'])
+    metrics = nq_open_eval.score_predictions(
+        answer_fields, references, [('q1', 'beatles'), ('q2', 'december 1972')])
+    self.assertAllClose(
+        [metrics['answer-exact-match'],
+         metrics['def_correct_predictions-exact-match'],
+         metrics['poss_correct_predictions-exact-match']],
+        [1 / 3, 1 / 3, 1 / 3])
+    self.assertEqual(metrics['num-predictions'], 2)
+
+    self.assertAllClose(
+        [metrics['answer-f1'], metrics['poss_correct_predictions-f1']],
+        [(1 + 2 / 3) / 3, 1 / 3])
+
+    with self.assertRaises(ValueError):
+      nq_open_eval.score_predictions(answer_fields, references,
+                                     [('q1', 'a'), ('q1', 'b')])
+    with self.assertRaises(ValueError):
+      nq_open_eval.score_predictions(answer_fields, references, [('q4', 'a')])
+
+  def testTokenF1Scorer(self):
+    references = {
+        'q1': (frozenset(['p b c', 'b b d']),),
+        'q2': (frozenset(),),
+        'q3': (frozenset(['x']),),
+    }
+    scorer = nq_open_eval.TokenF1Scorer(references)
+    f1 = scorer.score(['q1', 'q1', 'q1', 'q2', 'q3', 'q3'],
+                      ['B, the b!', 'c p B', 'e', 'x', 'x y', ''])
+    # 'b b' against 'b b d': P = 1, R = 2 / 3, better than against 'p b c'.
+    self.assertAllClose(f1, [0.8, 1, 0, 0, 2 / 3, 0])
+    with self.assertRaises(ValueError):
+      scorer.score(['q4'], ['x'])
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -0,0 +1,272 @@
+# coding=utf-8
+# Copyright 2018 The Google AI Language Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+r"""Maps token offsets of the simplified NQ data to the original HTML.
+
+`text_utils.simplify_nq_example` drops the byte offsets of the original
+`document_tokens`. An `OffsetTable` keeps them, along with the character
+offset of every token in the simplified `document_text`, as flat int arrays:
+
+  token_bytes[token_splits[i] + t] = [start_byte, end_byte) of token t
+  token_chars[token_splits[i] + t] = [start, end) of token t in `document_text`
+
+for the example in row `i`. Converting token offsets to byte or character
+offsets is an array lookup. Converting back is a binary search over the
+offsets of the example.
+
+`simplify_nq_data --write_offsets` writes a table next to each simplified
+output file with an `OffsetTableWriter`, which streams the per-token arrays to
+disk, so that tables of whole splits are never held in memory. The tables
+can be opened with `load_offset_table`:
+
+  table = offset_table.load_offset_table("simplified-nq-train.offsets")
+  start_byte, end_byte = table.token_to_bytes(example_id, 10, 15)
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import tempfile
+
+import array_store
+import numpy as np
+
+# Names of the arrays that make up an `OffsetTable`.
+OFFSET_TABLE_ARRAYS = ("example_id", "token_splits", "token_bytes",
+                       "token_chars")
+
+# Number of tokens copied at a time by `OffsetTableWriter.add_table`.
+_COPY_CHUNK = 1 << 20
+
+
+def example_offsets(nq_example):
+  """Returns the (token_bytes, token_chars) arrays of an original NQ example.
+
+  Args:
+    nq_example: Dictionary containing original NQ example fields.
+
+  Returns:
+    token_bytes: (T, 2) int32 array of the [start_byte, end_byte) of every
+      token in `document_html`.
+    token_chars: (T, 2) int32 array of the [start, end) of every token in the
+      `document_text` of `text_utils.simplify_nq_example`.
+  """
+  tokens = nq_example["document_tokens"]
+  token_bytes = np.array([(t["start_byte"], t["end_byte"]) for t in tokens],
+                         dtype=np.int32).reshape(-1, 2)
+  # Tokens are joined by single blanks, and blanks within tokens are replaced
+  # with underscores, so the lengths of the tokens are unchanged.
+  lengths = np.array([len(t["token"]) for t in tokens], dtype=np.int32)
+  token_chars = np.zeros((len(tokens), 2), dtype=np.int32)
+  np.cumsum(lengths[:-1] + 1, out=token_chars[1:, 0])
+  token_chars[:, 1] = token_chars[:, 0] + lengths
+  return token_bytes, token_chars
+
+
+class OffsetTable(object):
+  """Token, byte and character offsets of many examples, see module doc."""
+
+  def __init__(self, example_id, token_splits, token_bytes, token_chars):
+    self.example_id = example_id
+    self.token_splits = token_splits
+    self.token_bytes = token_bytes
+    self.token_chars = token_chars
+    self._order = np.argsort(example_id, kind="stable")
+
+  @classmethod
+  def concatenate(cls, tables):
+    """Returns the table with the rows of all `tables`, in order."""
+    token_splits = [np.zeros(1, dtype=np.int64)]
+    for table in tables:
+      token_splits.append(table.token_splits[1:] + token_splits[-1][-1])
+    return cls(
+        example_id=np.concatenate(
+            [np.zeros(0, dtype=np.int64)] + [t.example_id for t in tables]),
+        token_splits=np.concatenate(token_splits),
+        token_bytes=np.concatenate(
+            [np.zeros((0, 2), dtype=np.int32)] +
+            [t.token_bytes for t in tables]),
+        token_chars=np.concatenate(
+            [np.zeros((0, 2), dtype=np.int32)] +
+            [t.token_chars for t in tables]))
+
+  def save(self, directory):
+    """Writes the table to `directory`, see `load_offset_table`."""
+    array_store.save_arrays(
+        directory, dict([(name, getattr(self, name))
+                         for name in OFFSET_TABLE_ARRAYS]))
+
+  def __len__(self):
+    return len(self.example_id)
+
+  def index(self, example_id):
+    """Returns the row of `example_id`, or -1 if it is not in the table."""
+    i = int(np.searchsorted(self.example_id, example_id, sorter=self._order))
+    if i < len(self._order) and self.example_id[self._order[i]] == example_id:
+      return int(self._order[i])
+    return -1
+
+  def __contains__(self, example_id):
+    return self.index(example_id) >= 0
+
+  def _token_range(self, example_id):
+    i = self.index(example_id)
+    if i < 0:
+      raise KeyError(example_id)
+    return self.token_splits[i], self.token_splits[i + 1]
+
+  def get_token_bytes(self, example_id):
+    """Returns the (T, 2) [start_byte, end_byte) of the tokens of an example."""
+    start, end = self._token_range(example_id)
+    return self.token_bytes[start:end]
+
+  def get_token_chars(self, example_id):
+    """Returns the (T, 2) `document_text` [start, end) of the example tokens."""
+    start, end = self._token_range(example_id)
+    return self.token_chars[start:end]
+
+  def token_to_bytes(self, example_id, start_token, end_token):
+    """Returns the [start_byte, end_byte) of the tokens [start, end)."""
+    token_bytes = self.get_token_bytes(example_id)
+    return (int(token_bytes[start_token, 0]),
+            int(token_bytes[end_token - 1, 1]))
+
+  def token_to_chars(self, example_id, start_token, end_token):
+    """Returns the `document_text` [start, end) of the tokens [start, end)."""
+    token_chars = self.get_token_chars(example_id)
+    return (int(token_chars[start_token, 0]),
+            int(token_chars[end_token - 1, 1]))
+
+  def char_to_token(self, example_id, char_offset):
+    """Returns the token at a `document_text` offset, or before a blank."""
+    token_chars = self.get_token_chars(example_id)
+    return int(
+        np.searchsorted(token_chars[:, 0], char_offset, side="right")) - 1
+
+  def byte_to_token(self, example_id, byte_offset):
+    """Returns the last token starting at or before an HTML byte offset."""
+    token_bytes = self.get_token_bytes(example_id)
+    return int(
+        np.searchsorted(token_bytes[:, 0], byte_offset, side="right")) - 1
+
+
+def load_offset_table(directory, mmap_mode="r"):
+  """Opens an `OffsetTable` written by `OffsetTable.save`."""
+  return OffsetTable(**array_store.load_arrays(
+      directory, OFFSET_TABLE_ARRAYS, mmap_mode=mmap_mode))
+
+
+class OffsetTableBuilder(object):
+  """Accumulates the offsets of examples into an `OffsetTable`."""
+
+  def __init__(self):
+    self.example_ids = []
+    self.token_bytes = []
+    self.token_chars = []
+
+  def add(self, nq_example):
+    """Adds the offsets of an original NQ example."""
+    token_bytes, token_chars = example_offsets(nq_example)
+    self.example_ids.append(nq_example["example_id"])
+    self.token_bytes.append(token_bytes)
+    self.token_chars.append(token_chars)
+
+  def build(self):
+    """Returns the `OffsetTable` of the added examples."""
+    token_splits = np.zeros(len(self.token_chars) + 1, dtype=np.int64)
+    np.cumsum([len(c) for c in self.token_chars], out=token_splits[1:])
+    return OffsetTable(
+        example_id=np.array(self.example_ids, dtype=np.int64),
+        token_splits=token_splits,
+        token_bytes=np.concatenate(
+            [np.zeros((0, 2), dtype=np.int32)] + self.token_bytes),
+        token_chars=np.concatenate(
+            [np.zeros((0, 2), dtype=np.int32)] + self.token_chars))
+
+
+class OffsetTableWriter(object):
+  """Writes the offsets of examples to an offset table directory.
+
+  The per-token arrays are streamed to temporary files as examples are added,
+  and only the example ids and token counts are kept in memory until `close`.
+  """
+
+  def __init__(self, directory):
+    self.directory = directory
+    self._paths = {}
+    self._files = {}
+    for name in ("token_bytes", "token_chars"):
+      fd, self._paths[name] = tempfile.mkstemp(
+          dir=os.path.dirname(os.path.abspath(directory)), prefix=".tmp-")
+      self._files[name] = os.fdopen(fd, "wb")
+    self._example_ids = []
+    self._num_tokens = []
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    if exc_type is None:
+      self.close()
+    else:
+      self._remove_files()
+
+  def _remove_files(self):
+    for name, path in self._paths.items():
+      self._files[name].close()
+      os.remove(path)
+
+  def _write_tokens(self, token_bytes, token_chars):
+    np.asarray(token_bytes, dtype=np.int32).tofile(self._files["token_bytes"])
+    np.asarray(token_chars, dtype=np.int32).tofile(self._files["token_chars"])
+
+  def add(self, nq_example):
+    """Adds the offsets of an original NQ example."""
+    token_bytes, token_chars = example_offsets(nq_example)
+    self._write_tokens(token_bytes, token_chars)
+    self._example_ids.append(nq_example["example_id"])
+    self._num_tokens.append(len(token_chars))
+
+  def add_table(self, table):
+    """Adds all rows of an `OffsetTable`, e.g. a memory mapped shard table."""
+    for start in range(0, len(table.token_chars), _COPY_CHUNK):
+      self._write_tokens(table.token_bytes[start:start + _COPY_CHUNK],
+                         table.token_chars[start:start + _COPY_CHUNK])
+    self._example_ids.extend(table.example_id.tolist())
+    self._num_tokens.extend(np.diff(table.token_splits).tolist())
+
+  def close(self):
+    """Writes the offset table directory."""
+    try:
+      for f in self._files.values():
+        f.close()
+      num_tokens = sum(self._num_tokens)
+      arrays = {}
+      for name, path in self._paths.items():
+        if num_tokens:
+          arrays[name] = np.memmap(
+              path, dtype=np.int32, mode="r", shape=(num_tokens, 2))
+        else:
+          arrays[name] = np.zeros((0, 2), dtype=np.int32)
+      token_splits = np.zeros(len(self._num_tokens) + 1, dtype=np.int64)
+      np.cumsum(self._num_tokens, out=token_splits[1:])
+      arrays["example_id"] = np.array(self._example_ids, dtype=np.int64)
+      arrays["token_splits"] = token_splits
+      array_store.save_arrays(self.directory, arrays)
+      del arrays
+    finally:
+      for path in self._paths.values():
+        os.remove(path)
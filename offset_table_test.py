@@ -0,0 +1,122 @@
+# coding=utf-8
+# Copyright 2018 The Google AI Language Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Testing code for offset_table."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import tempfile
+
+import offset_table
+import tensorflow.compat.v1 as tf
+import text_utils
+
+
+def make_example(example_id, tokens):
+  document_tokens = []
+  start_byte = 0
+  for token in tokens:
+    document_tokens.append({
+        "token": token,
+        "start_byte": start_byte,
+        "end_byte": start_byte + len(token.encode("utf8")),
+        "html_token": token.startswith("<"),
+    })
+    start_byte += len(token.encode("utf8")) + 2
+  return {
+      "example_id": example_id,
+      "document_url": "",
+      "document_html": "",
+      "question_text": "",
+      "question_tokens": [],
+      "document_tokens": document_tokens,
+      "long_answer_candidates": [],
+      "annotations": [],
+  }
+
+
+class OffsetTableTest(tf.test.TestCase):
+  """Testing codes for offset_table"""
+
+  def setUp(self):
+    super(OffsetTableTest, self).setUp()
+    self.examples = [
+        make_example(7, ["<P>", u"Café", "au lait", "</P>"]),
+        make_example(3, ["<Td>", "x", "</Td>"]),
+    ]
+    builder = offset_table.OffsetTableBuilder()
+    for example in self.examples:
+      builder.add(example)
+    self.table = builder.build()
+
+  def testOffsetsMatchSimplifiedText(self):
+    for example in self.examples:
+      example_id = example["example_id"]
+      text = text_utils.simplify_nq_example(example)["document_text"]
+      for t, token in enumerate(example["document_tokens"]):
+        start, end = self.table.token_to_chars(example_id, t, t + 1)
+        self.assertEqual(text[start:end], token["token"].replace(" ", "_"))
+        self.assertEqual(self.table.char_to_token(example_id, start), t)
+        self.assertEqual(
+            self.table.token_to_bytes(example_id, t, t + 1),
+            (token["start_byte"], token["end_byte"]))
+        self.assertEqual(
+            self.table.byte_to_token(example_id, token["start_byte"]), t)
+    self.assertEqual(self.table.token_to_chars(7, 1, 3), (4, 16))
+    self.assertNotIn(5, self.table)
+
+  def testConcatenateAndLoad(self):
+    halves = []
+    for example in self.examples:
+      builder = offset_table.OffsetTableBuilder()
+      builder.add(example)
+      halves.append(builder.build())
+    directory = os.path.join(self.get_temp_dir(), "table.offsets")
+    offset_table.OffsetTable.concatenate(halves).save(directory)
+    table = offset_table.load_offset_table(directory)
+
+    self.assertEqual(len(table), 2)
+    self.assertAllEqual(table.token_splits, self.table.token_splits)
+    for example in self.examples:
+      example_id = example["example_id"]
+      self.assertAllEqual(
+          table.get_token_bytes(example_id),
+          self.table.get_token_bytes(example_id))
+      self.assertAllEqual(
+          table.get_token_chars(example_id),
+          self.table.get_token_chars(example_id))
+
+  def testWriter(self):
+    temp_dir = tempfile.mkdtemp(dir=self.get_temp_dir())
+    shard_directory = os.path.join(temp_dir, "shard.offsets")
+    with offset_table.OffsetTableWriter(shard_directory) as writer:
+      writer.add(self.examples[1])
+    directory = os.path.join(temp_dir, "written.offsets")
+    with offset_table.OffsetTableWriter(directory) as writer:
+      writer.add(self.examples[0])
+      writer.add_table(offset_table.load_offset_table(shard_directory))
+    table = offset_table.load_offset_table(directory)
+
+    for name in offset_table.OFFSET_TABLE_ARRAYS:
+      self.assertAllEqual(getattr(table, name), getattr(self.table, name))
+    # The temporary files of the writers are removed.
+    self.assertEqual(sorted(os.listdir(temp_dir)),
+                     ["shard.offsets", "written.offsets"])
+
+
+if __name__ == "__main__":
+  tf.test.main()
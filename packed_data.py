@@ -0,0 +1,339 @@
+# coding=utf-8
+# Copyright 2018 The Google AI Language Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+r"""Packed binary format of the simplified NQ data.
+
+Reading the simplified jsonl data requires decoding the JSON of every example
+and splitting its `document_text`. The packed format stores the same data as
+a directory of `.npy` arrays, see `array_store`, which are memory mapped when
+loaded, so that examples are read without any parsing:
+
+  token_ids[token_splits[i]:token_splits[i + 1]]  uint32 ids of the tokens of
+    example `i`, into the vocabulary `vocab_bytes`/`vocab_splits`.
+  candidates[candidate_splits[i]:...]  (C, 3) int32 rows of
+    [start_token, end_token, top_level].
+  long_answers[annotation_splits[i]:...]  (A, 3) int32 rows of
+    [start_token, end_token, candidate_index], along with `annotation_ids`,
+    `yes_no_answers` (indices into `YES_NO_ANSWERS`) and `short_answer_splits`.
+  short_answers[short_answer_splits[a]:...]  (S, 2) int32 rows of
+    [start_token, end_token] of annotation `a`.
+
+Strings, i.e. the vocabulary, questions and URLs, are stored as utf8 bytes
+`<name>_bytes` split by `<name>_splits`. Tokens are separated by a blank in
+`vocab_bytes`.
+
+`simplify_nq_data --write_packed` writes a packed directory next to each
+simplified output file:
+
+  data = packed_data.load_packed_data("simplified-nq-train.packed")
+  example = data[0]
+  example.token_ids  # A view of the memory mapped token ids.
+  data.get_tokens(0)  # The tokens, decoded.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+import os
+import tempfile
+
+import array_store
+import numpy as np
+
+# Names of the arrays that make up a packed directory.
+PACKED_DATA_ARRAYS = ("example_id", "vocab_bytes", "vocab_splits",
+                      "question_bytes", "question_splits", "url_bytes",
+                      "url_splits", "token_splits", "token_ids",
+                      "candidate_splits", "candidates", "annotation_splits",
+                      "annotation_ids", "long_answers", "yes_no_answers",
+                      "short_answer_splits", "short_answers")
+
+# Values of `yes_no_answer`, indexed by `yes_no_answers`.
+YES_NO_ANSWERS = ("NONE", "YES", "NO")
+
+# Number of token ids remapped at once by `PackedDataWriter.write_packed_data`.
+_REMAP_CHUNK = 1 << 24
+
+PackedExample = collections.namedtuple("PackedExample", [
+    "example_id", "token_ids", "candidates", "annotation_ids", "long_answers",
+    "yes_no_answers", "short_answers"
+])
+
+
+def _pack_strings(strings):
+  """Returns the (utf8 bytes, splits) arrays of a list of strings."""
+  encoded = [s.encode("utf8") for s in strings]
+  splits = np.zeros(len(encoded) + 1, dtype=np.int64)
+  np.cumsum([len(b) for b in encoded], out=splits[1:])
+  return np.frombuffer(b"".join(encoded), dtype=np.uint8), splits
+
+
+def _unpack_string(string_bytes, splits, i):
+  return string_bytes[splits[i]:splits[i + 1]].tobytes().decode("utf8")
+
+
+def _concatenate(arrays, shape, dtype):
+  """Concatenates `arrays`, which may be empty, into an array of `dtype`."""
+  return np.concatenate([np.zeros(shape, dtype=dtype)] + arrays).astype(
+      dtype, copy=False)
+
+
+def _splits(lengths):
+  splits = np.zeros(len(lengths) + 1, dtype=np.int64)
+  np.cumsum(lengths, out=splits[1:])
+  return splits
+
+
+class PackedData(object):
+  """Examples of a packed directory, see module doc."""
+
+  def __init__(self, **arrays):
+    for name in PACKED_DATA_ARRAYS:
+      setattr(self, name, arrays[name])
+    self._vocab = None
+
+  def __len__(self):
+    return len(self.example_id)
+
+  @property
+  def vocab(self):
+    """List of the token strings, indexed by token id."""
+    if self._vocab is None:
+      # Tokens contain no blanks, see `PackedDataWriter.close`.
+      vocab = self.vocab_bytes.tobytes().decode("utf8")
+      self._vocab = vocab.split(" ") if len(self.vocab_splits) > 1 else []
+    return self._vocab
+
+  def __getitem__(self, i):
+    """Returns the `PackedExample` of row `i`, made of array views."""
+    annotation_start = self.annotation_splits[i]
+    annotation_end = self.annotation_splits[i + 1]
+    short_answer_splits = self.short_answer_splits[annotation_start:
+                                                   annotation_end + 1]
+    return PackedExample(
+        example_id=int(self.example_id[i]),
+        token_ids=self.token_ids[self.token_splits[i]:self.token_splits[i + 1]],
+        candidates=self.candidates[self.candidate_splits[i]:
+                                   self.candidate_splits[i + 1]],
+        annotation_ids=self.annotation_ids[annotation_start:annotation_end],
+        long_answers=self.long_answers[annotation_start:annotation_end],
+        yes_no_answers=self.yes_no_answers[annotation_start:annotation_end],
+        short_answers=[
+            self.short_answers[start:end]
+            for start, end in zip(short_answer_splits[:-1],
+                                  short_answer_splits[1:])
+        ])
+
+  def __iter__(self):
+    for i in range(len(self)):
+      yield self[i]
+
+  def get_question_text(self, i):
+    return _unpack_string(self.question_bytes, self.question_splits, i)
+
+  def get_document_url(self, i):
+    return _unpack_string(self.url_bytes, self.url_splits, i)
+
+  def get_tokens(self, i):
+    """Returns the list of token strings of row `i`."""
+    vocab = self.vocab
+    return [vocab[token_id] for token_id in self[i].token_ids]
+
+  def to_simplified_example(self, i):
+    """Returns the simplified NQ example of row `i`, as in the jsonl data."""
+    example = self[i]
+    annotations = []
+    for a in range(len(example.annotation_ids)):
+      long_answer = example.long_answers[a]
+      annotations.append({
+          "annotation_id": int(example.annotation_ids[a]),
+          "long_answer": {
+              "start_token": int(long_answer[0]),
+              "end_token": int(long_answer[1]),
+              "candidate_index": int(long_answer[2]),
+          },
+          "short_answers": [{
+              "start_token": int(start_token),
+              "end_token": int(end_token)
+          } for start_token, end_token in example.short_answers[a]],
+          "yes_no_answer": YES_NO_ANSWERS[example.yes_no_answers[a]],
+      })
+    return {
+        "question_text": self.get_question_text(i),
+        "example_id": example.example_id,
+        "document_url": self.get_document_url(i),
+        "document_text": " ".join(self.get_tokens(i)),
+        "long_answer_candidates": [{
+            "start_token": int(start_token),
+            "end_token": int(end_token),
+            "top_level": bool(top_level)
+        } for start_token, end_token, top_level in example.candidates],
+        "annotations": annotations,
+    }
+
+
+def load_packed_data(directory, mmap_mode="r"):
+  """Opens a `PackedData` written by `PackedDataWriter`."""
+  return PackedData(**array_store.load_arrays(
+      directory, PACKED_DATA_ARRAYS, mmap_mode=mmap_mode))
+
+
+class PackedDataWriter(object):
+  """Writes simplified NQ examples to a packed directory.
+
+  The token ids are streamed to a temporary file as examples are written, and
+  the other arrays are kept in memory until `close`.
+  """
+
+  def __init__(self, directory):
+    self.directory = directory
+    fd, self._token_ids_path = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(directory)), prefix=".tmp-")
+    self._token_ids_file = os.fdopen(fd, "wb")
+    self._num_token_ids = 0
+    self._vocab = {}
+    self._example_ids = []
+    self._questions = []
+    self._urls = []
+    self._num_tokens = []
+    self._candidates = []
+    self._num_candidates = []
+    self._annotation_ids = []
+    self._long_answers = []
+    self._yes_no_answers = []
+    self._num_annotations = []
+    self._short_answers = []
+    self._num_short_answers = []
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    if exc_type is None:
+      self.close()
+    else:
+      self._token_ids_file.close()
+      os.remove(self._token_ids_path)
+
+  def _write_token_ids(self, token_ids):
+    token_ids.astype(np.uint32, copy=False).tofile(self._token_ids_file)
+    self._num_token_ids += len(token_ids)
+
+  def write(self, simplified_nq_example):
+    """Adds a simplified NQ example, see `text_utils.simplify_nq_example`."""
+    vocab = self._vocab
+    get_id = vocab.setdefault
+    tokens = simplified_nq_example["document_text"].split(" ")
+    self._write_token_ids(
+        np.array([get_id(token, len(vocab)) for token in tokens],
+                 dtype=np.uint32))
+    if len(vocab) > np.iinfo(np.uint32).max:
+      raise ValueError("Vocabulary does not fit in uint32 token ids.")
+
+    self._example_ids.append(simplified_nq_example["example_id"])
+    self._questions.append(simplified_nq_example["question_text"])
+    self._urls.append(simplified_nq_example["document_url"])
+    self._num_tokens.append(len(tokens))
+
+    candidates = simplified_nq_example["long_answer_candidates"]
+    self._candidates.append(
+        np.array([(c["start_token"], c["end_token"], c["top_level"])
+                  for c in candidates],
+                 dtype=np.int32).reshape(-1, 3))
+    self._num_candidates.append(len(candidates))
+
+    annotations = simplified_nq_example["annotations"]
+    for annotation in annotations:
+      long_answer = annotation["long_answer"]
+      self._annotation_ids.append(annotation["annotation_id"])
+      self._long_answers.append(
+          (long_answer["start_token"], long_answer["end_token"],
+           long_answer["candidate_index"]))
+      self._yes_no_answers.append(
+          YES_NO_ANSWERS.index(annotation["yes_no_answer"]))
+      self._short_answers.extend(
+          [(sa["start_token"], sa["end_token"])
+           for sa in annotation["short_answers"]])
+      self._num_short_answers.append(len(annotation["short_answers"]))
+    self._num_annotations.append(len(annotations))
+
+  def write_packed_data(self, packed):
+    """Adds all examples of a `PackedData`, remapping its token ids."""
+    vocab = self._vocab
+    get_id = vocab.setdefault
+    remap = np.array([get_id(token, len(vocab)) for token in packed.vocab],
+                     dtype=np.uint32)
+    for start in range(0, len(packed.token_ids), _REMAP_CHUNK):
+      self._write_token_ids(remap[packed.token_ids[start:start +
+                                                   _REMAP_CHUNK]])
+
+    self._example_ids.extend(packed.example_id.tolist())
+    self._questions.extend(
+        [packed.get_question_text(i) for i in range(len(packed))])
+    self._urls.extend([packed.get_document_url(i) for i in range(len(packed))])
+    self._num_tokens.extend(np.diff(packed.token_splits).tolist())
+    self._candidates.append(np.asarray(packed.candidates))
+    self._num_candidates.extend(np.diff(packed.candidate_splits).tolist())
+    self._annotation_ids.extend(packed.annotation_ids.tolist())
+    self._long_answers.extend(map(tuple, packed.long_answers.tolist()))
+    self._yes_no_answers.extend(packed.yes_no_answers.tolist())
+    self._num_annotations.extend(np.diff(packed.annotation_splits).tolist())
+    self._short_answers.extend(map(tuple, packed.short_answers.tolist()))
+    self._num_short_answers.extend(
+        np.diff(packed.short_answer_splits).tolist())
+
+  def close(self):
+    """Writes the packed directory."""
+    self._token_ids_file.close()
+    try:
+      if self._num_token_ids:
+        token_ids = np.memmap(
+            self._token_ids_path, dtype=np.uint32, mode="r",
+            shape=(self._num_token_ids,))
+      else:
+        token_ids = np.zeros(0, dtype=np.uint32)
+      # Tokens contain no blanks, so the vocabulary is stored blank separated
+      # and decoded with a single split.
+      vocab = sorted(self._vocab, key=self._vocab.get)
+      vocab_bytes = np.frombuffer(
+          " ".join(vocab).encode("utf8"), dtype=np.uint8)
+      vocab_splits = _splits([len(token.encode("utf8")) + 1 for token in vocab])
+      question_bytes, question_splits = _pack_strings(self._questions)
+      url_bytes, url_splits = _pack_strings(self._urls)
+      array_store.save_arrays(self.directory, {
+          "example_id": np.array(self._example_ids, dtype=np.int64),
+          "vocab_bytes": vocab_bytes,
+          "vocab_splits": vocab_splits,
+          "question_bytes": question_bytes,
+          "question_splits": question_splits,
+          "url_bytes": url_bytes,
+          "url_splits": url_splits,
+          "token_splits": _splits(self._num_tokens),
+          "token_ids": token_ids,
+          "candidate_splits": _splits(self._num_candidates),
+          "candidates": _concatenate(self._candidates, (0, 3), np.int32),
+          "annotation_splits": _splits(self._num_annotations),
+          "annotation_ids": np.array(self._annotation_ids, dtype=np.uint64),
+          "long_answers": np.array(
+              self._long_answers, dtype=np.int32).reshape(-1, 3),
+          "yes_no_answers": np.array(self._yes_no_answers, dtype=np.int8),
+          "short_answer_splits": _splits(self._num_short_answers),
+          "short_answers": np.array(
+              self._short_answers, dtype=np.int32).reshape(-1, 2),
+      })
+      del token_ids
+    finally:
+      os.remove(self._token_ids_path)
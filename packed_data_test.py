@@ -0,0 +1,104 @@
+# coding=utf-8
+# Copyright 2018 The Google AI Language Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Testing code for packed_data."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+
+import numpy as np
+import packed_data
+import tensorflow.compat.v1 as tf
+
+
+def make_example(example_id, document_text, yes_no_answer="NONE"):
+  return {
+      "question_text": u"what is ☃ %d" % example_id,
+      "example_id": example_id,
+      "document_url": "http://wikipedia.org/en/%d" % example_id,
+      "document_text": document_text,
+      "long_answer_candidates": [
+          {"start_token": 0, "end_token": 4, "top_level": True},
+          {"start_token": 1, "end_token": 3, "top_level": False},
+      ],
+      "annotations": [{
+          "annotation_id": 2**63 + example_id,
+          "long_answer": {
+              "start_token": 0,
+              "end_token": 4,
+              "candidate_index": 0
+          },
+          "short_answers": [{"start_token": 1, "end_token": 2},
+                            {"start_token": 2, "end_token": 3}],
+          "yes_no_answer": yes_no_answer,
+      }, {
+          "annotation_id": 10 + example_id,
+          "long_answer": {
+              "start_token": -1,
+              "end_token": -1,
+              "candidate_index": -1
+          },
+          "short_answers": [],
+          "yes_no_answer": "NONE",
+      }],
+  }
+
+
+class PackedDataTest(tf.test.TestCase):
+  """Testing codes for packed_data"""
+
+  def write(self, name, examples):
+    directory = os.path.join(self.get_temp_dir(), name)
+    with packed_data.PackedDataWriter(directory) as writer:
+      for example in examples:
+        writer.write(example)
+    return packed_data.load_packed_data(directory)
+
+  def testRoundTrip(self):
+    examples = [
+        make_example(1, u"<P> café  au_lait </P>"),
+        make_example(-2, u"<P> café </P> x", yes_no_answer="YES"),
+    ]
+    data = self.write("packed", examples)
+
+    self.assertLen(data, 2)
+    for i, example in enumerate(examples):
+      self.assertEqual(data.to_simplified_example(i), example)
+    self.assertIsInstance(data[1].token_ids, np.memmap)
+    self.assertAllEqual(data[1].token_ids, [0, 1, 4, 5])
+    self.assertAllEqual(data[0].short_answers[0], [[1, 2], [2, 3]])
+    self.assertEqual(data.get_tokens(0), [u"<P>", u"café", u"", u"au_lait",
+                                          u"</P>"])
+
+  def testWritePackedData(self):
+    first = self.write("first", [make_example(1, "a b c d")])
+    second = self.write("second", [make_example(2, "d c e f")])
+    directory = os.path.join(self.get_temp_dir(), "merged")
+    with packed_data.PackedDataWriter(directory) as writer:
+      writer.write_packed_data(first)
+      writer.write_packed_data(second)
+    merged = packed_data.load_packed_data(directory)
+
+    self.assertEqual(merged.vocab, ["a", "b", "c", "d", "e", "f"])
+    self.assertEqual(merged.to_simplified_example(0),
+                     first.to_simplified_example(0))
+    self.assertEqual(merged.to_simplified_example(1),
+                     second.to_simplified_example(0))
+
+
+if __name__ == "__main__":
+  tf.test.main()
@@ -0,0 +1,262 @@
+# coding=utf-8
+# Copyright 2018 The Google AI Language Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+r"""Stage-level timing and memory profiles of evaluation runs.
+
+Example usage:
+
+  nq_eval --gold_path=<path-to-gold-files> --predictions_path=<path_to_json> \
+    --profile_path=profile.json --profile_trace_path=trace.json
+
+A `Profiler` collects events, each a dictionary with:
+
+  name: Name of the stage, e.g. `read_gold` or `parse`.
+  pid, tid: Process and thread that ran the stage.
+  start: Start time, in seconds since the epoch.
+  wall_seconds: Wall time of the stage.
+  cpu_seconds: CPU time of the stage, of the whole process for the stages of
+    `Profiler.stage`, and of the thread or worker process that ran it for
+    the events of a `Timer`.
+  peak_rss_bytes: Peak resident set size of the process at the end of the
+    stage, or None if it is unknown on this platform.
+  counts: Dictionary of item counts, e.g. the number of examples or bytes.
+
+The stages of the main thread are recorded with `Profiler.stage`. Work done
+in other threads or in pool processes is timed with a `Timer`, whose events
+are picklable and are added to the profiler by the main process.
+
+`Profiler.report` aggregates the events by stage and by worker into a JSON
+report, and `Profiler.chrome_trace` converts them to the Chrome trace event
+format, which can be loaded into chrome://tracing or https://ui.perfetto.dev.
+
+Functions that take an optional profiler use `ensure(profiler)`, so that
+profiling costs nothing more than a few no-op calls when it is disabled.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+
+try:
+  import resource  # pylint: disable=g-import-not-at-top
+except ImportError:
+  resource = None
+
+# `ru_maxrss` is in kilobytes, except on macOS where it is in bytes.
+_RSS_UNIT = 1 if sys.platform == 'darwin' else 1024
+
+
+def peak_rss_bytes(who='self'):
+  """Returns the peak RSS of this process or of its children, or None.
+
+  Args:
+    who ('self'): `self` for this process, `children` for the largest of its
+      terminated and waited for child processes.
+  """
+  if resource is None:
+    return None
+  usage = resource.getrusage(
+      resource.RUSAGE_SELF if who == 'self' else resource.RUSAGE_CHILDREN)
+  return usage.ru_maxrss * _RSS_UNIT
+
+
+class Timer(object):
+  """Times one stage of work in the current thread or process."""
+
+  def __init__(self, thread_cpu=False):
+    """Starts the timer.
+
+    Args:
+      thread_cpu (False): Whether to measure the CPU time of the current
+        thread instead of the whole process.
+    """
+    self._cpu_clock = time.thread_time if thread_cpu else time.process_time
+    self.start = time.time()
+    self._cpu_start = self._cpu_clock()
+
+  def event(self, name, **counts):
+    """Returns the event of the stage `name`, ending now."""
+    return {
+        'name': name,
+        'pid': os.getpid(),
+        'tid': threading.current_thread().ident,
+        'start': self.start,
+        'wall_seconds': time.time() - self.start,
+        'cpu_seconds': self._cpu_clock() - self._cpu_start,
+        'peak_rss_bytes': peak_rss_bytes(),
+        'counts': counts,
+    }
+
+
+def _add_counts(total, counts):
+  for name, count in counts.items():
+    total[name] = total.get(name, 0) + count
+
+
+def _aggregate(events):
+  """Returns the total times, peak RSS and counts of `events`."""
+  peak_rss = [e['peak_rss_bytes'] for e in events
+              if e['peak_rss_bytes'] is not None]
+  counts = collections.OrderedDict()
+  for event in events:
+    _add_counts(counts, event['counts'])
+  return collections.OrderedDict([
+      ('num_events', len(events)),
+      ('wall_seconds', sum(e['wall_seconds'] for e in events)),
+      ('cpu_seconds', sum(e['cpu_seconds'] for e in events)),
+      ('peak_rss_bytes', max(peak_rss) if peak_rss else None),
+      ('counts', counts),
+  ])
+
+
+class Profiler(object):
+  """Collects the events of the stages of a run, see module doc."""
+
+  enabled = True
+
+  def __init__(self):
+    self.start = time.time()
+    self._cpu_start = time.process_time()
+    self.pid = os.getpid()
+    self.tid = threading.current_thread().ident
+    self.events = []
+    self._lock = threading.Lock()
+
+  def add_event(self, event):
+    """Adds an event of a `Timer`, e.g. one returned by a pool process."""
+    with self._lock:
+      self.events.append(event)
+
+  @contextlib.contextmanager
+  def stage(self, name, **counts):
+    """Records the wall time, CPU time and peak RSS of a `with` block.
+
+    Args:
+      name: Name of the stage.
+      **counts: Initial item counts of the stage.
+
+    Yields:
+      The dictionary of counts of the stage, which the block may update.
+    """
+    timer = Timer()
+    counts = dict(counts)
+    try:
+      yield counts
+    finally:
+      self.add_event(timer.event(name, **counts))
+
+  def report(self):
+    """Returns the profile as a JSON serializable OrderedDict.
+
+    The report has the wall time, CPU time and peak RSS of the whole run, the
+    events aggregated by stage name, the events of every thread or process
+    other than the main thread aggregated by stage name, and the events.
+    """
+    with self._lock:
+      events = sorted(self.events, key=lambda e: e['start'])
+    by_stage = collections.OrderedDict()
+    by_worker = collections.OrderedDict()
+    for event in events:
+      by_stage.setdefault(event['name'], []).append(event)
+      if (event['pid'], event['tid']) != (self.pid, self.tid):
+        worker = by_worker.setdefault((event['pid'], event['tid']),
+                                      collections.OrderedDict())
+        worker.setdefault(event['name'], []).append(event)
+
+    workers = []
+    for (pid, tid), stages in by_worker.items():
+      workers.append(collections.OrderedDict([
+          ('pid', pid),
+          ('tid', tid),
+          ('stages', collections.OrderedDict([
+              (name, _aggregate(stage_events))
+              for name, stage_events in stages.items()
+          ])),
+      ]))
+    return collections.OrderedDict([
+        ('wall_seconds', time.time() - self.start),
+        ('cpu_seconds', time.process_time() - self._cpu_start),
+        ('peak_rss_bytes', peak_rss_bytes()),
+        ('children_peak_rss_bytes', peak_rss_bytes('children')),
+        ('stages', collections.OrderedDict([
+            (name, _aggregate(stage_events))
+            for name, stage_events in by_stage.items()
+        ])),
+        ('workers', workers),
+        ('events', events),
+    ])
+
+  def chrome_trace(self):
+    """Returns the events in the Chrome trace event format."""
+    with self._lock:
+      events = list(self.events)
+    trace_events = [{
+        'name': 'process_name',
+        'ph': 'M',
+        'pid': pid,
+        'args': {'name': 'main' if pid == self.pid else 'worker'},
+    } for pid in sorted(set([e['pid'] for e in events] + [self.pid]))]
+    for event in events:
+      args = dict(event['counts'])
+      args['cpu_seconds'] = event['cpu_seconds']
+      args['peak_rss_bytes'] = event['peak_rss_bytes']
+      trace_events.append({
+          'name': event['name'],
+          'ph': 'X',
+          'pid': event['pid'],
+          'tid': event['tid'],
+          'ts': (event['start'] - self.start) * 1e6,
+          'dur': event['wall_seconds'] * 1e6,
+          'args': args,
+      })
+    return {'traceEvents': trace_events, 'displayTimeUnit': 'ms'}
+
+  def write_report(self, path):
+    """Writes `report` to `path` as JSON."""
+    with open(path, 'w') as f:
+      json.dump(self.report(), f, indent=2)
+
+  def write_chrome_trace(self, path):
+    """Writes `chrome_trace` to `path` as JSON."""
+    with open(path, 'w') as f:
+      json.dump(self.chrome_trace(), f)
+
+
+class _NullProfiler(object):
+  """A `Profiler` that records nothing."""
+
+  enabled = False
+
+  def add_event(self, event):
+    pass
+
+  @contextlib.contextmanager
+  def stage(self, name, **counts):
+    yield dict(counts)
+
+
+_NULL_PROFILER = _NullProfiler()
+
+
+def ensure(profiler):
+  """Returns `profiler`, or a profiler that records nothing if it is None."""
+  return _NULL_PROFILER if profiler is None else profiler
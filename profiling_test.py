@@ -0,0 +1,82 @@
+# coding=utf-8
+# Copyright 2018 The Google AI Language Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Testing code for profiling."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+import os
+
+import profiling
+import tensorflow.compat.v1 as tf
+
+
+class ProfilingTest(tf.test.TestCase):
+
+  def testStages(self):
+    profiler = profiling.Profiler()
+    for _ in range(2):
+      with profiler.stage('read', files=1) as counts:
+        counts['examples'] = 3
+    profiler.add_event(profiling.Timer(thread_cpu=True).event('parse', bytes=5))
+    with profiler.stage('score'):
+      pass
+
+    report = profiler.report()
+    self.assertEqual(list(report['stages'].keys()), ['read', 'parse', 'score'])
+    read = report['stages']['read']
+    self.assertEqual(read['num_events'], 2)
+    self.assertEqual(read['counts'], {'files': 2, 'examples': 6})
+    self.assertGreaterEqual(read['wall_seconds'], 0)
+    self.assertGreater(report['peak_rss_bytes'], 0)
+    self.assertEqual(report['workers'], [])
+    self.assertEqual(len(report['events']), 4)
+
+  def testWorkerEvents(self):
+    profiler = profiling.Profiler()
+    event = profiling.Timer().event('parse', examples=2)
+    event['pid'] += 1
+    profiler.add_event(event)
+    workers = profiler.report()['workers']
+    self.assertEqual(len(workers), 1)
+    self.assertEqual(workers[0]['pid'], event['pid'])
+    self.assertEqual(workers[0]['stages']['parse']['counts'], {'examples': 2})
+
+  def testChromeTrace(self):
+    profiler = profiling.Profiler()
+    with profiler.stage('read', examples=1):
+      pass
+    path = os.path.join(self.get_temp_dir(), 'trace.json')
+    profiler.write_chrome_trace(path)
+    with open(path) as f:
+      events = json.load(f)['traceEvents']
+    self.assertEqual([e['ph'] for e in events], ['M', 'X'])
+    self.assertEqual(events[1]['name'], 'read')
+    self.assertEqual(events[1]['args']['examples'], 1)
+    self.assertGreaterEqual(events[1]['ts'], 0)
+
+  def testNullProfiler(self):
+    profiler = profiling.ensure(None)
+    self.assertFalse(profiler.enabled)
+    with profiler.stage('read', examples=1) as counts:
+      counts['examples'] += 1
+    profiled = profiling.Profiler()
+    self.assertIs(profiling.ensure(profiled), profiled)
+
+
+if __name__ == '__main__':
+  tf.test.main()
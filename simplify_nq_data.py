@@ -27,15 +27,21 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import contextlib
 import glob
 import gzip
 import json
+import multiprocessing
 import os
+import shutil
 import time
 
 from absl import app
 from absl import flags
 
+import json_utils
+import offset_table
+import packed_data
 import text_utils as text_utils
 
 FLAGS = flags.FLAGS
@@ -44,31 +50,240 @@ flags.DEFINE_string(
     "data_dir", None, "Path to directory containing original NQ"
     "files, matching the pattern `nq-<split>-??.jsonl.gz`.")
 
+flags.DEFINE_integer(
+    "num_workers", 1, "Number of processes used to simplify shards in "
+    "parallel. With 1, all shards are processed in this process.")
+
+flags.DEFINE_enum(
+    "output_mode", "merged", ["merged", "sharded"],
+    "Whether to write a single `simplified-nq-<split>.jsonl.gz` file, with "
+    "examples in the order of the sorted input shards, or one "
+    "`simplified-nq-<split>-??.jsonl.gz` file per input shard.")
+
+flags.DEFINE_boolean(
+    "write_offsets", False, "Whether to write an `offset_table.OffsetTable` "
+    "with the byte offsets of the original tokens next to each output file, "
+    "e.g. `simplified-nq-<split>.offsets` for the merged output.")
+
+flags.DEFINE_boolean(
+    "write_packed", False, "Whether to also write the simplified examples in "
+    "the binary format of `packed_data` next to each output file, e.g. "
+    "`simplified-nq-<split>.packed` for the merged output.")
+
+
+def offsets_path(outpath):
+  """Returns the directory of the offset table of a simplified output file."""
+  return outpath[:-len(".jsonl.gz")] + ".offsets"
+
+
+def packed_path(outpath):
+  """Returns the directory of the packed data of a simplified output file."""
+  return outpath[:-len(".jsonl.gz")] + ".packed"
+
+
+@contextlib.contextmanager
+def _output_writers(outpath, write_offsets, write_packed):
+  """Yields the (offset table, packed data) writers of `outpath`, or Nones.
+
+  The writers are closed if the block succeeds. If it raises, their temporary
+  files are removed and no output directory is written.
+  """
+  with contextlib.ExitStack() as stack:
+    offsets_writer = None
+    if write_offsets:
+      offsets_writer = stack.enter_context(
+          offset_table.OffsetTableWriter(offsets_path(outpath)))
+    packed_writer = None
+    if write_packed:
+      packed_writer = stack.enter_context(
+          packed_data.PackedDataWriter(packed_path(outpath)))
+    yield offsets_writer, packed_writer
+
+
+def _remove_outputs(outpath):
+  """Removes a simplified output file and its offset table and packed data."""
+  if os.path.exists(outpath):
+    os.remove(outpath)
+  shutil.rmtree(offsets_path(outpath), ignore_errors=True)
+  shutil.rmtree(packed_path(outpath), ignore_errors=True)
+
+
+def _simplify_line(l, offsets_writer, packed_writer):
+  """Returns the simplified jsonl line of an original NQ jsonl line."""
+  nq_example = json_utils.loads(l.decode("utf8", "strict"))
+  if offsets_writer:
+    offsets_writer.add(nq_example)
+  simplified_nq_example = text_utils.fast_simplify_nq_example(nq_example)
+  if packed_writer:
+    packed_writer.write(simplified_nq_example)
+  return (json.dumps(simplified_nq_example) + u"\n").encode("utf8")
+
+
+def simplify_shard(inpath, outpath, write_offsets=False, write_packed=False):
+  """Runs `text_utils.simplify_nq_example` over all examples in one shard.
+
+  If the shard fails, its partial outputs are removed.
+
+  Args:
+    inpath: Path to a gzipped shard in the original NQ format.
+    outpath: Path to write the gzipped simplified examples to.
+    write_offsets (False): Whether to also write the offset table of the
+      shard to `offsets_path(outpath)`.
+    write_packed (False): Whether to also write the packed data of the shard
+      to `packed_path(outpath)`.
+
+  Returns:
+    Tuple of (outpath, number of examples, seconds taken).
+  """
+  worker = multiprocessing.current_process().name
+  print("[{}] Processing {}".format(worker, inpath))
+  num_processed = 0
+  start = time.time()
+  try:
+    with _output_writers(outpath, write_offsets, write_packed) as writers, \
+        gzip.open(inpath, "rb") as fin, gzip.open(outpath, "wb") as fout:
+      for l in fin:
+        fout.write(_simplify_line(l, *writers))
+        num_processed += 1
+        if not num_processed % 100:
+          elapsed = time.time() - start
+          print("[{}] Processed {} examples from {} in {:.1f}s ({:.1f} "
+                "examples/s).".format(worker, num_processed,
+                                      os.path.basename(inpath), elapsed,
+                                      num_processed / elapsed))
+  except Exception:
+    _remove_outputs(outpath)
+    raise
+  return outpath, num_processed, time.time() - start
+
+
+def _simplify_shard(paths):
+  return simplify_shard(*paths)
+
+
+def _simplify_serially(inpaths, outpath):
+  """Prints simplified examples from all shards to a single gzipped file."""
+  try:
+    with _output_writers(outpath, FLAGS.write_offsets,
+                         FLAGS.write_packed) as writers, \
+        gzip.open(outpath, "wb") as fout:
+      num_processed = 0
+      start = time.time()
+      for inpath in inpaths:
+        print("Processing {}".format(inpath))
+        with gzip.open(inpath, "rb") as fin:
+          for l in fin:
+            fout.write(_simplify_line(l, *writers))
+            num_processed += 1
+            if not num_processed % 100:
+              print("Processed {} examples in {}.".format(
+                  num_processed, time.time() - start))
+  except Exception:
+    _remove_outputs(outpath)
+    raise
+
+
+def _simplify_in_parallel(inpaths, outpath):
+  """Simplifies shards in a process pool.
+
+  Each worker writes one output shard. In the merged mode these are written to
+  temporary files, which are appended to `outpath` in the order of `inpaths`
+  as soon as all preceding shards are done. The concatenation of gzip files is
+  itself a valid gzip file. If a shard fails, the temporary shard outputs and
+  the partly merged output are removed.
+
+  Args:
+    inpaths: Sorted list of input shards.
+    outpath: Path of the merged output, or None to keep one output per shard.
+  """
+  shard_outpaths = []
+  for inpath in inpaths:
+    shard_outpath = os.path.join(
+        os.path.dirname(inpath), "simplified-" + os.path.basename(inpath))
+    if outpath:
+      shard_outpath = os.path.join(
+          os.path.dirname(outpath), ".tmp-" + os.path.basename(shard_outpath))
+    shard_outpaths.append(shard_outpath)
+
+  pool = multiprocessing.Pool(FLAGS.num_workers)
+  try:
+    with contextlib.ExitStack() as stack:
+      fout = None
+      offsets_writer = None
+      packed_writer = None
+      if outpath:
+        fout = stack.enter_context(open(outpath, "wb"))
+        # Shard tables are appended to the merged table as they are done, and
+        # the vocabularies of the packed shards are merged as they are added.
+        offsets_writer, packed_writer = stack.enter_context(
+            _output_writers(outpath, FLAGS.write_offsets, FLAGS.write_packed))
+      num_processed = 0
+      start = time.time()
+      results = pool.imap(
+          _simplify_shard,
+          [(inpath, shard_outpath, FLAGS.write_offsets, FLAGS.write_packed)
+           for inpath, shard_outpath in zip(inpaths, shard_outpaths)])
+      for inpath, (shard_outpath, num_shard, shard_time) in zip(inpaths,
+                                                                results):
+        num_processed += num_shard
+        if fout:
+          with open(shard_outpath, "rb") as fin:
+            shutil.copyfileobj(fin, fout)
+          os.remove(shard_outpath)
+          if offsets_writer:
+            shard_offsets_path = offsets_path(shard_outpath)
+            offsets_writer.add_table(
+                offset_table.load_offset_table(shard_offsets_path))
+            shutil.rmtree(shard_offsets_path)
+          if packed_writer:
+            shard_packed_path = packed_path(shard_outpath)
+            packed_writer.write_packed_data(
+                packed_data.load_packed_data(shard_packed_path))
+            shutil.rmtree(shard_packed_path)
+        elapsed = time.time() - start
+        print("Finished {} ({} examples at {:.1f} examples/s). Total: {} "
+              "examples in {:.1f}s ({:.1f} examples/s).".format(
+                  inpath, num_shard, num_shard / max(shard_time, 1e-9),
+                  num_processed, elapsed, num_processed / elapsed))
+  except Exception:
+    if outpath:
+      _remove_outputs(outpath)
+    raise
+  finally:
+    pool.close()
+    pool.join()
+    if outpath:
+      for shard_outpath in shard_outpaths:
+        _remove_outputs(shard_outpath)
+
 
 def main(_):
   """Runs `text_utils.simplify_nq_example` over all shards of a split.
 
-  Prints simplified examples to a single gzipped file in the same directory
-  as the input shards.
+  By default, prints simplified examples to a single gzipped file in the same
+  directory as the input shards. With `--output_mode=sharded`, each input
+  shard `nq-<split>-XX.jsonl.gz` is simplified into
+  `simplified-nq-<split>-XX.jsonl.gz`.
   """
   split = os.path.basename(FLAGS.data_dir)
-  outpath = os.path.join(FLAGS.data_dir,
-                         "simplified-nq-{}.jsonl.gz".format(split))
-  with gzip.open(outpath, "wb") as fout:
-    num_processed = 0
-    start = time.time()
-    for inpath in glob.glob(os.path.join(FLAGS.data_dir, "nq-*-??.jsonl.gz")):
-      print("Processing {}".format(inpath))
-      with gzip.open(inpath, "rb") as fin:
-        for l in fin:
-          utf8_in = l.decode("utf8", "strict")
-          utf8_out = json.dumps(
-              text_utils.simplify_nq_example(json.loads(utf8_in))) + u"\n"
-          fout.write(utf8_out.encode("utf8"))
-          num_processed += 1
-          if not num_processed % 100:
-            print("Processed {} examples in {}.".format(num_processed,
-                                                        time.time() - start))
+  inpaths = sorted(glob.glob(os.path.join(FLAGS.data_dir, "nq-*-??.jsonl.gz")))
+  outpath = None
+  if FLAGS.output_mode == "merged":
+    outpath = os.path.join(FLAGS.data_dir,
+                           "simplified-nq-{}.jsonl.gz".format(split))
+
+  if FLAGS.num_workers > 1:
+    _simplify_in_parallel(inpaths, outpath)
+  elif outpath:
+    _simplify_serially(inpaths, outpath)
+  else:
+    for inpath in inpaths:
+      simplify_shard(
+          inpath,
+          os.path.join(FLAGS.data_dir,
+                       "simplified-" + os.path.basename(inpath)),
+          write_offsets=FLAGS.write_offsets,
+          write_packed=FLAGS.write_packed)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,379 @@
+# coding=utf-8
+# Copyright 2018 The Google AI Language Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+r"""Computes the nq_eval metrics on slices of the evaluation examples.
+
+Example usage:
+
+  sliced_eval --gold_path=<path-to-gold-files> \
+    --predictions_path=<path_to_json> --output_path=slices.csv \
+    --output_format=csv
+
+Examples are described by features read from the gold jsonl files, see
+`example_features`, so --gold_path must be gzipped jsonl rather than a gold
+store directory. Only the few fields that the features need are decoded from
+each line, see `scan_example_features`. Slices are predicates on these
+features, e.g. "the gold long answer is a table" or "the question starts with
+`who`". Every predicate is evaluated once per example into a (num_slices,
+num_examples) boolean matrix, and the PR curves of all slices are computed in
+a single vectorized pass with `batch_eval.compute_weighted_pr_curves`.
+
+The output has one row per slice and answer type, with the number of
+examples and the best threshold and R@P metrics of nq_eval.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+import csv
+import glob
+import gzip
+import json
+import multiprocessing
+import re
+import sys
+
+from absl import app
+from absl import flags
+import batch_eval
+import eval_utils as util
+import json_utils
+import nq_eval as ev
+import numpy as np
+
+FLAGS = flags.FLAGS
+
+
+def define_flags():
+  """Defines the flags of sliced_eval.
+
+  Only called from `__main__`: `output_path` and `output_format` are also
+  flags of nq_eval_sweep, which may be imported in the same process.
+  """
+  flags.DEFINE_string('output_path', None,
+                      'Path to write the slice table to. Defaults to stdout.')
+  flags.DEFINE_enum('output_format', 'csv', ['jsonl', 'csv'],
+                    'Format of the slice table.')
+  flags.DEFINE_list('length_buckets', ['1000', '5000', '20000'],
+                    'Boundaries of the document length slices, in tokens.')
+  flags.DEFINE_integer('num_question_prefixes', 10,
+                       'Number of most common question prefixes to slice by.')
+
+
+# Precision targets for the R@P metrics, as reported by nq_eval.
+TARGETS = (0.5, 0.75, 0.9)
+
+# Fields of the NQ examples used by `example_features`.
+_FEATURE_FIELDS = ('example_id', 'question_text', 'document_tokens',
+                   'document_text', 'annotations')
+
+# Long answer types, by the HTML tag that starts the long answer.
+_LONG_ANSWER_TYPES = {
+    'p': 'paragraph',
+    'table': 'table',
+    'tr': 'table',
+    'ul': 'list',
+    'ol': 'list',
+    'dl': 'list',
+    'li': 'list',
+}
+
+# Quotes inside JSON strings are escaped, so these patterns can only match
+# object keys, as in `eval_utils.scan_gold_fields`.
+_TOKEN_KEY = b'"token":'
+_QUESTION_TEXT_KEY = b'"question_text":'
+_DOCUMENT_TOKENS_KEY = b'"document_tokens":'
+_STRING_RE = re.compile(br'\s*("(?:[^"\\]|\\.)*")')
+
+ExampleFeatures = collections.namedtuple(
+    'ExampleFeatures',
+    ['question_prefix', 'num_tokens', 'long_answer_type', 'short_answer_type'])
+
+
+def _features(question_text, num_tokens, get_token, annotations):
+  """Returns the `ExampleFeatures`, see `example_features`."""
+  long_answer_types = collections.Counter()
+  short_answer_type = 'none'
+  for annotation in annotations:
+    start_token = annotation['long_answer']['start_token']
+    if start_token >= 0:
+      tag = get_token(start_token).strip('<>').split(' ')[0].lower()
+      long_answer_types[_LONG_ANSWER_TYPES.get(tag, 'other')] += 1
+    if annotation['yes_no_answer'] != 'NONE':
+      short_answer_type = 'yes_no'
+    elif annotation['short_answers'] and short_answer_type == 'none':
+      short_answer_type = 'span'
+
+  long_answer_type = 'none'
+  if long_answer_types:
+    long_answer_type = long_answer_types.most_common(1)[0][0]
+  question_words = question_text.split()
+  return ExampleFeatures(
+      question_prefix=question_words[0].lower() if question_words else '',
+      num_tokens=num_tokens,
+      long_answer_type=long_answer_type,
+      short_answer_type=short_answer_type)
+
+
+def example_features(json_example):
+  """Returns the `ExampleFeatures` of a full or simplified NQ example.
+
+  Args:
+    json_example: Dictionary with at least the fields of `_FEATURE_FIELDS`.
+
+  Returns:
+    `ExampleFeatures` with:
+      question_prefix: First word of the question, lower cased.
+      num_tokens: Number of document tokens.
+      long_answer_type: `paragraph`, `table`, `list` or `other`, by the
+        first token of the gold long answers, or `none`. If the annotators
+        disagree, the most common type wins.
+      short_answer_type: `yes_no` if an annotator gave a yes/no answer,
+        `span` if an annotator gave a short answer span, and `none` otherwise.
+  """
+  if 'document_tokens' in json_example:
+    tokens = [token['token'] for token in json_example['document_tokens']]
+  else:
+    tokens = json_example['document_text'].split(' ')
+  return _features(json_example['question_text'], len(tokens),
+                   tokens.__getitem__, json_example['annotations'])
+
+
+def scan_example_features(line):
+  """Returns the `ExampleFeatures` of a serialized example in the NQ format.
+
+  Only the annotations, the question and the document tokens that start a
+  long answer are decoded. The tokens are counted and located by their
+  `"token":` keys in the raw bytes, so the dictionaries of
+  `document_tokens`, which make up most of every line, are never parsed.
+
+  Args:
+    line: A serialized example in the original NQ format, as bytes.
+
+  Returns:
+    A tuple of the example id and its `ExampleFeatures`, or None if the line
+    does not have the expected layout. Such lines must be fully decoded
+    instead.
+  """
+  if (line.count(_QUESTION_TEXT_KEY) != 1 or
+      line.count(_DOCUMENT_TOKENS_KEY) != 1):
+    return None
+  gold = util.scan_gold_fields(line)
+  question_text = _STRING_RE.match(
+      line, line.find(_QUESTION_TEXT_KEY) + len(_QUESTION_TEXT_KEY))
+  if gold is None or question_text is None:
+    return None
+  num_tokens = line.count(_TOKEN_KEY)
+  last_token = max([a['long_answer']['start_token']
+                    for a in gold['annotations']] + [-1])
+  # The text after the i-th `"token":` key starts with the i-th token.
+  token_values = line.split(_TOKEN_KEY, last_token + 1)[1:]
+
+  def get_token(i):
+    return json.loads(_STRING_RE.match(token_values[i]).group(1))
+
+  try:
+    features = _features(
+        json.loads(question_text.group(1)), num_tokens, get_token,
+        gold['annotations'])
+  except (AttributeError, IndexError, ValueError):
+    return None
+  return gold['example_id'], features
+
+
+def read_features_from_one_split(path):
+  """Returns a dict from example id to `ExampleFeatures` for one file."""
+  features = {}
+  with gzip.open(path, 'rb') as input_file:
+    for line in input_file:
+      scanned = scan_example_features(line)
+      if scanned is None:
+        json_example = json_utils.loads_fields(line, _FEATURE_FIELDS)
+        scanned = (json_example['example_id'], example_features(json_example))
+      features[scanned[0]] = scanned[1]
+  return features
+
+
+def read_features(path_name, n_threads=10):
+  """Returns a dict from example id to `ExampleFeatures` for gold files.
+
+  Args:
+    path_name: Glob pattern of gzipped jsonl gold files.
+    n_threads (10): Number of processes.
+
+  Raises:
+    IOError: If `path_name` is a gold store directory, which does not have
+      the questions and documents, or if no files match it.
+  """
+  if util.is_gold_store(path_name):
+    raise IOError('Slice features are read from gzipped jsonl gold files, '
+                  'not from a gold store: %s' % path_name)
+  paths = sorted(glob.glob(path_name))
+  if not paths:
+    raise IOError('No gold files match: %s' % path_name)
+  pool = multiprocessing.Pool(n_threads)
+  try:
+    dict_list = pool.map(read_features_from_one_split, paths)
+  finally:
+    pool.close()
+    pool.join()
+
+  features = {}
+  for single_dict in dict_list:
+    features.update(single_dict)
+  return features
+
+
+def default_slices(features, length_buckets=(1000, 5000, 20000),
+                   num_question_prefixes=10):
+  """Returns an OrderedDict from slice name to predicate on `ExampleFeatures`.
+
+  Args:
+    features: Iterable of the `ExampleFeatures` of the evaluation examples,
+      used to find the most common question prefixes.
+    length_buckets: Increasing boundaries of the document length slices.
+    num_question_prefixes: Number of question prefix slices.
+  """
+  slices = collections.OrderedDict()
+  slices['all'] = lambda f: True
+  for answer_type in ['paragraph', 'table', 'list', 'other', 'none']:
+    slices['long-answer-type=' + answer_type] = (
+        lambda f, t=answer_type: f.long_answer_type == t)
+  for answer_type in ['span', 'yes_no', 'none']:
+    slices['short-answer-type=' + answer_type] = (
+        lambda f, t=answer_type: f.short_answer_type == t)
+
+  bounds = [0] + list(length_buckets) + [None]
+  for low, high in zip(bounds[:-1], bounds[1:]):
+    if high is None:
+      name = 'num-tokens>=%d' % low
+    else:
+      name = 'num-tokens=[%d,%d)' % (low, high)
+    slices[name] = (lambda f, low=low, high=high: f.num_tokens >= low and
+                    (high is None or f.num_tokens < high))
+
+  prefixes = collections.Counter([f.question_prefix for f in features])
+  for prefix, _ in prefixes.most_common(num_question_prefixes):
+    slices['question-prefix=' + prefix] = (
+        lambda f, p=prefix: f.question_prefix == p)
+  return slices
+
+
+def slice_matrix(example_ids, features, slices):
+  """Evaluates every slice predicate once per example.
+
+  Args:
+    example_ids: N example ids.
+    features: Dict from example id to `ExampleFeatures`.
+    slices: OrderedDict from slice name to predicate.
+
+  Returns:
+    (num_slices, N) boolean array.
+
+  Raises:
+    ValueError: If an example has no features.
+  """
+  missing = [i for i in example_ids if i not in features]
+  if missing:
+    raise ValueError('%d examples, e.g. %s, have no slice features.' %
+                     (len(missing), missing[0]))
+  predicates = list(slices.values())
+  matrix = np.zeros((len(predicates), len(example_ids)), dtype=bool)
+  for i, example_id in enumerate(example_ids):
+    example = features[example_id]
+    for s, predicate in enumerate(predicates):
+      matrix[s, i] = predicate(example)
+  return matrix
+
+
+def compute_sliced_metrics(long_answer_stats, short_answer_stats, masks,
+                           slice_names, targets=TARGETS):
+  """Computes the metrics of every slice in one pass per answer type.
+
+  Args:
+    long_answer_stats: `batch_eval.AnswerStatArrays` of N examples.
+    short_answer_stats: `batch_eval.AnswerStatArrays`, aligned with
+      `long_answer_stats`.
+    masks: (num_slices, N) boolean slice matrix.
+    slice_names: Names of the slices.
+    targets: Precision targets for the R@P metrics.
+
+  Returns:
+    List of OrderedDicts, one per slice and answer type.
+  """
+  rows = []
+  num_examples = masks.sum(axis=1)
+  for answer_type, answer_stats in [('long', long_answer_stats),
+                                    ('short', short_answer_stats)]:
+    best, r_at_p = batch_eval.compute_weighted_pr_curves(
+        answer_stats, masks, list(targets))
+    num_gold = (masks & batch_eval.to_stat_arrays(
+        answer_stats).has_gold[None, :]).sum(axis=1)
+    for s, name in enumerate(slice_names):
+      row = collections.OrderedDict([
+          ('slice', name),
+          ('answer-type', answer_type),
+          ('n', int(num_examples[s])),
+          ('n-gold', int(num_gold[s])),
+          ('best-threshold-f1', best[s, 0].item()),
+          ('best-threshold-precision', best[s, 1].item()),
+          ('best-threshold-recall', best[s, 2].item()),
+          ('best-threshold', best[s, 3].item()),
+      ])
+      for t, target in enumerate(targets):
+        row['recall-at-precision>={:.2}'.format(target)] = r_at_p[s, t,
+                                                                   0].item()
+        row['precision-at-precision>={:.2}'.format(target)] = r_at_p[s, t,
+                                                                     1].item()
+      rows.append(row)
+  return rows
+
+
+def main(_):
+  nq_gold_dict = util.read_gold(FLAGS.gold_path, n_threads=FLAGS.num_threads)
+  nq_pred_dict = util.read_prediction_json(FLAGS.predictions_path)
+  long_answer_stats, short_answer_stats = batch_eval.score_answer_arrays(
+      nq_gold_dict, nq_pred_dict)
+  example_ids = sorted(nq_pred_dict.keys())
+
+  features = read_features(FLAGS.gold_path, n_threads=FLAGS.num_threads)
+  slices = default_slices(
+      features.values(),
+      length_buckets=[int(bound) for bound in FLAGS.length_buckets],
+      num_question_prefixes=FLAGS.num_question_prefixes)
+  masks = slice_matrix(example_ids, features, slices)
+  rows = compute_sliced_metrics(long_answer_stats, short_answer_stats, masks,
+                                list(slices.keys()))
+
+  f = open(FLAGS.output_path, 'w') if FLAGS.output_path else sys.stdout
+  try:
+    if FLAGS.output_format == 'csv':
+      writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+      writer.writeheader()
+      writer.writerows(rows)
+    else:
+      for row in rows:
+        f.write(json.dumps(row) + '\n')
+  finally:
+    if f is not sys.stdout:
+      f.close()
+
+
+if __name__ == '__main__':
+  define_flags()
+  flags.mark_flag_as_required('gold_path')
+  flags.mark_flag_as_required('predictions_path')
+  app.run(main)
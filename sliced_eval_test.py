@@ -0,0 +1,126 @@
+# coding=utf-8
+# Copyright 2018 The Google AI Language Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Testing code for sliced_eval."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import gzip
+import json
+import os
+import random
+
+import batch_eval
+import eval_utils as util
+import nq_eval as ev
+import numpy as np
+import sliced_eval
+import tensorflow.compat.v1 as tf
+
+
+def annotation(start_token, yes_no_answer='NONE', num_short_answers=0):
+  return {
+      'long_answer': {'start_token': start_token, 'end_token': start_token + 1,
+                      'start_byte': -1, 'end_byte': -1},
+      'short_answers': [{}] * num_short_answers,
+      'yes_no_answer': yes_no_answer,
+  }
+
+
+class SlicedEvalTest(tf.test.TestCase):
+  """Testing codes for sliced_eval"""
+
+  def testExampleFeatures(self):
+    example = {
+        'question_text': 'Who wrote it',
+        'document_text': '<Table> <Tr> x </Tr> </Table> <P> y </P>',
+        'annotations': [annotation(0, num_short_answers=1), annotation(1),
+                        annotation(5, 'YES'), annotation(-1)],
+    }
+    self.assertEqual(
+        sliced_eval.example_features(example),
+        sliced_eval.ExampleFeatures(
+            question_prefix='who', num_tokens=8, long_answer_type='table',
+            short_answer_type='yes_no'))
+
+  def testScanExampleFeatures(self):
+    """Scanned features are those of the fully decoded example."""
+    tokens = ['<Table>', '<Tr>', 'say "x"', '</Tr>', '</Table>', '<P>', 'token',
+              '</P>']
+    example = {
+        'example_id': 7,
+        'question_text': 'Who wrote "token": it',
+        'document_tokens': [{'token': t, 'start_byte': i, 'end_byte': i + 1,
+                             'html_token': t.startswith('<')}
+                            for i, t in enumerate(tokens)],
+        'annotations': [annotation(5), annotation(0, num_short_answers=1),
+                        annotation(5, 'YES'), annotation(-1)],
+    }
+    for _ in range(2):
+      line = json.dumps(example).encode('utf-8')
+      self.assertEqual(sliced_eval.scan_example_features(line),
+                       (7, sliced_eval.example_features(example)))
+      example['annotations'] = [annotation(-1)]
+    self.assertIsNone(sliced_eval.scan_example_features(
+        json.dumps({'example_id': 7, 'question_text': 'x',
+                    'document_text': '<P> x </P>',
+                    'annotations': []}).encode('utf-8')))
+
+  def testReadFeaturesPaths(self):
+    """Gold stores and unmatched globs are rejected with an IOError."""
+    path = os.path.join(self.get_temp_dir(), 'nq-dev-00.jsonl.gz')
+    with gzip.open(path, 'wt') as f:
+      f.write(json.dumps({
+          'example_id': 1, 'question_text': 'who', 'annotations': [],
+          'document_tokens': [{'token': 'x'}]}) + '\n')
+    self.assertEqual(sliced_eval.read_features(path, n_threads=1),
+                     {1: sliced_eval.ExampleFeatures('who', 1, 'none', 'none')})
+
+    store_path = os.path.join(self.get_temp_dir(), 'gold_store')
+    util.read_gold(path, n_threads=1).save(store_path)
+    with self.assertRaises(IOError):
+      sliced_eval.read_features(store_path)
+    with self.assertRaises(IOError):
+      sliced_eval.read_features(os.path.join(self.get_temp_dir(), 'none-*'))
+
+  def testAllSliceMatchesNqEval(self):
+    """Each slice has the metrics of nq_eval on its examples."""
+    rng = random.Random(0)
+    stats = []
+    for _ in range(300):
+      has_gold = rng.random() < 0.6
+      stats.append((has_gold, rng.random() < 0.8,
+                    has_gold and rng.random() < 0.5, rng.randint(0, 30)))
+    masks = np.array([[True] * len(stats),
+                      [rng.random() < 0.3 for _ in stats]])
+    rows = sliced_eval.compute_sliced_metrics(
+        batch_eval.to_stat_arrays(stats), batch_eval.to_stat_arrays(stats),
+        masks, ['all', 'random'])
+    self.assertEqual([(row['slice'], row['answer-type']) for row in rows],
+                     [('all', 'long'), ('random', 'long'), ('all', 'short'),
+                      ('random', 'short')])
+
+    for row, mask in zip(rows, masks):
+      expected = ev.get_metrics_with_answer_stats(
+          [s for s, m in zip(stats, mask) if m], [])
+      self.assertEqual(row['n'], mask.sum())
+      for key, value in row.items():
+        if 'long-' + key in expected:
+          self.assertEqual(value, expected['long-' + key])
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -0,0 +1,89 @@
+# coding=utf-8
+# Copyright 2018 The Google AI Language Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Random gold and prediction data shared by the tests."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import gzip
+import json
+
+import eval_utils as util
+
+
+def random_span(rng):
+  """Returns a random span, drawn from a small set so that spans collide."""
+  choice = rng.randint(0, 3)
+  start = rng.randint(0, 3)
+  if choice == 0:
+    return util.Span(-1, -1, -1, -1)
+  elif choice == 1:
+    return util.Span(-1, -1, start, start + 2)
+  elif choice == 2:
+    return util.Span(start * 10, start * 10 + 20, -1, -1)
+  return util.Span(start * 10, start * 10 + 20, start, start + 2)
+
+
+def random_label(rng, example_id, score=0):
+  """Returns a random NQLabel, with long score `score` and short `-score`."""
+  yes_no_answer = rng.choice(['none', 'none', 'yes', 'no'])
+  short_span_list = []
+  if yes_no_answer == 'none':
+    short_span_list = [random_span(rng) for _ in range(rng.randint(0, 3))]
+  return util.NQLabel(
+      example_id=example_id,
+      long_answer_span=random_span(rng),
+      short_answer_span_list=short_span_list,
+      long_score=score,
+      short_score=-score,
+      yes_no_answer=yes_no_answer)
+
+
+def random_span_json(rng):
+  """Returns a random span record of the gold or prediction JSON."""
+  if rng.random() < 0.4:
+    return {'start_byte': -1, 'end_byte': -1,
+            'start_token': -1, 'end_token': -1}
+  start = rng.randint(0, 3)
+  return {'start_byte': start, 'end_byte': start + 1,
+          'start_token': start, 'end_token': start + 1}
+
+
+def write_random_gold(path, rng, num_examples):
+  """Writes a gzipped jsonl gold shard with five way annotations."""
+  with gzip.open(path, 'wt') as f:
+    for example_id in range(num_examples):
+      annotations = [{
+          'long_answer': random_span_json(rng),
+          'short_answers': [random_span_json(rng)][:rng.randint(0, 1)],
+          'yes_no_answer': 'NONE',
+      } for _ in range(5)]
+      f.write(json.dumps({'example_id': example_id,
+                          'annotations': annotations}) + '\n')
+
+
+def write_random_predictions(path, rng, num_examples):
+  """Writes random predictions as JSON and returns them."""
+  predictions = [{
+      'example_id': example_id,
+      'long_answer': random_span_json(rng),
+      'long_answer_score': rng.random(),
+      'short_answers': [random_span_json(rng)],
+      'short_answers_score': rng.random(),
+  } for example_id in range(num_examples)]
+  with open(path, 'w') as f:
+    json.dump({'predictions': predictions}, f)
+  return predictions
@@ -142,3 +142,51 @@ def simplify_nq_example(nq_example):
     raise ValueError("Incorrect number of tokens.")
 
   return simplified_nq_example
+
+
+def _without_byte_offsets(span):
+  """Returns a copy of `span` without its `start_byte` and `end_byte`."""
+  return {
+      k: v for k, v in span.items() if k != "start_byte" and k != "end_byte"
+  }
+
+
+def fast_simplify_nq_example(nq_example):
+  """Returns the output of `simplify_nq_example`, computed faster.
+
+  The blanks within tokens are replaced with `str.replace` rather than a
+  regular expression, the number of tokens is checked by counting the blanks
+  of `document_text` rather than splitting it, and `nq_example` is not
+  modified: spans are copied without their byte offsets instead.
+
+  Args:
+    nq_example: Dictionary containing original NQ example fields.
+
+  Returns:
+    Dictionary equal to `simplify_nq_example(nq_example)`.
+  """
+  tokens = nq_example["document_tokens"]
+  text = " ".join([t["token"].replace(" ", "_") for t in tokens])
+  if text.count(" ") + 1 != len(tokens):
+    raise ValueError("Incorrect number of tokens.")
+
+  annotations = []
+  for annotation in nq_example["annotations"]:
+    annotation = dict(annotation)
+    annotation["long_answer"] = _without_byte_offsets(annotation["long_answer"])
+    annotation["short_answers"] = [
+        _without_byte_offsets(sa) for sa in annotation["short_answers"]
+    ]
+    annotations.append(annotation)
+
+  return {
+      "question_text": nq_example["question_text"],
+      "example_id": nq_example["example_id"],
+      "document_url": nq_example["document_url"],
+      "document_text": text,
+      "long_answer_candidates": [
+          _without_byte_offsets(c)
+          for c in nq_example["long_answer_candidates"]
+      ],
+      "annotations": annotations
+  }
@@ -0,0 +1,74 @@
+# coding=utf-8
+# Copyright 2018 The Google AI Language Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Testing code for text_utils."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import copy
+import json
+
+import tensorflow.compat.v1 as tf
+import text_utils
+
+
+def span(start_token, end_token):
+  return {
+      "start_token": start_token,
+      "end_token": end_token,
+      "start_byte": 10 * start_token,
+      "end_byte": 10 * end_token,
+  }
+
+
+class TextUtilsTest(tf.test.TestCase):
+  """Testing codes for text_utils"""
+
+  def testFastSimplifyMatchesSimplify(self):
+    tokens = ["<Table>", "<Td colspan=2>", u"᠎ x", "</Td>", "</Table>"]
+    long_answer = span(0, 5)
+    long_answer["candidate_index"] = 0
+    nq_example = {
+        "example_id": 12,
+        "document_url": "http://wikipedia.org/en/x",
+        "document_html": "",
+        "question_text": "what is x",
+        "document_tokens": [{"token": t, "html_token": False} for t in tokens],
+        "long_answer_candidates": [span(0, 5)],
+        "annotations": [{
+            "annotation_id": 3,
+            "long_answer": long_answer,
+            "short_answers": [span(2, 3)],
+            "yes_no_answer": "NONE",
+        }],
+    }
+    original = copy.deepcopy(nq_example)
+
+    simplified = text_utils.fast_simplify_nq_example(nq_example)
+    self.assertEqual(nq_example, original)
+    self.assertEqual(simplified["document_text"],
+                     u"<Table> <Td_colspan=2> ᠎_x </Td> </Table>")
+    self.assertEqual(
+        json.dumps(simplified), json.dumps(
+            text_utils.simplify_nq_example(nq_example)))
+
+    del nq_example["document_tokens"][:]
+    with self.assertRaises(ValueError):
+      text_utils.fast_simplify_nq_example(nq_example)
+
+
+if __name__ == "__main__":
+  tf.test.main()